@@ -0,0 +1,132 @@
+"""
+Cold-start import profile of Main.py, per LLM backend.
+
+Runs ``python -X importtime -c "import Main"`` in a fresh interpreter for each backend,
+reports the total import time and the slowest modules, and fails when a module the
+selected backend should never load shows up (the TUI in batch mode, google-genai outside
+the gemini backend, the removed openai/langchain dependencies).
+
+    python Benchmarks/import_time.py [--backend stub] [--repeat 5] [--max-ms 400]
+
+Writes the result as JSON to Benchmarks/results/<timestamp>_<commit>_import.json (--out).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+BACKENDS = ("stub", "openai", "gemini")
+
+# Módulos que o import de Main (modo batch) não deve carregar, por backend
+FORBIDDEN = {
+    "stub": ("textual", "google.genai", "httpx", "openai", "langchain_core"),
+    "openai": ("textual", "google.genai", "openai", "langchain_core"),
+    "gemini": ("textual", "openai", "langchain_core"),
+}
+
+
+def git_info() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True, timeout=30).stdout.strip()
+        except Exception:
+            return ""
+    return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "-uno"))}
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """Module -> (self µs, cumulative µs) from the ``-X importtime`` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+
+def profile_once(backend: str, module: str) -> dict[str, tuple[int, int]]:
+    env = dict(os.environ, LLM_BACKEND=backend)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} falhou (LLM_BACKEND={backend}):\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def loaded(modules: dict, name: str) -> bool:
+    return any(m == name or m.startswith(name + ".") for m in modules)
+
+
+def profile(backend: str, module: str, repeat: int, top: int) -> dict:
+    # A primeira execução aquece a cache de bytecode e do sistema de ficheiros
+    profile_once(backend, module)
+    runs = [profile_once(backend, module) for _ in range(repeat)]
+    totals = [run[module][1] / 1000 for run in runs if module in run]
+    last = runs[-1]
+    slowest = sorted(
+        ((name, cumulative) for name, (_, cumulative) in last.items() if name != module and "." not in name),
+        key=lambda item: item[1], reverse=True,
+    )[:top]
+    return {
+        "total_ms": {"median": round(statistics.median(totals), 1), "min": round(min(totals), 1),
+                     "max": round(max(totals), 1)},
+        "modules_loaded": len(last),
+        "top_level_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "forbidden_loaded": [name for name in FORBIDDEN[backend] if loaded(last, name)],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=BACKENDS, action="append", help="por omissão todos")
+    parser.add_argument("--module", default="Main", help="módulo a importar")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="módulos mais lentos a mostrar")
+    parser.add_argument("--max-ms", type=float, help="falha se a mediana do import exceder este valor")
+    parser.add_argument("--out", type=Path, help="ficheiro JSON de saída (por omissão Benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    backends = args.backend or list(BACKENDS)
+    results = {backend: profile(backend, args.module, args.repeat, args.top) for backend in backends}
+    result = {
+        "benchmark": "import_time",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": git_info(),
+        "config": {"module": args.module, "repeat": args.repeat, "python": platform.python_version()},
+        "results": results,
+    }
+    out = args.out
+    if out is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = BASE_DIR / "Benchmarks" / "results" / f"{stamp}_{result['git']['commit'] or 'nogit'}_import.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    print(json.dumps(results, indent=2))
+    print(f"Resultados em {out}")
+    ok = True
+    for backend, row in results.items():
+        if row["forbidden_loaded"]:
+            print(f"[{backend}] módulos que não deviam ser carregados: {', '.join(row['forbidden_loaded'])}")
+            ok = False
+        if args.max_ms is not None and row["total_ms"]["median"] > args.max_ms:
+            print(f"[{backend}] import de {args.module} demorou {row['total_ms']['median']} ms (> {args.max_ms} ms)")
+            ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
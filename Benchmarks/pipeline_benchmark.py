@@ -0,0 +1,252 @@
+"""
+End-to-end benchmark of the Main.py batch pipeline, offline.
+
+The LLM is replaced by the stub backend (Utils/stub_llm.py) replaying the agent outputs
+stored in Results/*.json, with per-role latency injection. The Medical Reports/ corpus is
+scaled up synthetically (--scale 10 -> ten renamed copies of every report) and processed by
+Main.aprocess_all_reports exactly as a real batch would be.
+
+    python Benchmarks/pipeline_benchmark.py --scale 10 [--concurrency 8] [--time-scale 0.05]
+    python Benchmarks/pipeline_benchmark.py --scale 100 --compare Benchmarks/results/<old>.json
+
+Reports reports/sec, p50/p95/p99 end-to-end latency per report, peak RSS and peak thread
+count, and writes them as JSON to Benchmarks/results/<timestamp>_<commit>.json (--out).
+--compare prints the deltas against an earlier run and exits with 1 when throughput or p95
+regress by more than --tolerance.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+# Antes de importar Main: backend offline e sem cache de respostas (senão medimos a cache)
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["LLM_CACHE_DISABLED"] = "1"
+
+# Latências típicas observadas por role (segundos, antes de --time-scale)
+DEFAULT_ROLE_LATENCY = (
+    "Triage_Balancer=lognormal:2,0.3;Specialist=lognormal:8,0.35;MultidisciplinaryTeam=lognormal:10,0.3;"
+    "Judge=lognormal:3,0.3;Judge:batch=lognormal:6,0.3"
+)
+
+
+def build_corpus(source_dir: Path, target_dir: Path, scale: int) -> int:
+    """Write ``scale`` copies of every report, each with its own patient name."""
+    count = 0
+    for path in sorted(source_dir.glob("*.txt")):
+        parts = path.stem.split(" - ")
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        for i in range(scale):
+            if len(parts) >= 2:
+                name = " - ".join([parts[0], f"{parts[1]} {i:04d}", *parts[2:]])
+            else:
+                name = f"{path.stem} {i:04d}"
+            # Acrescenta no fim para o início do texto continuar a bater com o replay
+            (target_dir / f"{name}.txt").write_text(f"{text}\n\nSynthetic copy #{i}\n", encoding="utf-8")
+            count += 1
+    return count
+
+
+class ResourceSampler:
+    """Samples thread counts while the benchmark runs (peak RSS comes from getrusage)."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_threads = threading.active_count()
+        self.peak_os_threads = self._os_threads()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _os_threads() -> int | None:
+        try:
+            for line in Path("/proc/self/status").read_text().splitlines():
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+        except OSError:
+            return None
+        return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            os_threads = self._os_threads()
+            if os_threads is not None:
+                self.peak_os_threads = max(self.peak_os_threads or 0, os_threads)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devolve KiB, macOS bytes
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(p / 100 * len(ordered))))
+    return round(ordered[rank - 1], 3)
+
+
+def git_info() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True, timeout=30).stdout.strip()
+        except Exception:
+            return ""
+    return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "-uno"))}
+
+
+def run(args) -> dict:
+    import Main
+    from Utils.stub_llm import StubResponder, set_stub_responder
+
+    set_stub_responder(StubResponder(
+        latency="lognormal:5,0.4", seed=args.seed, replay_dir=BASE_DIR / "Results",
+        role_latency=args.role_latency, time_scale=args.time_scale, error_rate=args.error_rate,
+    ))
+    Main.streaming = args.stream
+
+    workdir = Path(tempfile.mkdtemp(prefix="mdt-bench-"))
+    try:
+        reports_dir, results_dir = workdir / "reports", workdir / "results"
+        reports_dir.mkdir()
+        results_dir.mkdir()
+        n_reports = build_corpus(BASE_DIR / "Medical Reports", reports_dir, args.scale)
+        Main.REPORTS_DIR, Main.RESULTS_DIR = reports_dir, results_dir
+
+        sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+        started = time.perf_counter()
+        with ResourceSampler() as sampler, sink:
+            stats = asyncio.run(Main.aprocess_all_reports(
+                concurrency=args.concurrency, max_in_flight=args.max_in_flight, force=True,
+            ))
+        wall = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = [st["seconds"] for st in stats if st["ok"]]
+    ok = len(latencies)
+    return {
+        "benchmark": "pipeline",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": git_info(),
+        "config": {
+            "scale": args.scale,
+            "reports": n_reports,
+            "concurrency": args.concurrency or int(os.getenv("BATCH_CONCURRENCY", "1")),
+            "max_in_flight": args.max_in_flight,
+            "time_scale": args.time_scale,
+            "role_latency": args.role_latency,
+            "error_rate": args.error_rate,
+            "stream": args.stream,
+            "seed": args.seed,
+            "python": platform.python_version(),
+        },
+        "results": {
+            "ok": ok,
+            "failed": len(stats) - ok,
+            "wall_seconds": round(wall, 3),
+            "reports_per_second": round(ok / wall, 3) if wall else None,
+            "llm_calls": sum(st["llm_calls"] for st in stats),
+            "cache_hits": sum(st["cache_hits"] for st in stats),
+            "latency_seconds": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "mean": round(sum(latencies) / ok, 3) if ok else None,
+                "max": round(max(latencies), 3) if ok else None,
+            },
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_threads": sampler.peak_threads,
+            "peak_os_threads": sampler.peak_os_threads,
+        },
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """Print the deltas; returns False when throughput or p95 latency regressed."""
+    rows = [
+        ("reports_per_second", current["results"]["reports_per_second"], baseline["results"]["reports_per_second"], True),
+        ("p50", current["results"]["latency_seconds"]["p50"], baseline["results"]["latency_seconds"]["p50"], False),
+        ("p95", current["results"]["latency_seconds"]["p95"], baseline["results"]["latency_seconds"]["p95"], False),
+        ("p99", current["results"]["latency_seconds"]["p99"], baseline["results"]["latency_seconds"]["p99"], False),
+        ("peak_rss_mb", current["results"]["peak_rss_mb"], baseline["results"]["peak_rss_mb"], False),
+        ("peak_threads", current["results"]["peak_threads"], baseline["results"]["peak_threads"], False),
+    ]
+    if current["config"] != baseline["config"]:
+        print("Aviso: configurações diferentes entre as duas execuções.")
+    print(f"Comparação com {baseline['git'].get('commit')} ({baseline['timestamp']}):")
+    ok = True
+    for name, new, old, higher_is_better in rows:
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ""
+        if name in ("reports_per_second", "p95") and worse > tolerance:
+            flag, ok = "  <-- regressão", False
+        print(f"  {name:>18}: {old:>10} -> {new:>10} ({change:+.1%}){flag}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10, help="cópias sintéticas de cada relatório")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-in-flight", type=int)
+    parser.add_argument("--time-scale", type=float, default=0.05, help="multiplica todas as latências injetadas")
+    parser.add_argument("--role-latency", default=DEFAULT_ROLE_LATENCY)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="ficheiro JSON de saída (por omissão Benchmarks/results/)")
+    parser.add_argument("--compare", type=Path, help="JSON de uma execução anterior")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="regressão tolerada no --compare (0.1 = 10%%)")
+    parser.add_argument("--verbose", action="store_true", help="mostra o output do pipeline")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    out = args.out
+    if out is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = BASE_DIR / "Benchmarks" / "results" / f"{stamp}_{result['git']['commit'] or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    print(json.dumps(result["results"], indent=2))
+    print(f"Resultados em {out}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if not compare(result, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
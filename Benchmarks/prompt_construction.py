@@ -0,0 +1,73 @@
+"""
+Micro-benchmark of per-agent construction and prompt rendering.
+
+Compares the precompiled registry (Utils/prompts.py) with the previous approach of parsing
+the role template with LangChain's PromptTemplate on every Agent (measured only when
+langchain_core is installed).
+
+    python Benchmarks/prompt_construction.py [--number 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+from Utils.Agents import Agent, ROLES
+from Utils.backends import StubBackend
+from Utils.prompts import get_prompt, template_text
+
+TEAM_INPUTS = {
+    "cardiologist_report": "C", "psychologist_report": "P",
+    "pulmonologist_report": "L", "general_practitioner_report": "G",
+}
+
+
+def sample_report() -> str:
+    reports = sorted((BASE_DIR / "Medical Reports").glob("*.txt"))
+    return reports[0].read_text(encoding="utf-8", errors="ignore") if reports else "Patient report."
+
+
+def per_call_us(fn, number: int) -> float:
+    return round(min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6, 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="iterações por medição")
+    args = parser.parse_args(argv)
+
+    report = sample_report()
+    backend = StubBackend()
+    results = {}
+    for role in ROLES:
+        kwargs = TEAM_INPUTS if role == "MultidisciplinaryTeam" else {"medical_report": report}
+        extra = TEAM_INPUTS if role == "MultidisciplinaryTeam" else None
+        row = {
+            "agent_init_us": per_call_us(lambda: Agent(report, role, extra, backend=backend), args.number),
+            "agent_init_and_prompt_us": per_call_us(
+                lambda: Agent(report, role, extra, backend=backend).build_prompt(), args.number),
+            "render_us": per_call_us(lambda: get_prompt(role).render(**kwargs), args.number),
+        }
+        try:
+            from langchain_core.prompts import PromptTemplate
+        except ImportError:
+            pass
+        else:
+            # Caminho anterior: interpretar o template a cada Agent e formatar com o PromptTemplate
+            row["langchain_parse_and_format_us"] = per_call_us(
+                lambda: PromptTemplate.from_template(template_text(role)).format(**kwargs), max(1, args.number // 10))
+        results[role] = row
+
+    mean = {key: round(sum(r[key] for r in results.values()) / len(results), 2) for key in next(iter(results.values()))}
+    print(json.dumps({"per_role": results, "mean": mean}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Agreement between the local triage engine and the historical LLM triage.
+
+Replays every result in Results/ (result store and legacy JSON files): the source report is classified locally and the
+selected specialties are compared with what the Triage_Balancer LLM chose for that run.
+
+    python Benchmarks/triage_agreement.py [--min-confidence 0.5] [--save-calibration model.json]
+
+--calibrate fits the keyword scores to the historical LLM weights before comparing
+(in-sample, so treat it as an upper bound); --save-calibration writes the fitted map for
+LOCAL_TRIAGE_MODEL.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from Utils.local_triage import LocalTriage, fit_calibration, parse_weights, selection
+from Utils.result_store import iter_results
+
+
+def load_history(results_dir: Path, reports_dir: Path):
+    """[(report_text, llm_weights)] for every readable historical result (sorted by source file)."""
+    history = []
+    for payload in iter_results(results_dir):
+        try:
+            source = reports_dir / payload["meta"]["source_file"]
+            weights = parse_weights(payload["agents"]["Triage"])
+        except Exception:
+            continue
+        if weights is None or not source.is_file():
+            continue
+        history.append((source.read_text(encoding="utf-8", errors="ignore"), weights))
+    return history
+
+
+def evaluate(engine: LocalTriage, history, min_confidence: float) -> dict:
+    exact = confident = confident_exact = 0
+    per_specialty = {sp: 0 for sp in ("Cardiology", "Psychology", "Pulmonology")}
+    abs_error, n_weights = 0.0, 0
+    started = time.perf_counter()
+    for text, llm_weights in history:
+        result = engine.classify(text)
+        local_weights = {sp: v["weight"] for sp, v in result.triage.items()}
+        local_sel = selection(local_weights, engine.threshold)
+        llm_sel = selection(llm_weights, engine.threshold)
+        same = local_sel == llm_sel
+        exact += same
+        for sp in per_specialty:
+            per_specialty[sp] += (sp in local_sel) == (sp in llm_sel)
+            if llm_weights.get(sp) is not None:
+                abs_error += abs(local_weights[sp] - llm_weights[sp])
+                n_weights += 1
+        if result.confidence >= min_confidence:
+            confident += 1
+            confident_exact += same
+    elapsed = time.perf_counter() - started
+    n = len(history) or 1
+    return {
+        "reports": len(history),
+        "exact_agreement": round(exact / n, 3),
+        "per_specialty_agreement": {sp: round(c / n, 3) for sp, c in per_specialty.items()},
+        "weight_mae": round(abs_error / n_weights, 2) if n_weights else None,
+        "coverage_at_min_confidence": round(confident / n, 3),
+        "agreement_when_confident": round(confident_exact / confident, 3) if confident else None,
+        # Os relatórios que iriam para a triagem LLM: uma confiança útil separa os dois grupos
+        "agreement_when_not_confident": (round((exact - confident_exact) / (len(history) - confident), 3)
+                                         if len(history) > confident else None),
+        "ms_per_report": round(1000 * elapsed / n, 3),
+    }
+
+
+def llm_self_agreement(history, threshold: int):
+    """How often two LLM triage runs of the same report select the same specialties (reference ceiling)."""
+    by_report = {}
+    for text, weights in history:
+        by_report.setdefault(text, []).append(selection(weights, threshold))
+    pairs = same = 0
+    for selections in by_report.values():
+        for a, b in zip(selections, selections[1:]):
+            pairs += 1
+            same += a == b
+    return round(same / pairs, 3) if pairs else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", type=Path, default=BASE_DIR / "Results")
+    parser.add_argument("--reports", type=Path, default=BASE_DIR / "Medical Reports")
+    parser.add_argument("--min-confidence", type=float,
+                        default=float(os.getenv("LOCAL_TRIAGE_MIN_CONFIDENCE", "0.5")))
+    parser.add_argument("--calibrate", action="store_true")
+    parser.add_argument("--save-calibration", type=Path)
+    args = parser.parse_args(argv)
+
+    history = load_history(args.results, args.reports)
+    if not history:
+        print("Sem resultados históricos com triagem legível.")
+        return 1
+
+    engine = LocalTriage()
+    report = {
+        "llm_run_to_run_agreement": llm_self_agreement(history, engine.threshold),
+        "keywords": evaluate(engine, history, args.min_confidence),
+    }
+    if args.calibrate or args.save_calibration:
+        pairs = [(engine.classify(text).raw_scores, weights) for text, weights in history]
+        calibration = fit_calibration(pairs)
+        report["calibrated"] = evaluate(LocalTriage(calibration=calibration), history, args.min_confidence)
+        report["calibration"] = calibration
+        if args.save_calibration:
+            args.save_calibration.write_text(json.dumps(calibration, indent=2), encoding="utf-8")
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
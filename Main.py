@@ -1,11 +1,9 @@
 # -- coding: utf-8 --
 from __future__ import annotations
-import os, json, re
+import os, json, re, time, argparse, asyncio, signal, threading, hashlib
 from pathlib import Path
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from FileChooser import select_file
 
 from Utils.Agents import (
     SeniorGeneralPractitioner,
@@ -18,8 +16,30 @@ from Utils.Agents import (
     SeniorPulmonologist,
     NovicePulmonologist,
     MultidisciplinaryTeam,
-    evaluate_with_gemini,
+    prompt_set_version,
+    model_signature,
 )
+from Utils.rate_limiter import RateLimiter, set_rate_limiter
+from Utils.llm_client import connection_stats
+from Utils.response_cache import get_response_cache
+from Utils.results_manifest import ResultsManifest, file_hash
+from Utils.result_store import get_result_store, legacy_files_enabled, write_legacy_files
+from Utils.eval_queue import EvaluationQueue, judge_batch_enabled
+from Utils.speculation import SpeculationPolicy, MODES as SPECULATION_MODES
+from Utils.local_triage import LocalTriage
+from Utils.progress_writer import ProgressWriter
+from Utils.watch_folder import FolderWatcher
+from Utils.job_service import JobService, serve as serve_http
+from Utils.batch_jobs import BatchRun, PHASES, PROVIDERS as BATCH_PROVIDERS, get_batch_provider, \
+    agent_request, cached_answer, judge_requests
+from Utils.backends import BACKENDS, backend_name
+from Utils.stub_llm import get_stub_responder
+from Utils.context_cache import get_context_caches
+from Utils.report_sections import PreparedReport
+from Utils.handoff import parse_handoff, build_team_inputs
+from Utils.resilience import get_call_policy
+from Utils.model_router import get_model_router, route_summary
+from Utils.tracing import ReportTrace, use_trace, span, metrics as trace_metrics, prometheus_text
 
 # =========================
 # Configuração de paths
@@ -55,22 +75,53 @@ def extract_patient_name_from_filename(path: Path) -> str:
         return sanitize_filename(parts[1])
     return sanitize_filename(path.stem)
 
-def run_single_report(path: Path | None = None):
-    # Se não foi fornecido path, abre o FileChooser para o utilizador selecionar
-    if path is None:
-        selecionado = select_file()
-        if not selecionado:
-            print("Nenhum ficheiro selecionado. A cancelar.")
-            return
-        path = Path(selecionado)
+_manifest = None
 
-    # Lê o relatório
-    medical_report = path.read_text(encoding="utf-8", errors="ignore")
-    patient_name   = extract_patient_name_from_filename(path)
- 
-    # 1) Run triage to decide which specialists to invoke
-    triage_agent = TriageBalancer(medical_report)
-    triage_response = triage_agent.run()
+# Sénior de cada especialidade, usado na execução especulativa (em paralelo com a triagem)
+SENIOR_BY_SPECIALTY = {
+    "Cardiology": ("Senior_Cardiologist", SeniorCardiologist),
+    "Psychology": ("Senior_Psychologist", SeniorPsychologist),
+    "Pulmonology": ("Senior_Pulmonologist", SeniorPulmonologist),
+    "General_Practitioner": ("Senior_General_Practitioner", SeniorGeneralPractitioner),
+}
+speculation = SpeculationPolicy()
+
+# Triagem local (palavras-chave, sem rede): off | auto (LLM só com baixa confiança) | only
+LOCAL_TRIAGE_MODES = ("off", "auto", "only")
+local_triage_mode = os.getenv("LOCAL_TRIAGE", "off").strip().lower()
+local_triage = LocalTriage.from_env()
+
+# Streaming: texto parcial escrito à medida que chega + ttft por role
+streaming = os.getenv("STREAMING", "").strip().lower() in ("1", "true", "yes")
+
+def trace_file_path() -> Path | None:
+    """JSONL com um span por linha (TRACE_FILE; "off" desativa). Por omissão Results/traces.jsonl."""
+    value = os.getenv("TRACE_FILE", "").strip()
+    if value.lower() in ("off", "0", "false", "no"):
+        return None
+    return Path(value) if value else RESULTS_DIR / "traces.jsonl"
+
+def write_prometheus_metrics():
+    """Exporta os contadores de tracing em formato Prometheus (METRICS_FILE, por omissão Results/metrics.prom)."""
+    path = Path(os.getenv("METRICS_FILE") or RESULTS_DIR / "metrics.prom")
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(prometheus_text(), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+def results_manifest() -> ResultsManifest:
+    """Manifesto de RESULTS_DIR (recarregado se RESULTS_DIR mudar)."""
+    global _manifest
+    path = RESULTS_DIR / "manifest.json"
+    if _manifest is None or _manifest.path != path:
+        _manifest = ResultsManifest(path)
+    return _manifest
+
+def select_specialties(triage_response):
+    """
+    Interpreta a resposta do TriageBalancer.
+    Devolve (selected_specialties, run_all_specialists).
+    """
     selected_specialties = {"Cardiology": False, "Psychology": False, "Pulmonology": False}
     run_all_specialists = False
  
@@ -118,97 +169,823 @@ def run_single_report(path: Path | None = None):
             run_all_specialists = True
     else:
         run_all_specialists = True
- 
-    # 2) Instantiate chosen specialist agents
+
+    return selected_specialties, run_all_specialists
+
+def run_local_triage(medical_report: str) -> tuple[str | None, dict]:
+    """(triagem local em JSON ou None se for precisa a do LLM, meta da triagem)."""
+    triage_meta = {"source": "llm"}
+    if local_triage_mode not in ("auto", "only"):
+        return None, triage_meta
+    with span("Triage_Local", "triage", role="Triage_Balancer", model="local"):
+        local = local_triage.classify(medical_report)
+    triage_meta["local_confidence"] = local.confidence
+    min_confidence = float(os.getenv("LOCAL_TRIAGE_MIN_CONFIDENCE", "0.5"))
+    if local_triage_mode == "only" or local.confidence >= min_confidence:
+        triage_meta["source"] = "local"
+        return local.to_json(), triage_meta
+    return None, triage_meta
+
+def build_specialists(report: PreparedReport, selected_specialties: dict, run_all_specialists: bool) -> dict:
     agents = {}
 
+    def add(name, agent_cls):
+        # Cada especialista recebe só as secções do relatório relevantes para ele (se condensado)
+        agents[name] = agent_cls(report.for_role(name))
 
     #* If all specialists are to be run, instantiate just senior agents due to resource constraints
     if run_all_specialists:
-        agents["Senior_Cardiologist"] = SeniorCardiologist(medical_report)
-        agents["Senior_Psychologist"] = SeniorPsychologist(medical_report)
-        agents["Senior_Pulmonologist"] = SeniorPulmonologist(medical_report)
-        agents["Senior_General_Practitioner"] = SeniorGeneralPractitioner(medical_report)
+        add("Senior_Cardiologist", SeniorCardiologist)
+        add("Senior_Psychologist", SeniorPsychologist)
+        add("Senior_Pulmonologist", SeniorPulmonologist)
+        add("Senior_General_Practitioner", SeniorGeneralPractitioner)
     else:
         if selected_specialties.get("Cardiology"):
-            agents["Senior_Cardiologist"] = SeniorCardiologist(medical_report)
-            agents["Novice_Cardiologist"] = NoviceCardiologist(medical_report)
+            add("Senior_Cardiologist", SeniorCardiologist)
+            add("Novice_Cardiologist", NoviceCardiologist)
         if selected_specialties.get("Psychology"):
-            agents["Senior_Psychologist"] = SeniorPsychologist(medical_report)
-            agents["Novice_Psychologist"] = NovicePsychologist(medical_report)
+            add("Senior_Psychologist", SeniorPsychologist)
+            add("Novice_Psychologist", NovicePsychologist)
         if selected_specialties.get("Pulmonology"):
-            agents["Senior_Pulmonologist"] = SeniorPulmonologist(medical_report)
-            agents["Novice_Pulmonologist"] = NovicePulmonologist(medical_report)
+            add("Senior_Pulmonologist", SeniorPulmonologist)
+            add("Novice_Pulmonologist", NovicePulmonologist)
         if selected_specialties.get("General_Practitioner"):
-            agents["Senior_General_Practitioner"] = SeniorGeneralPractitioner(medical_report)
-            agents["Novice_General_Practitioner"] = NoviceGeneralPractitioner(medical_report)
- 
-    # Save triage response in the responses dict for traceability
-    responses = {"Triage": triage_response}
-    metrics = {}
- 
-    # Run specialist agents in parallel and collect outputs
-    def get_response(agent_name, agent):
-        return agent_name, agent.run()
- 
-    with ThreadPoolExecutor(max_workers=max(1, len(agents))) as executor:
-        futures = {executor.submit(get_response, name, ag): name for name, ag in agents.items()}
-        for fut in as_completed(futures):
-            name, resp = fut.result()
-            responses[name] = resp
-
-            # Avaliação automática da resposta (exceto triagem)
-            if name != "Triage" and resp:
-                metrics[name] = evaluate_with_gemini(medical_report, name, resp)
-            
-        # Agente de equipa multidisciplinar (igual ao teu fluxo)
-        team_agent = MultidisciplinaryTeam(
-            cardiologist_report  = responses.get("Senior_Cardiologist", "") + responses.get("Novice_Cardiologist", ""),
-            psychologist_report  = responses.get("Senior_Psychologist", "") + responses.get("Novice_Psychologist", ""),
-            pulmonologist_report = responses.get("Senior_Pulmonologist", "") + responses.get("Novice_Pulmonologist", ""),
-            general_practitioner_report = responses.get("Senior_General_Practitioner", "") + responses.get("Novice_General_Practitioner", ""),
-        )
-        final_diagnosis3 = team_agent.run()
- 
-        # Guarda TXT e JSON com timestamp + nome do paciente
-        ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-        base_name = f"{patient_name}_diagnosis{ts}"
-        txt_output = RESULTS_DIR / f"{base_name}.txt"
-        json_output = RESULTS_DIR / f"{base_name}.json"
-    
-        txt_output.write_text(
-            "### Final Diagnosis\n\n" + str(final_diagnosis3),
-            encoding="utf-8"
-        )
-    
-        payload = {
-            "patient_name": patient_name,
-            "timestamp": ts,
-            "agents": responses,
-            "final_diagnosis": final_diagnosis3,
-            "metrics": metrics,
-            "meta": {
-                "model": os.getenv("OPENROUTER_MODEL", ""),
-                "source_file": path.name,
-            },
-        }
-        json_output.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-    
-        print(f"✔ {path.name} → guardado:\n   - {txt_output.name}\n   - {json_output.name}")
-
-def process_all_reports():
-    files = sorted(p for p in REPORTS_DIR.glob("*.txt") if p.is_file())
+            add("Senior_General_Practitioner", SeniorGeneralPractitioner)
+            add("Novice_General_Practitioner", NoviceGeneralPractitioner)
+    return agents
+
+def build_team_agent(responses: dict, findings: dict | None = None) -> tuple[MultidisciplinaryTeam, dict]:
+    # Agente de equipa multidisciplinar: recebe os achados compactos fundidos por especialidade
+    # (ou as respostas completas, com MDT_HANDOFF=full); devolve também as estatísticas do handoff
+    inputs, handoff_stats = build_team_inputs(responses, findings)
+    return MultidisciplinaryTeam(**inputs), handoff_stats
+
+def update_result(payload: dict, row_id: int | None = None):
+    # As métricas do juiz chegam depois: atualiza a linha da execução (e o JSON antigo, se ativo).
+    # Pelo id da linha: duas execuções do mesmo paciente no mesmo segundo partilham o run_id
+    get_result_store(RESULTS_DIR).update(payload, row_id)
+    if legacy_files_enabled():
+        write_legacy_files(payload, RESULTS_DIR)
+
+def save_results(path: Path, patient_name: str, responses: dict, final_diagnosis, metrics: dict,
+                 source_hash: str | None = None, metrics_pending: bool = False,
+                 meta_extra: dict | None = None, ts: str | None = None,
+                 trace: ReportTrace | None = None, findings: dict | None = None) -> tuple[dict, int]:
+    # Guarda a execução na base de resultados (timestamp + nome do paciente);
+    # devolve (payload, id da linha) para as métricas do juiz atualizarem essa mesma linha
+    ts = ts or datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    payload = {
+        "patient_name": patient_name,
+        "timestamp": ts,
+        "agents": responses,
+        "final_diagnosis": final_diagnosis,
+        "findings": findings or {},
+        "metrics": metrics,
+        "meta": {
+            "backend": backend_name(),
+            "model": get_model_router().primary("MultidisciplinaryTeam").model,
+            "models": get_model_router().assignments(),
+            "judge_model": get_model_router().primary("Judge").model,
+            "source_file": path.name,
+            "source_hash": source_hash,
+            "prompt_version": prompt_set_version(),
+            "metrics_status": "pending" if metrics_pending else "complete",
+            **(meta_extra or {}),
+        },
+    }
+    if trace is not None:
+        payload["trace"] = trace.to_dict()
+    store = get_result_store(RESULTS_DIR)
+    row_id = store.add(payload, model_signature())
+    print(f"✔ {path.name} → guardado em {store.path.name}: {patient_name}_diagnosis{ts}")
+
+    # Pares TXT/JSON antigos (LEGACY_RESULT_FILES=1), também registados no manifesto
+    if legacy_files_enabled():
+        txt_output, json_output = write_legacy_files(payload, RESULTS_DIR)
+        if source_hash:
+            results_manifest().record(
+                path.name, source_hash, payload["meta"]["prompt_version"], model_signature(),
+                json_output.name, txt_output.name, ts,
+            )
+        print(f"   - {txt_output.name}\n   - {json_output.name}")
+    return payload, row_id
+
+async def merge_metrics(payload: dict, pending: list, trace: ReportTrace | None = None,
+                        row_id: int | None = None):
+    """Espera pelas avaliações em fila e junta-as ao JSON do resultado (com os spans do juiz)."""
+    for future in pending:
+        payload["metrics"].update(await future)
+    payload["meta"]["metrics_status"] = "complete"
+    if trace is not None:
+        # As chamadas do juiz também podem ter sido repetidas
+        payload["meta"]["resilience"].update(trace.event_counts())
+        payload["meta"]["routing"] = route_summary(trace.spans)
+        payload["trace"] = trace.to_dict()
+    with span("write_metrics", "write"):
+        update_result(payload, row_id)
+
+async def finish_report(payload: dict, pending: list, trace: ReportTrace, row_id: int | None = None):
+    """Junta as avaliações (merge_metrics) e apaga as caches de contexto que só este relatório usava."""
+    try:
+        await merge_metrics(payload, pending, trace, row_id)
+    finally:
+        await get_context_caches().arelease(trace)
+
+async def arun_single_report(path: Path, eval_queue: EvaluationQueue | None = None, listener=None) -> dict:
+    """
+    Pipeline assíncrono triagem → especialistas → equipa multidisciplinar.
+    Todas as chamadas LLM usam client.aio, por isso não há uma thread por chamada.
+    As avaliações do juiz vão para `eval_queue` e não atrasam a equipa multidisciplinar;
+    sem fila partilhada, é criada uma local e esvaziada antes de devolver.
+    Em modo streaming o texto de cada agente vai sendo escrito num .stream.jsonl.
+    `listener` (opcional, com a interface chunk/done do ProgressWriter) recebe os mesmos
+    eventos, ex.: um job do serviço HTTP; os chunks só existem em modo streaming.
+    """
+    own_queue = eval_queue is None
+    if own_queue:
+        eval_queue = EvaluationQueue()
+
+    # Lê o relatório
+    raw_report     = path.read_bytes()
+    medical_report = raw_report.decode("utf-8", errors="ignore")
+    # Secções e orçamento de tokens por especialidade (relatórios longos)
+    report         = PreparedReport(medical_report)
+    patient_name   = extract_patient_name_from_filename(path)
+    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    trace = ReportTrace(f"{patient_name}_diagnosis{ts}", trace_file_path())
+    with use_trace(trace):
+        progress = None
+        if streaming:
+            progress = ProgressWriter(RESULTS_DIR / f"{patient_name}_diagnosis{ts}.stream.jsonl")
+        sinks = [sink for sink in (progress, listener) if sink is not None]
+        timings = {}
+
+        def on_chunk(role, text):
+            for sink in sinks:
+                sink.chunk(role, text)
+
+        async def run_agent(agent):
+            # Corre o agente (em streaming se ativo) e guarda ttft/tempo total por role
+            resp = await agent.arun(on_chunk=on_chunk if streaming else None)
+            timings[agent.role] = agent.timing
+            for sink in sinks:
+                sink.done(agent.role, agent.timing)
+            return resp
+
+        # Tarefas do relatório: se algum passo falhar, as restantes são canceladas antes de propagar o erro
+        speculative = {}
+        specialist_tasks = []
+        pending_metrics = []
+        try:
+            # 0) Modo especulativo: arranca os seniores em paralelo com a triagem
+            for specialty in speculation.choose():
+                name, agent_cls = SENIOR_BY_SPECIALTY[specialty]
+                speculative[name] = asyncio.create_task(run_agent(agent_cls(report.for_role(name))))
+
+            # 1) Run triage to decide which specialists to invoke.
+            #    A triagem local evita a chamada ao LLM quando está confiante.
+            triage_response, triage_meta = run_local_triage(medical_report)
+            if triage_response is None:
+                triage_response = await run_agent(TriageBalancer(report.for_role("Triage_Balancer")))
+            selected_specialties, run_all_specialists = select_specialties(triage_response)
+
+            # 2) Instantiate chosen specialist agents
+            agents = build_specialists(report, selected_specialties, run_all_specialists)
+            speculation.observe([sp for sp, (name, _) in SENIOR_BY_SPECIALTY.items() if name in agents])
+
+            # Especulações de especialidades não selecionadas são canceladas (ou descartadas se já acabaram)
+            wasted = [name for name in speculative if name not in agents]
+            discarded = sum(1 for name in wasted if speculative[name].done())
+            dropped = [speculative.pop(name) for name in wasted]
+            for task in dropped:
+                task.cancel()
+            await asyncio.gather(*dropped, return_exceptions=True)
+            for name in wasted:
+                timings.pop(name, None)
+            speculation.record(len(speculative) + len(wasted), len(speculative), len(wasted) - discarded, discarded)
+            meta_extra = {"triage": triage_meta}
+            if speculation.mode != "off":
+                meta_extra["speculation"] = {"mode": speculation.mode, "used": sorted(speculative), "wasted": sorted(wasted)}
+
+            # Save triage response in the responses dict for traceability
+            responses = {"Triage": triage_response}
+            findings = {}
+
+            # Run specialist agents concurrently. Without the batched judge each answer is queued
+            # for evaluation as soon as it arrives; with it, all answers go in one job below.
+            async def run_specialist(agent_name, agent):
+                if agent_name in speculative:
+                    resp = await speculative[agent_name]
+                else:
+                    resp = await run_agent(agent)
+                # Handoff estruturado: a avaliação completa fica no registo, os achados vão para a equipa
+                resp, found = parse_handoff(resp)
+                responses[agent_name] = resp
+                if found:
+                    findings[agent_name] = found
+                # Avaliação automática da resposta (exceto triagem), fora do caminho crítico
+                if resp and not eval_queue.batch:
+                    pending_metrics.append(eval_queue.submit(report.for_role("Judge"), {agent_name: resp}))
+
+            specialist_tasks = [asyncio.create_task(run_specialist(name, ag)) for name, ag in agents.items()]
+            await asyncio.gather(*specialist_tasks)
+
+            if eval_queue.batch:
+                outputs = {name: resp for name, resp in responses.items() if name != "Triage" and resp}
+                if outputs:
+                    pending_metrics.append(eval_queue.submit(report.for_role("Judge"), outputs))
+
+            # 3) Síntese da equipa multidisciplinar
+            team_agent, meta_extra["handoff"] = build_team_agent(responses, findings)
+            final_diagnosis = await run_agent(team_agent)
+        except BaseException:
+            # Nada do relatório continua a correr: nem especialistas irmãos, nem especulações, nem o juiz
+            tasks = [*speculative.values(), *specialist_tasks]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for future in pending_metrics:
+                future.cancel()
+            await get_context_caches().arelease(trace)
+            if progress:
+                progress.close(success=False)
+            raise
+
+        meta_extra["timings"] = timings
+        called = [name for name in responses if name != "Triage"] + ["Judge"] * len(pending_metrics)
+        if triage_meta["source"] == "llm":
+            called.append("Triage_Balancer")
+        meta_extra["preprocessing"] = report.summary(called)
+        meta_extra["resilience"] = {**trace.event_counts(), "policy": get_call_policy().settings()}
+        meta_extra["routing"] = route_summary(trace.spans)
+        with span("write_results", "write"):
+            payload, row_id = save_results(path, patient_name, responses, final_diagnosis, {}, file_hash(raw_report),
+                                           metrics_pending=bool(pending_metrics), meta_extra=meta_extra, ts=ts,
+                                           trace=trace, findings=findings)
+        if progress:
+            progress.close(success=True)
+        if pending_metrics:
+            eval_queue.track(finish_report(payload, pending_metrics, trace, row_id))
+        else:
+            await get_context_caches().arelease(trace)
+        if own_queue:
+            await eval_queue.close()
+        return payload
+
+def run_single_report(path: Path | None = None):
+    # Se não foi fornecido path, abre o FileChooser para o utilizador selecionar
+    if path is None:
+        # Importado só aqui: o seletor usa a TUI (textual), desnecessária em modo batch
+        from FileChooser import select_file
+        selecionado = select_file()
+        if not selecionado:
+            print("Nenhum ficheiro selecionado. A cancelar.")
+            return
+        path = Path(selecionado)
+
+    return asyncio.run(arun_single_report(path))
+
+def _env_int(name: str, default: int | None = None) -> int | None:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Valor inválido para {name}: {value!r} (ignorado)")
+        return default
+
+def pipeline_calls(payload: dict) -> tuple[int, int]:
+    """(chamadas ao backend, respostas da cache local) da triagem, especialistas e equipa, pelos spans do trace.
+
+    O juiz fica de fora: corre na fila de avaliação depois de o relatório terminar.
+    """
+    spans = [s for s in (payload.get("trace") or {}).get("spans", [])
+             if s["kind"] not in ("write", "judge") and s["model"] != "local"]
+    cached = sum(1 for s in spans if s["cached"])
+    return len(spans) - cached, cached
+
+async def _atimed_report(path: Path, semaphore: asyncio.Semaphore, eval_queue: EvaluationQueue) -> dict:
+    """Corre um relatório e devolve as métricas de throughput desse relatório."""
+    async with semaphore:
+        started = time.perf_counter()
+        stats = {"source_file": path.name, "ok": False, "seconds": 0.0, "llm_calls": 0, "cache_hits": 0}
+        try:
+            payload = await arun_single_report(path, eval_queue)
+            stats["ok"] = True
+            if payload:
+                local = payload["meta"].get("triage", {}).get("source") == "local"
+                stats["triage"] = "local" if local else "llm"
+                stats["llm_calls"], stats["cache_hits"] = pipeline_calls(payload)
+                stats["timings"] = payload["meta"].get("timings", {})
+                stats["preprocessing"] = payload["meta"].get("preprocessing", {})
+                stats["handoff"] = payload["meta"].get("handoff", {})
+        except Exception as e:
+            stats["error"] = str(e)
+            print(f"✖ Erro em {path.name}: {e}")
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stats
+
+def print_batch_summary(report_stats: list[dict], wall_seconds: float, limiter: RateLimiter,
+                        eval_queue: EvaluationQueue | None = None):
+    print("\n==== Resumo do lote ====")
+    for st in sorted(report_stats, key=lambda x: x["source_file"]):
+        mark = "✔" if st["ok"] else "✖"
+        print(f" {mark} {st['source_file']}: {st['seconds']:.1f}s, {st['llm_calls']} chamadas LLM, "
+              f"{st['cache_hits']} da cache")
+
+    ok = [st for st in report_stats if st["ok"]]
+    # Chamadas reais ao backend (juiz incluído); as respostas da cache local não contam
+    tok = trace_metrics.totals()
+    per_report = sorted(st["seconds"] for st in ok)
+    minutes = wall_seconds / 60 if wall_seconds else 0
+    print(f" Relatórios: {len(ok)}/{len(report_stats)} ok em {wall_seconds:.1f}s")
+    print(f" Chamadas LLM: {tok['llm_calls']} ao backend, {tok['cache_hits']} servidas pela cache de respostas")
+    if minutes:
+        print(f" Throughput: {len(ok) / minutes:.2f} relatórios/min, {tok['llm_calls'] / minutes:.1f} chamadas LLM/min")
+    if per_report:
+        print(f" Tempo por relatório: média {sum(per_report) / len(per_report):.1f}s, máx {per_report[-1]:.1f}s")
+    lim = limiter.snapshot()
+    print(f" Limitador: {lim['requests']} pedidos, ~{lim['estimated_tokens']} tokens, "
+          f"{lim['wait_seconds']:.1f}s em espera, pico de {lim['peak_in_flight']} em voo")
+    conn = connection_stats()
+    print(f" Ligações HTTP: {conn['clients_created']} clients, {conn['requests']} pedidos, "
+          f"{conn['connections_opened']} ligações novas, {conn['connections_reused']} reutilizadas "
+          f"({conn['reuse_ratio']:.0%})")
+    if eval_queue is not None:
+        eq = eval_queue.stats()
+        print(f" Fila de avaliação: {eq['completed']}/{eq['submitted']} avaliações, "
+              f"atraso médio {eq['avg_lag_seconds']:.1f}s, máx {eq['max_lag_seconds']:.1f}s"
+              + (f", {eq['followup_errors']} falhas ao guardar as métricas" if eq["followup_errors"] else "")
+              + (f", {eq['dropped']} descartadas (relatório falhou)" if eq["dropped"] else ""))
+    ttfts = sorted(t["ttft_seconds"] for st in ok for t in st.get("timings", {}).values()
+                   if t and not t.get("cached") and t.get("ttft_seconds") is not None)
+    if streaming and ttfts:
+        print(f" Primeiro token (TTFT): mediana {ttfts[len(ttfts) // 2]:.2f}s, "
+              f"máx {ttfts[-1]:.2f}s em {len(ttfts)} chamadas")
+    local = sum(1 for st in ok if st.get("triage") == "local")
+    if local_triage_mode != "off":
+        print(f" Triagem local: {local}/{len(ok)} relatórios sem chamada LLM de triagem")
+    if speculation.mode != "off":
+        sp = speculation.stats()
+        print(f" Especulação ({sp['mode']}): {sp['launched']} lançadas, {sp['used']} usadas, "
+              f"{sp['wasted']} desperdiçadas ({sp['cancelled']} canceladas, {sp['discarded']} descartadas)")
+    if backend_name() == "stub":
+        stub = get_stub_responder().stats()
+        print(f" Backend stub: {stub['calls']} chamadas, {stub['errors']} erros simulados, latência {stub['latency']}")
+    condensed = [st["preprocessing"] for st in ok if st.get("preprocessing", {}).get("extracted")]
+    if condensed:
+        print(f" Pré-processamento: {len(condensed)}/{len(ok)} relatórios condensados por especialidade "
+              f"(orçamento {condensed[0]['budget_tokens']} tokens), "
+              f"~{sum(p['trimmed_tokens'] for p in condensed)} tokens de relatório não enviados")
+    handoffs = [st["handoff"] for st in ok if st.get("handoff", {}).get("mode") == "structured"]
+    if handoffs:
+        full = sum(h["full_chars"] for h in handoffs)
+        sent = sum(h["mdt_input_chars"] for h in handoffs)
+        fallback = sum(len(h["fallback_agents"]) for h in handoffs)
+        print(f" Handoff para a equipa: {full} → {sent} caracteres dos especialistas "
+              f"({full / sent if sent else 0:.1f}× menos), {fallback} respostas sem achados estruturados")
+    if tok["prompt_tokens"] or tok["output_tokens"]:
+        cached_share = tok["cached_tokens"] / tok["prompt_tokens"] if tok["prompt_tokens"] else 0.0
+        print(f" Tokens: {tok['prompt_tokens']} prompt, {tok['output_tokens']} output "
+              f"({tok['cached_tokens']} em cache do modelo, {cached_share:.0%} do prompt), "
+              f"custo estimado ${tok['cost_usd']:.4f}")
+    if tok["retries"] or tok["timeouts"] or tok["hedges"]:
+        print(f" Resiliência: {tok['retries']} repetições, {tok['timeouts']} timeouts, "
+              f"{tok['hedges']} pedidos duplicados ({tok['hedge_wins']} responderam primeiro)")
+    routing = get_model_router().health()
+    degraded = {model: h for model, h in routing["models"].items() if h["trips"] or h["state"] != "closed"}
+    if routing["failovers"] or degraded:
+        details = ", ".join(f"{model} {h['state']} ({h['trips']} aberturas, {h['error_rate']:.0%} erros)"
+                            for model, h in degraded.items())
+        print(f" Router de modelos: {routing['failovers']} failovers para {routing['fallback'] or '-'}"
+              + (f"; {details}" if details else ""))
+    ctx = get_context_caches().stats()
+    if ctx["created"] or ctx["failed"]:
+        print(f" Cache de contexto Gemini: {ctx['created']} criadas, {ctx['reused']} reutilizações, "
+              f"{ctx['deleted']} apagadas no fim do relatório, {ctx['failed']} falhas, {ctx['inline']} contextos inline")
+    cache = get_response_cache()
+    if cache is not None:
+        cst = cache.stats()
+        print(f" Cache de respostas: {cst['hits']} hits, {cst['misses']} misses ({cst['hit_ratio']:.0%}), "
+              f"{cst['entries']} entradas, {cst['evictions']} removidas"
+              + (" [bypass]" if cst["bypass"] else ""))
+
+def split_pending(files: list[Path]) -> tuple[list[Path], list[Path]]:
+    """Separa os relatórios novos/alterados dos que já têm um resultado atual (base de resultados ou manifesto)."""
+    store, manifest = get_result_store(RESULTS_DIR), results_manifest()
+    version, model = prompt_set_version(), model_signature()
+    pending, skipped = [], []
+    for p in files:
+        digest = file_hash(p)
+        if store.is_current(p.name, digest, version, model) or manifest.is_current(p.name, digest, version, model):
+            skipped.append(p)
+        else:
+            pending.append(p)
+    return pending, skipped
+
+async def aprocess_all_reports(concurrency: int | None = None, max_in_flight: int | None = None,
+                               rpm: int | None = None, tpm: int | None = None, force: bool = False,
+                               files: list[Path] | None = None):
+    """
+    Processa todos os relatórios de REPORTS_DIR (ou só `files`) num único event loop.
+    `concurrency` relatórios correm ao mesmo tempo; todas as chamadas LLM partilham
+    um limite global de chamadas em voo (`max_in_flight`) e um token bucket de
+    pedidos/min (`rpm`) e tokens/min (`tpm`) para ficar dentro da quota do Gemini.
+    Os valores por omissão vêm de BATCH_CONCURRENCY, LLM_MAX_IN_FLIGHT, GEMINI_RPM e GEMINI_TPM.
+    Só são processados relatórios novos ou alterados (ou com outros prompts/modelo),
+    a não ser que `force` seja True.
+    """
+    if files is None:
+        files = sorted(p for p in REPORTS_DIR.glob("*.txt") if p.is_file())
     if not files:
         print(f" Nenhum .txt encontrado em: {REPORTS_DIR}")
-        return
-    print(f" Encontrados {len(files)} relatórios. A processar...\n")
-    for p in files:
+        return []
+
+    if not force:
+        files, skipped = split_pending(files)
+        if skipped:
+            print(f" {len(skipped)} relatórios sem alterações (ignorados):")
+            for p in skipped:
+                print(f"   - {p.name}")
+        if not files:
+            print(" Nada para processar.")
+            return []
+
+    concurrency   = max(1, concurrency or _env_int("BATCH_CONCURRENCY", 1))
+    max_in_flight = max_in_flight or _env_int("LLM_MAX_IN_FLIGHT")
+    rpm           = rpm or _env_int("GEMINI_RPM")
+    tpm           = tpm or _env_int("GEMINI_TPM")
+
+    print(f" Encontrados {len(files)} relatórios. A processar ({concurrency} em paralelo)...\n")
+    limiter = RateLimiter(max_in_flight=max_in_flight, rpm=rpm, tpm=tpm)
+    previous = set_rate_limiter(limiter)
+    semaphore = asyncio.Semaphore(concurrency)
+    eval_queue = EvaluationQueue()
+    started = time.perf_counter()
+    try:
+        report_stats = await asyncio.gather(*(_atimed_report(p, semaphore, eval_queue) for p in files))
+        # As avaliações em atraso são juntadas aos JSON antes de terminar
+        print(f" A aguardar {eval_queue.stats()['depth']} avaliações pendentes...")
+        await eval_queue.close()
+    finally:
+        set_rate_limiter(previous)
+
+    print_batch_summary(report_stats, time.perf_counter() - started, limiter, eval_queue)
+    print(f" Métricas Prometheus em {write_prometheus_metrics().name}")
+    return report_stats
+
+async def awatch_reports(concurrency: int | None = None, max_in_flight: int | None = None,
+                         rpm: int | None = None, tpm: int | None = None, force: bool = False):
+    """
+    Modo daemon: observa REPORTS_DIR e processa cada relatório novo ou alterado assim que
+    acaba de ser escrito (Utils/watch_folder.py: inotify ou polling, com debounce).
+    Os ficheiros entram numa fila limitada (WATCH_QUEUE_SIZE, por omissão 2× a concorrência):
+    quando está cheia, a observação espera (backpressure) em vez de acumular trabalho.
+    SIGTERM/SIGINT param a observação e esperam pelos relatórios em curso e pelas avaliações
+    do juiz; os que ainda estavam na fila ficam para o próximo arranque. Um segundo sinal
+    cancela tudo de imediato.
+    """
+    concurrency   = max(1, concurrency or _env_int("BATCH_CONCURRENCY", 1))
+    max_in_flight = max_in_flight or _env_int("LLM_MAX_IN_FLIGHT")
+    rpm           = rpm or _env_int("GEMINI_RPM")
+    tpm           = tpm or _env_int("GEMINI_TPM")
+    queue_size    = max(1, _env_int("WATCH_QUEUE_SIZE", 2 * concurrency))
+
+    watcher = FolderWatcher.from_env(REPORTS_DIR)
+    queue = asyncio.Queue(maxsize=queue_size)
+    queued = set()
+    report_stats = []
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    limiter = RateLimiter(max_in_flight=max_in_flight, rpm=rpm, tpm=tpm)
+    previous = set_rate_limiter(limiter)
+    semaphore = asyncio.Semaphore(concurrency)
+    eval_queue = EvaluationQueue()
+
+    busy = set()
+
+    async def worker():
+        while not stopping.is_set():
+            path = await queue.get()
+            busy.add(asyncio.current_task())
+            try:
+                report_stats.append(await _atimed_report(path, semaphore, eval_queue))
+                write_prometheus_metrics()
+            finally:
+                busy.discard(asyncio.current_task())
+                queued.discard(path)
+
+    async def feed():
+        async for path in watcher.ready():
+            if path in queued:
+                continue
+            if not force and not split_pending([path])[0]:
+                print(f" {path.name} sem alterações (ignorado)")
+                continue
+            queued.add(path)
+            if queue.full():
+                print(f" Fila cheia ({queue_size}): a aguardar antes de aceitar {path.name}")
+            await queue.put(path)
+            print(f" Na fila: {path.name} ({queue.qsize()}/{queue_size})")
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    feeder = asyncio.create_task(feed())
+
+    def request_stop():
+        if stopping.is_set():
+            print(" Segundo sinal: a cancelar os relatórios em curso")
+            for task in workers:
+                task.cancel()
+            return
+        print(" Sinal recebido: a terminar os relatórios em curso...")
+        stopping.set()
+        watcher.close()
+
+    handled = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
         try:
-            run_single_report(p)
-        except Exception as e:
-            print(f"✖ Erro em {p.name}: {e}")
+            loop.add_signal_handler(sig, request_stop)
+            handled.append(sig)
+        except (NotImplementedError, RuntimeError):
+            # Windows / fora da thread principal: o KeyboardInterrupt continua a funcionar
+            pass
+
+    print(f" A observar {REPORTS_DIR} ({watcher.requested_mode}, {concurrency} em paralelo, fila de {queue_size}). "
+          "SIGTERM/Ctrl+C para terminar.")
+    started = time.perf_counter()
+    try:
+        await stopping.wait()
+        feeder.cancel()
+        await asyncio.gather(feeder, return_exceptions=True)
+        # Relatórios ainda não iniciados ficam para o próximo arranque (continuam "pendentes")
+        left = []
+        while not queue.empty():
+            left.append(queue.get_nowait())
+        if left:
+            print(f" {len(left)} relatórios na fila não iniciados: " + ", ".join(p.name for p in left))
+        # Os workers parados à espera da fila saem já; os outros acabam o relatório em curso
+        for task in workers:
+            if task not in busy:
+                task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        print(f" A aguardar {eval_queue.stats()['depth']} avaliações pendentes...")
+        await eval_queue.close()
+    finally:
+        for sig in handled:
+            loop.remove_signal_handler(sig)
+        for task in workers + [feeder]:
+            task.cancel()
+        set_rate_limiter(previous)
+
+    print_batch_summary(report_stats, time.perf_counter() - started, limiter, eval_queue)
+    print(f" Métricas Prometheus em {write_prometheus_metrics().name}")
+    return report_stats
+
+async def aserve_reports(host: str | None = None, port: int | None = None, workers: int | None = None,
+                         max_in_flight: int | None = None, rpm: int | None = None, tpm: int | None = None):
+    """
+    Modo serviço HTTP (Utils/job_service.py): POST /jobs devolve um job id e o relatório
+    entra numa fila limitada (SERVICE_QUEUE_SIZE, por omissão 4× os workers; cheia → 429);
+    `workers` relatórios correm em paralelo neste processo, com o mesmo limitador, cache e
+    fila do juiz do modo batch. O resultado é consultado em GET /jobs/<id> (long-poll com
+    ?wait=) ou em stream SSE em /jobs/<id>/events; /health e /metrics para monitorização.
+    SIGTERM/SIGINT: deixa de aceitar jobs (503), acaba os que estão a correr e as avaliações.
+    """
+    host          = host or os.getenv("SERVICE_HOST", "127.0.0.1")
+    port          = port or _env_int("SERVICE_PORT", 8080)
+    workers       = max(1, workers or _env_int("SERVICE_WORKERS") or _env_int("BATCH_CONCURRENCY", 2))
+    queue_size    = max(1, _env_int("SERVICE_QUEUE_SIZE", 4 * workers))
+    max_in_flight = max_in_flight or _env_int("LLM_MAX_IN_FLIGHT")
+    rpm           = rpm or _env_int("GEMINI_RPM")
+    tpm           = tpm or _env_int("GEMINI_TPM")
+
+    limiter = RateLimiter(max_in_flight=max_in_flight, rpm=rpm, tpm=tpm)
+    previous = set_rate_limiter(limiter)
+    eval_queue = EvaluationQueue()
+    service = JobService(
+        lambda path, job: arun_single_report(path, eval_queue, listener=job),
+        inbox=Path(os.getenv("SERVICE_INBOX") or RESULTS_DIR / "inbox"),
+        workers=workers, queue_size=queue_size, retention=_env_int("SERVICE_JOB_RETENTION", 1000),
+    )
+    service.start()
+    server = serve_http(service, host, port, metrics_text=prometheus_text)
+    thread = threading.Thread(target=server.serve_forever, name="http-service", daemon=True)
+    thread.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    handled = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+            handled.append(sig)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    print(f" Serviço em http://{host}:{port} ({workers} workers, fila de {queue_size}). "
+          "SIGTERM/Ctrl+C para terminar.")
+    try:
+        await stopping.wait()
+        print(" Sinal recebido: a terminar os jobs em curso (novos pedidos recebem 503)...")
+        await service.drain()
+        print(f" A aguardar {eval_queue.stats()['depth']} avaliações pendentes...")
+        await eval_queue.close()
+    finally:
+        for sig in handled:
+            loop.remove_signal_handler(sig)
+        server.shutdown()
+        server.server_close()
+        set_rate_limiter(previous)
+
+    st = service.stats()
+    print(f" Jobs: {st['completed']} concluídos, {st['failed']} falhados, {st['rejected']} rejeitados (429)")
+    print(f" Métricas Prometheus em {write_prometheus_metrics().name}")
+    return st
+
+def batch_requests(phase: str, path: Path) -> list[dict]:
+    """
+    Pedidos da fase `phase` do modo batch para um relatório, percorrendo o pipeline com as
+    respostas já na cache (das fases anteriores). Um relatório cuja fase anterior falhou não
+    gera pedidos: fica para as chamadas ao vivo da montagem final.
+    """
+    medical_report = path.read_bytes().decode("utf-8", errors="ignore")
+    report = PreparedReport(medical_report)
+    triage_response, _ = run_local_triage(medical_report)
+    if triage_response is None:
+        triage = TriageBalancer(report.for_role("Triage_Balancer"))
+        if phase == "triage":
+            return [r for r in [agent_request(triage)] if r]
+        triage_response = cached_answer(triage)
+        if triage_response is None:
+            return []
+    elif phase == "triage":
+        return []
+
+    agents = build_specialists(report, *select_specialties(triage_response))
+    if phase == "specialists":
+        return [r for r in map(agent_request, agents.values()) if r]
+
+    answers = {name: cached_answer(agent) for name, agent in agents.items()}
+    if any(answer is None for answer in answers.values()):
+        return []
+    responses, findings = {"Triage": triage_response}, {}
+    for name, answer in answers.items():
+        responses[name], found = parse_handoff(answer)
+        if found:
+            findings[name] = found
+    team_agent, _ = build_team_agent(responses, findings)
+    # O juiz entra na mesma fase: só depende das respostas dos especialistas
+    outputs = {name: resp for name, resp in responses.items() if name != "Triage" and resp}
+    return [r for r in [agent_request(team_agent)] if r] + judge_requests(
+        report.for_role("Judge"), outputs, judge_batch_enabled())
+
+def batch_name(files: list[Path]) -> str:
+    """Nome do lote: o mesmo conjunto de relatórios, prompts e modelos retoma o mesmo diretório."""
+    digest = hashlib.sha256()
+    for p in files:
+        digest.update(f"{p.name}\0{file_hash(p)}\n".encode("utf-8"))
+    digest.update(f"{prompt_set_version()}\0{model_signature()}".encode("utf-8"))
+    return f"batch-{digest.hexdigest()[:12]}"
+
+async def abatch_reports(provider: str | None = None, name: str | None = None, concurrency: int | None = None,
+                         max_in_flight: int | None = None, rpm: int | None = None, tpm: int | None = None,
+                         force: bool = False):
+    """
+    Modo batch offline (Utils/batch_jobs.py): em vez de uma chamada por agente e relatório,
+    cada etapa (triagem → especialistas → equipa multidisciplinar + juiz) de todo o corpus é
+    enviada num ficheiro JSONL ao batch API do fornecedor (ou ao substituto local) e as
+    respostas entram na cache de respostas. No fim o pipeline normal corre sobre os mesmos
+    relatórios só com hits na cache. O estado fica em BATCH_DIR (por omissão Results/batches)
+    e repetir o comando retoma a fase onde parou.
+    """
+    global speculation
+    cache = get_response_cache()
+    if cache is None or cache.bypass:
+        print(" O modo batch entrega as respostas através da cache: ative-a (sem LLM_CACHE_DISABLED/--cache-bypass).")
+        return []
+
+    files = sorted(p for p in REPORTS_DIR.glob("*.txt") if p.is_file())
+    if not force:
+        files, skipped = split_pending(files)
+        if skipped:
+            print(f" {len(skipped)} relatórios sem alterações (ignorados)")
+    if not files:
+        print(" Nada para processar.")
+        return []
+
+    batch_dir = Path(os.getenv("BATCH_DIR") or RESULTS_DIR / "batches") / (name or batch_name(files))
+    run = BatchRun(batch_dir, get_batch_provider(provider, backend_name()), [p.name for p in files])
+    print(f" Lote {batch_dir.name}: {len(files)} relatórios, fornecedor {run.state['provider']}"
+          + (" (a retomar)" if run.resumed else ""))
+
+    limiter = RateLimiter(max_in_flight=max_in_flight or _env_int("LLM_MAX_IN_FLIGHT"),
+                          rpm=rpm or _env_int("GEMINI_RPM"), tpm=tpm or _env_int("GEMINI_TPM"))
+    previous = set_rate_limiter(limiter)
+    try:
+        for phase in PHASES:
+            await run.run_phase(phase, lambda: [r for p in files for r in batch_requests(phase, p)])
+    finally:
+        set_rate_limiter(previous)
+
+    # Montagem: o pipeline normal, com as respostas do lote na cache (sem especulação, que
+    # lançaria seniores fora do lote)
+    print(f"\n A montar os resultados de {len(files)} relatórios a partir da cache...")
+    speculation = SpeculationPolicy("off")
+    return await aprocess_all_reports(concurrency, max_in_flight, rpm, tpm, force=True, files=files)
+
+def process_all_reports(concurrency: int | None = None, max_in_flight: int | None = None,
+                        rpm: int | None = None, tpm: int | None = None, force: bool = False):
+    return asyncio.run(aprocess_all_reports(concurrency, max_in_flight, rpm, tpm, force))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Diagnóstico multidisciplinar com agentes LLM")
+    parser.add_argument("--concurrency", type=int, help="relatórios processados em paralelo (BATCH_CONCURRENCY)")
+    parser.add_argument("--max-in-flight", type=int, help="limite global de chamadas LLM em simultâneo (LLM_MAX_IN_FLIGHT)")
+    parser.add_argument("--rpm", type=int, help="pedidos por minuto (GEMINI_RPM)")
+    parser.add_argument("--tpm", type=int, help="tokens por minuto (GEMINI_TPM)")
+    parser.add_argument("--speculation", choices=SPECULATION_MODES,
+                        help="arranca os seniores em paralelo com a triagem: off, cost ou latency (SPECULATION)")
+    parser.add_argument("--local-triage", choices=LOCAL_TRIAGE_MODES,
+                        help="triagem local por palavras-chave: off, auto (LLM só se pouco confiante) ou only (LOCAL_TRIAGE)")
+    parser.add_argument("--backend", choices=BACKENDS,
+                        help="backend LLM: gemini, openai (compatível, ex.: OpenRouter) ou stub offline (LLM_BACKEND)")
+    parser.add_argument("--stream", action="store_true",
+                        help="usa generate_content_stream e escreve o texto parcial em Results/*.stream.jsonl (STREAMING)")
+    parser.add_argument("--force", action="store_true",
+                        help="reprocessa todos os relatórios, mesmo os que não mudaram")
+    parser.add_argument("--watch", action="store_true",
+                        help="modo daemon: observa a pasta de relatórios e processa os novos até SIGTERM")
+    parser.add_argument("--serve", action="store_true",
+                        help="serviço HTTP local: POST /jobs, GET /jobs/<id>, /health, /metrics")
+    parser.add_argument("--host", help="endereço do serviço HTTP (SERVICE_HOST, por omissão 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="porta do serviço HTTP (SERVICE_PORT, por omissão 8080)")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="modo batch offline: cada etapa do corpus num job JSONL do batch API, retomável")
+    parser.add_argument("--batch-provider", choices=BATCH_PROVIDERS,
+                        help="fornecedor do modo batch: auto, gemini (Batch API) ou local (BATCH_PROVIDER)")
+    parser.add_argument("--batch-name", help="nome do lote em Results/batches (por omissão derivado do corpus)")
+    parser.add_argument("--cache-bypass", action="store_true",
+                        help="ignora a cache de respostas (as novas respostas continuam a ser guardadas)")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
     # Abre o seletor para escolher um ficheiro quando executar diretamente
     # run_single_report()
-    process_all_reports()
+    args = parse_args()
+    if args.speculation:
+        speculation = SpeculationPolicy(args.speculation)
+    if args.local_triage:
+        local_triage_mode = args.local_triage
+    if args.stream:
+        streaming = True
+    if args.backend:
+        os.environ["LLM_BACKEND"] = args.backend
+    if backend_name() == "stub":
+        # Valida já STUB_LATENCY/STUB_ROLE_LATENCY: um erro só na primeira chamada falharia cada relatório
+        try:
+            get_stub_responder()
+        except ValueError as e:
+            raise SystemExit(f"Configuração inválida do backend stub: {e}")
+    if args.cache_bypass and get_response_cache() is not None:
+        get_response_cache().bypass = True
+    if args.serve:
+        asyncio.run(aserve_reports(
+            host=args.host,
+            port=args.port,
+            workers=args.concurrency,
+            max_in_flight=args.max_in_flight,
+            rpm=args.rpm,
+            tpm=args.tpm,
+        ))
+        raise SystemExit(0)
+    if args.batch_api:
+        asyncio.run(abatch_reports(
+            provider=args.batch_provider,
+            name=args.batch_name,
+            concurrency=args.concurrency,
+            max_in_flight=args.max_in_flight,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            force=args.force,
+        ))
+        raise SystemExit(0)
+    if args.watch:
+        asyncio.run(awatch_reports(
+            concurrency=args.concurrency,
+            max_in_flight=args.max_in_flight,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            force=args.force,
+        ))
+        raise SystemExit(0)
+    process_all_reports(
+        concurrency=args.concurrency,
+        max_in_flight=args.max_in_flight,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        force=args.force,
+    )
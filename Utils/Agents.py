@@ -1,9 +1,11 @@
 import os
 import sys
 import io
-from google import genai
 import re
 import json
+import hashlib
+import asyncio
+import time
 
 try:
     from dotenv import load_dotenv
@@ -24,8 +26,14 @@ except Exception:
     except Exception:
         # Last resort: leave stdout as-is; prints may still fail on some characters
         pass
-from langchain_core.prompts import PromptTemplate
-from openai import OpenAI
+from Utils.prompts import get_prompt, template_text, case_context, HANDOFF_INSTRUCTIONS
+from Utils.backends import LLMBackend, GeminiBackend, GEMINI_MODEL, backend_name, with_context
+from Utils.response_cache import get_response_cache, make_key
+from Utils.tracing import span, mark_cached
+from Utils.resilience import get_call_policy, StreamInterrupted
+from Utils.model_router import get_model_router
+from Utils.report_sections import preprocessing_signature
+from Utils.handoff import HANDOFF_SCHEMA, structured_handoff, handoff_mode
 
 def strip_triple_backticks(text: str) -> str:
     """Remove surrounding triple-backtick fences like ```json or ``` from model output.
@@ -43,316 +51,74 @@ def strip_triple_backticks(text: str) -> str:
     return text.strip()
 
 class Agent:
-    def __init__(self, medical_report=None, role=None, extra_info=None):
+    def __init__(self, medical_report=None, role=None, extra_info=None, client=None, backend=None):
         self.medical_report = medical_report
         self.role = role
+        self.timing = None
         self.extra_info = extra_info
         # Initialize the prompt based on role and other info
         self.prompt_template = self.create_prompt_template()
-        # Initialize the OpenAI client with either OPENROUTER_API_KEY or OPENAI_API_KEY
-        openrouter_present = bool(os.getenv("OPENROUTER_API_KEY"))
-        openai_present = bool(os.getenv("OPENAI_API_KEY"))
-        api_key = os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
-        api_key = os.getenv("GENAI_API_KEY") or api_key
-        if not api_key:
+        # Um backend (ou client Gemini) injetado dispensa a verificação da chave e o router
+        self.router = None
+        if backend is not None:
+            self.backend = backend
+            return
+        if client is not None:
+            self.backend = GeminiBackend(self.MODEL, client=client)
+            return
+
+        # Backend escolhido por LLM_BACKEND (gemini | openai | stub), modelo pelo tier do role
+        self.router = get_model_router()
+        self.backend = self.router.primary(self.role)
+        if not self.backend.configured:
+            openrouter_present = bool(os.getenv("OPENROUTER_API_KEY"))
+            openai_present = bool(os.getenv("OPENAI_API_KEY"))
             raise RuntimeError(
-                "No API key found. Environment presence: OPENROUTER_API_KEY="
+                f"No API key found for LLM_BACKEND={backend_name()}. Environment presence: OPENROUTER_API_KEY="
                 f"{openrouter_present}, OPENAI_API_KEY={openai_present}. "
                 "Please set OPENROUTER_API_KEY or OPENAI_API_KEY environment variable (do not paste the key into code)."
             )
 
-        # self.client = OpenAI(
-        #     base_url="https://openrouter.ai/api/v1",
-        #     api_key=api_key,
-        # )
-
-        self.client = genai.Client(api_key=api_key)
-
     def create_prompt_template(self):
-        if self.role == "MultidisciplinaryTeam":
-            # Use placeholders for the three specialist reports to avoid injecting
-            # arbitrary text (which may contain braces) into the template.
-            templates = """
-                 ### ROLE
-                 You are the **Medical Director of an Internal Medicine Board**. You are responsible for synthesizing complex cases by reviewing reports from three distinct specialists: a Cardiologist, a Psychologist, and a Pulmonologist.
- 
-                 ### OBJECTIVE
-                 Your goal is not to simply repeat what the specialists found. Your goal is to **connect the dots**. You must determine:
-                 1. Are the symptoms purely physiological, purely psychological, or a mix (psychosomatic)?
-                 2. Do the findings from one specialist explain the ambiguity in another? (e.g., Does the Psychologist's finding of "Panic Disorder" explain the Cardiologist's "Palpitations with normal ECG"?)
-                 3. What is the most logical "Unified Diagnosis"?
- 
-                 ### INPUT DATA
-                * **Cardiology Findings:** {cardiologist_report}
-                * **Psychology Findings:** {psychologist_report}
-                * **Pulmonology Findings:** {pulmonologist_report}
- 
-                 ### TASK
-                 1. **Analyze & Triangulate:** Compare the three reports. Look for overlaps (e.g., all three note shortness of breath) and conflicts (e.g., Cardio says heart is fine, Pulmo says lungs are fine -> points to Psych).
-                 2. **Synthesize:** Formulate the top 3 most likely health issues based on the *combined* evidence.
-                 3. **Justify:** For each issue, explain *how* the different reports support this conclusion.
- 
-                 ### OUTPUT FORMAT (Return strictly a Python List of Dictionaries format)
-                 [
-                    {{
-                         "diagnosis": "Name of the likely condition",
-                         "confidence_level": "High/Medium/Low",
-                         "synthesis_reasoning": "Explanation citing specific evidence from the specialist reports (e.g., 'While Cardio ruled out arrhythmia, Psych noted high anxiety...')"
-                    }},
-                    ... (2 more)
-                 ]
-             """
-        else:
-            templates = {
-                # ==========================================
-                # CARDIOLOGY
-                # ==========================================
-                "Senior_Cardiologist": """
-                    ### ROLE
-                    You are the Chief of Cardiology at a top-tier research hospital. You have 25+ years of experience in electrophysiology and structural heart disease. You are known for diagnosing complex cases that others miss by synthesizing subtle data points.
-
-                    ### TASK
-                    Review the provided medical report. Do not just list abnormal values; synthesize the data (ECG, Echo, Holter, Bloods) to build a clinical picture. Look for non-obvious correlations (e.g., borderline electrolytes exacerbating a minor arrhythmia).
-
-                    ### INSTRUCTIONS
-                    1. **Synthesize:** Briefly summarize the clinical picture.
-                    2. **Differential Diagnosis:** Identify potential diagnoses, prioritizing life-threatening conditions first, followed by subtle pathologies.
-                    3. **Risk Stratification:** Assess the immediate risk level of the patient.
-                    4. **Expert Plan:** Recommend high-yield next steps. Avoid "shotgun" testing; recommend specific, targeted investigations.
-
-                    ### INPUT DATA
-                    Medical Report: {medical_report}
-
-                    ### OUTPUT FORMAT (Markdown)
-                    **Clinical Synthesis:** [Summary]
-                    **Suspected Etiologies:** [List of top 3 differentials with reasoning]
-                    **Risk Level:** [High/Medium/Low]
-                    **Targeted Recommendations:** [Specific next steps]
-                """,
-
-                "Novice_Cardiologist": """
-                    ### ROLE
-                    You are a First-Year Cardiology Resident. You are diligent, academic, and careful. You follow the American Heart Association (AHA) guidelines strictly. You are presenting this case to your attending, so you must show your work and justify every thought to prove you haven't missed anything.
-
-                    ### TASK
-                    Analyze the medical report systematically. Go through every test result line-by-line to identify deviations from the norm.
-
-                    ### INSTRUCTIONS
-                    1. **Think Step-by-Step:** Explicitly list which values are normal and which are abnormal.
-                    2. **Guideline Check:** Match symptoms against standard diagnostic criteria for common heart conditions (Angina, AFib, CHF).
-                    3. **Safety Check:** Flag any red flags that require immediate emergency intervention.
-                    4. **Proposal:** Suggest the standard battery of follow-up tests for these symptoms.
-
-                    ### INPUT DATA
-                    Medical Report: {medical_report}
-
-                    ### OUTPUT FORMAT (Markdown)
-                    **Systematic Review:**
-                    * *ECG Analysis:* [Findings]
-                    * *Labs:* [Findings]
-                    * *Imaging:* [Findings]
-                    **Guideline Matches:** [Potential conditions based on standard criteria]
-                    **Red Flags:** [Immediate concerns]
-                    **Proposed Standard Workup:** [List of standard tests]
-                """,
-
-                # ==========================================
-                # PSYCHOLOGY
-                # ==========================================
-                "Senior_Psychologist": """
-                    ### ROLE
-                    You are a Clinical Psychologist with a PhD and specific expertise in trauma-informed care and complex comorbidities. You look beyond the immediate symptoms to identify underlying personality structures, defense mechanisms, and long-term behavioral patterns.
-
-                    ### TASK
-                    Review the patient report. Your goal is to formulate a case conceptualization that explains *why* the patient is presenting this way, not just *what* they have.
-
-                    ### INSTRUCTIONS
-                    1. **Analyze:** Look for patterns of emotional dysregulation, cognitive distortions, or trauma responses.
-                    2. **Differentiate:** Distinguish between situational stressors (Adjustment Disorder) and chronic pathology (Personality Disorders/Mood Disorders).
-                    3. **Plan:** Suggest therapeutic modalities (e.g., DBT, EMDR, Psychodynamic) rather than just generic "counseling."
-
-                    ### INPUT DATA
-                    Patient Report: {medical_report}
-
-                    ### OUTPUT FORMAT (Markdown)
-                    **Case Conceptualization:** [Deep dive into the psyche]
-                    **Differential Diagnosis:** [Nuanced diagnosis]
-                    **Therapeutic Pathway:** [Specific modalities and long-term goals]
-                """,
-
-                "Novice_Psychologist": """
-                    ### ROLE
-                    You are a Psychology Intern completing your supervised clinical hours. You rely heavily on the DSM-5-TR criteria. You are cautious about labeling a patient and prefer to list "features of" a disorder rather than a definitive diagnosis.
-
-                    ### TASK
-                    Review the patient report and map the symptoms directly to DSM-5 diagnostic criteria.
-
-                    ### INSTRUCTIONS
-                    1. **Symptom Mapping:** Extract specific quotes or behaviors from the report and match them to DSM-5 criteria for Anxiety, Depression, or PTSD.
-                    2. **Checklist:** Ensure the duration and severity criteria are met.
-                    3. **Referral:** Identify if a psychiatric referral (for medication) is needed alongside therapy.
-
-                    ### INPUT DATA
-                    Patient Report: {medical_report}
-
-                    ### OUTPUT FORMAT (Markdown)
-                    **Symptom Inventory:** [List of symptoms identified]
-                    **DSM-5 Criteria matches:**
-                    * [Potential Disorder]: [Criteria Met/Not Met]
-                    **Initial Assessment:** [Tentative conclusion]
-                    **Next Steps:** [Basic intervention plan]
-                """,
-
-                # ==========================================
-                # PULMONOLOGY
-                # ==========================================
-                "Senior_Pulmonologist": """
-                    ### ROLE
-                    You are an Attending Pulmonologist specializing in Interstitial Lung Disease (ILD) and complex airway disorders. You are adept at interpreting complex Pulmonary Function Tests (PFTs) and spotting subtle radiological signs on CT scans.
-
-                    ### TASK
-                    Review the report for signs of chronic or progressive lung disease. Look for the interplay between cardiac and pulmonary issues (e.g., cor pulmonale).
-
-                    ### INSTRUCTIONS
-                    1. **Deep Dive:** Analyze the ratio of FEV1/FVC and DLCO nuances if available.
-                    2. **Etiology:** Consider environmental exposures, autoimmune links, or drug-induced toxicity.
-                    3. **Strategy:** Propose advanced diagnostics (e.g., bronchoscopy, high-resolution CT) if standard tests are inconclusive.
-
-                    ### INPUT DATA
-                    Patient Report: {medical_report}
-
-                    ### OUTPUT FORMAT (Markdown)
-                    **Expert Analysis:** [Technical review of lung function]
-                    **Suspected Pathology:** [Specific disease processes]
-                    **Advanced Investigation Plan:** [Next steps]
-                """,
-
-                "Novice_Pulmonologist": """
-                    ### ROLE
-                    You are a Junior Resident on the respiratory ward. You are focused on the "Bread and Butter" of pulmonology: Asthma, COPD, Pneumonia, and Bronchitis.
-
-                    ### TASK
-                    Review the patient report to rule out common respiratory infections and obstructive airway diseases.
-
-                    ### INSTRUCTIONS
-                    1. **Categorize:** Determine if the pattern looks Obstructive (cant get air out) or Restrictive (cant get air in).
-                    2. **Vitals Check:** Pay close attention to O2 saturation and respiratory rate.
-                    3. **Basics:** Suggest first-line treatments (inhalers, antibiotics, steroids).
-
-                    ### INPUT DATA
-                    Patient Report: {medical_report}
-
-                    ### OUTPUT FORMAT (Markdown)
-                    **Vitals & observations:** [Review of basic metrics]
-                    **Pattern Recognition:** [Obstructive vs Restrictive vs Infectious]
-                    **Common Differentials:** [Asthma/COPD/Infection]
-                    **First-Line Management:** [Basic treatment plan]
-                """,
-
-                # ==========================================
-                # TRIAGE BALANCER
-                # ==========================================
-                "Triage_Balancer": """
-                    ### ROLE
-                    You are a Senior Clinical Triage Specialist. You are the first point of contact for patient analysis. You do not diagnose; you determine **relevance**.
-
-                    ### TASK
-                    Analyze the provided [Patient_Report]. Determine how relevant each of the following three specialties is to the patient's symptoms:
-                    1. Cardiology
-                    2. Psychology
-                    3. Pulmonology
-                    4. General Practitioner
-
-                    ### SCORING CRITERIA (0-10 Scale)
-                    * **0-2 (Irrelevant):** No symptoms match this system.
-                    * **3-5 (Low Relevance):** Vague symptoms that *could* be related (secondary check).
-                    * **6-8 (High Relevance):** Clear symptoms matching this system (primary check).
-                    * **9-10 (Critical/Urgent):** Definitive signs of pathology or "Red Flags" in this system.
-
-                    ### INSTRUCTIONS
-                    1. **Scan** the report for keywords (e.g., "palpitations" -> Cardio, "wheezing" -> Pulmo, "panic" -> Psych).
-                    2. **Assign** a score (0-10) to each specialist.
-                    3. **Justify** the score briefly.
-
-                    ### INPUT DATA
-                    Patient Report: {medical_report}
-
-                    ### OUTPUT FORMAT (JSON)
-                    {{
-                        "Cardiology": {{
-                            "weight": [Integer 0-10],
-                            "reasoning": "[Why is this relevant?]"
-                        }},
-                        "Psychology": {{
-                            "weight": [Integer 0-10],
-                            "reasoning": "[Why is this relevant?]"
-                        }},
-                        "Pulmonology": {{
-                            "weight": [Integer 0-10],
-                            "reasoning": "[Why is this relevant?]"
-                        }}
-                    }}
-                """,
-                # ==========================================
-                # CLÍNICA GERAL / MEDICINA INTERNA
-                # ==========================================
-                "Senior_General_Practitioner": """
-                    ### ROLE
-                    You are a Senior Internist (General Practitioner) with 30 years of experience in primary care and diagnostic dilemmas. You have seen it all. You follow the principle of "Occam's Razor": the simplest explanation that covers all facts is usually the correct one.
-
-                    ### TASK
-                    Review the patient's medical report. Your goal is NOT to specialize, but to **connect the dots** between body systems that specialists often view in isolation. You look for systemic diseases (e.g., Lupus, Diabetes, Thyroid issues) that manifest with scattered symptoms.
-
-                    ### INSTRUCTIONS
-                    1. **Holistic Synthesis:** Ignore the noise. Identify the "Constellation of Symptoms" that fit together.
-                    2. **Rationalize Referrals:** Determine if a specialist is truly needed or if this can be managed conservatively. Act as a "Gatekeeper" to prevent over-testing.
-                    3. **The "Unifying Diagnosis":** Try to find ONE condition that explains the cardiac, pulmonary, and psychological symptoms simultaneously.
-
-                    ### INPUT DATA
-                    Medical Report: {medical_report}
-
-                    ### OUTPUT FORMAT (Markdown)
-                    **Holistic Assessment:** [Summary of the whole patient, not just parts]
-                    **Unifying Hypothesis:** [Is there a single systemic cause? e.g., Hyperthyroidism causing anxiety AND palpitations?]
-                    **Management Strategy:** [Treat vs. Refer]
-                    **Critical Misses:** [What might the specialists be overlooking?]
-                """,
-
-                "Novice_General_Practitioner": """
-                    ### ROLE
-                    You are a First-Year Internal Medicine Resident on your first rotation. You are extremely thorough and systematic. You are terrified of missing a "Red Flag" or a life-threatening emergency, so you rely heavily on the "Review of Systems" (ROS) checklist and UpToDate guidelines.
-
-                    ### TASK
-                    Perform a comprehensive "Review of Systems" on the patient report. Categorize every symptom into its biological system to ensure nothing is ignored.
-
-                    ### INSTRUCTIONS
-                    1. **Categorize:** Break down symptoms into buckets (Cardiovascular, Respiratory, GI, Neuro, Psych).
-                    2. **Triage:** Assign a triage level (Green/Yellow/Red) based on standard emergency protocols.
-                    3. **Rule Out:** Explicitly list the "Must Not Miss" diagnoses (e.g., Pulmonary Embolism, Meningitis) and check if they can be ruled out with current data.
-
-                    ### INPUT DATA
-                    Medical Report: {medical_report}
-
-                    ### OUTPUT FORMAT (Markdown)
-                    **Review of Systems (ROS):**
-                    * *General/Constitutional:* [Fatigue, fever, weight loss...]
-                    * *Cardio/Resp:* [Findings...]
-                    * *Neuro/Psych:* [Findings...]
-                    **Triage Color:** [Green/Yellow/Red]
-                    **"Must Not Miss" List:** [List of dangerous conditions to rule out]
-                    **Initial Lab Panel:** [Recommended bloodwork]
-                """
-}
-            
-        # Resolve final template string:
-        if isinstance(templates, dict):
-            final_template = templates[self.role]
-        else:
-            final_template = templates
-        return PromptTemplate.from_template(final_template)
-    
-    def run(self):
-        print(f"{self.role} is running...")
+        # Template já compilado e validado no registo (Utils/prompts.py)
+        return get_prompt(self.role)
+
+    @staticmethod
+    def template_text(role):
+        """Texto do template do prompt para `role`."""
+        return template_text(role)
+
+    # Modelo e configuração de geração usados por todos os agentes
+    MODEL = GEMINI_MODEL
+    GENERATION_CONFIG = {"temperature": 0.4,
+                         "top_p": 0.95,
+                         "top_k": 40,
+                         "max_output_tokens": 8192,
+                         "response_mime_type": "application/json"}
+
+    @property
+    def handoff(self):
+        """Especialista que entrega à equipa o objeto de handoff estruturado (Utils/handoff.py)."""
+        return self.stage == "specialist" and structured_handoff()
+
+    @property
+    def generation_config(self):
+        if self.handoff:
+            return {**self.GENERATION_CONFIG, "response_schema": HANDOFF_SCHEMA}
+        return self.GENERATION_CONFIG
+
+    def build_prompt(self):
+        context, instructions = self.build_prompt_parts()
+        return with_context(instructions, context)
+
+    def build_prompt_parts(self):
+        """(contexto partilhado com o relatório ou None, instruções do role)."""
+        context, instructions = self.prompt_template.render_parts(**self._format_kwargs())
+        if self.handoff:
+            instructions += HANDOFF_INSTRUCTIONS
+        return context, instructions
+
+    def _format_kwargs(self):
         # Build format kwargs depending on the agent role.
         if self.role == "MultidisciplinaryTeam":
             fmt_kwargs = {
@@ -363,125 +129,182 @@ class Agent:
             }
         else:
             fmt_kwargs = {"medical_report": self.medical_report}
-        
-        prompt = self.prompt_template.format(**fmt_kwargs)
-        # try:
-            # # Allow override of model via environment variable
-            # model = os.getenv("OPENROUTER_MODEL", "openai/gpt-oss-20b:free")
-
-            # completion = self.client.chat.completions.create(
-            #     extra_body={},
-            #     model=model,
-            #     messages=[{"role": "user", "content": prompt}],
-            # )
-
-        response = self.client.models.generate_content(
-        model='gemini-2.5-flash',
-        contents=prompt,
-        config={"temperature": 0.4,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-                "response_mime_type": "application/json"}
-        )
+        return fmt_kwargs
+
+    def _cache_lookup(self, prompt):
+        """Devolve (cache, key, resposta em cache ou None) para este prompt."""
+        cache = get_response_cache()
+        if cache is None:
+            return None, None, None
+        key = make_key(self.role, prompt, self.backend.signature, self.generation_config)
+        return cache, key, cache.get(key)
+
+    async def _acache_lookup(self, prompt):
+        # Igual a _cache_lookup, com a leitura do SQLite fora do event loop
+        cache = get_response_cache()
+        if cache is None:
+            return None, None, None
+        key = make_key(self.role, prompt, self.backend.signature, self.generation_config)
+        return cache, key, await cache.aget(key)
+
+    async def _acall(self, call, prompt, hedge=True):
+        """(backend usado, resposta) de call(backend): pelo router de modelos ou no backend injetado."""
+        if self.router is not None:
+            return await self.router.acall(self.role, call, prompt, hedge)
+        policy = get_call_policy()
+        return self.backend, await policy.acall(
+            lambda: call(self.backend), (self.backend.signature, self.role), prompt, hedge)
+
+    def _call(self, call, prompt):
+        if self.router is not None:
+            return self.router.call(self.role, call, prompt)
+        return self.backend, get_call_policy().call(
+            lambda: call(self.backend), (self.backend.signature, self.role), prompt)
+
+    def _cache_store(self, cache, cache_key, used, text):
+        # Respostas do backend de fallback não ficam em cache com a chave do modelo primário
+        if cache is not None and used is self.backend:
+            cache.put(cache_key, text, role=self.role, model=self.backend.signature)
+
+    async def _acache_store(self, cache, cache_key, used, text):
+        if cache is not None and used is self.backend:
+            await cache.aput(cache_key, text, role=self.role, model=self.backend.signature)
+
+    @property
+    def stage(self):
+        """Etapa do pipeline a que o agente pertence (para o tracing)."""
+        if self.role == "Triage_Balancer":
+            return "triage"
+        if self.role == "MultidisciplinaryTeam":
+            return "mdt"
+        return "specialist"
+
+    async def arun(self, on_chunk=None):
+        """
+        Async counterpart of run(): uses client.aio so no OS thread is held per call.
+        Com `on_chunk(role, texto)` usa generate_content_stream e entrega o texto parcial à
+        medida que chega. Os tempos (ttft/total) ficam em self.timing.
+        """
+        with span(self.role, self.stage, role=self.role, model=self.backend.signature):
+            return await self._arun(on_chunk)
+
+    async def _arun(self, on_chunk=None):
+        print(f"{self.role} is running...")
+        started = time.perf_counter()
+        context, instructions = self.build_prompt_parts()
+        prompt = with_context(instructions, context)
+        cache, cache_key, cached = await self._acache_lookup(prompt)
+        if cached is not None:
+            mark_cached()
+            self.timing = {"cached": True, "ttft_seconds": 0.0, "total_seconds": round(time.perf_counter() - started, 3)}
+            if on_chunk is not None:
+                on_chunk(self.role, cached)
+            return cached
+
+        ttft = None
+
+        async def stream(backend):
+            nonlocal ttft
+            parts = []
+            try:
+                async for chunk in backend.astream(instructions, self.generation_config, context):
+                    if ttft is None:
+                        ttft = round(time.perf_counter() - started, 3)
+                    parts.append(chunk)
+                    on_chunk(self.role, chunk)
+            except Exception as e:
+                # Parte da resposta já foi entregue: repetir duplicaria o texto em streaming
+                if parts:
+                    raise StreamInterrupted(f"{type(e).__name__}: {e}") from e
+                raise
+            return "".join(parts)
+
+        # Modelo escolhido pelo router (Utils/model_router.py); prazo, repetições com backoff e
+        # pedidos duplicados (Utils/resilience.py); cada tentativa ocupa um lugar no limitador global
+        if on_chunk is None:
+            used, raw = await self._acall(
+                lambda backend: backend.agenerate(instructions, self.generation_config, context), prompt)
+        else:
+            used, raw = await self._acall(stream, prompt, hedge=False)
+        self.timing = {"cached": False, "ttft_seconds": ttft, "total_seconds": round(time.perf_counter() - started, 3)}
+
+        text = strip_triple_backticks(raw)
+        await self._acache_store(cache, cache_key, used, text)
+        return text
+
+    def run(self):
+        with span(self.role, self.stage, role=self.role, model=self.backend.signature):
+            return self._run()
+
+    def _run(self):
+        print(f"{self.role} is running...")
+        context, instructions = self.build_prompt_parts()
+        prompt = with_context(instructions, context)
+        # Respostas já calculadas para o mesmo (role, prompt, modelo, config) vêm da cache em disco
+        cache, cache_key, cached = self._cache_lookup(prompt)
+        if cached is not None:
+            mark_cached()
+            return cached
+
+        # Todas as chamadas partilham o limitador global (concorrência + RPM/TPM) e repetem em 429/5xx
+        used, raw = self._call(lambda backend: backend.generate(instructions, self.generation_config, context), prompt)
         # Remove possíveis fences de código (```json / ``` ) que o modelo possa incluir
-        return strip_triple_backticks(response.text)
-
-        #     # Safely extract the assistant text from the response
-        #     content = None
-        #     try:
-        #         content = completion.choices[0].message.content
-        #     except Exception:
-        #         # Try alternate common shape
-        #         try:
-        #             content = completion.choices[0].text
-        #         except Exception:
-        #             content = str(completion)
-
-        #     try:
-        #         # test print to stdout encoding by encoding/decoding
-        #         _ = content.encode(sys.stdout.encoding or 'utf-8', errors='strict')
-        #         # If encoding succeeds, return original content
-        #         return content
-        #     except Exception:
-        #         # Fallback: replace characters that can't be encoded so
-        #         # printing doesn't crash the process
-        #         safe = content.encode(sys.stdout.encoding or 'utf-8', errors='replace')
-        #         safe = safe.decode(sys.stdout.encoding or 'utf-8', errors='replace')
-        #         return safe
-        # except Exception as e:
-        #     print("Error occurred:", e)
-        #     return None
+        text = strip_triple_backticks(raw)
+        self._cache_store(cache, cache_key, used, text)
+        return text
 
 # Define specialized agent classes
 class SeniorGeneralPractitioner(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Senior_General_Practitioner")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Senior_General_Practitioner", client=client, backend=backend)
 
 class NoviceGeneralPractitioner(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Novice_General_Practitioner")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Novice_General_Practitioner", client=client, backend=backend)
 
 class SeniorCardiologist(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Senior_Cardiologist")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Senior_Cardiologist", client=client, backend=backend)
 
 class NoviceCardiologist(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Novice_Cardiologist")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Novice_Cardiologist", client=client, backend=backend)
 
 class SeniorPsychologist(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Senior_Psychologist")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Senior_Psychologist", client=client, backend=backend)
 
 class NovicePsychologist(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Novice_Psychologist")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Novice_Psychologist", client=client, backend=backend)
 
 class SeniorPulmonologist(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Senior_Pulmonologist")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Senior_Pulmonologist", client=client, backend=backend)
 
 class NovicePulmonologist(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Novice_Pulmonologist")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Novice_Pulmonologist", client=client, backend=backend)
 
 class TriageBalancer(Agent):
-    def __init__(self, medical_report):
-        super().__init__(medical_report, "Triage_Balancer")
+    def __init__(self, medical_report, client=None, backend=None):
+        super().__init__(medical_report, "Triage_Balancer", client=client, backend=backend)
 
 class MultidisciplinaryTeam(Agent):
-    def __init__(self, cardiologist_report, psychologist_report, pulmonologist_report, general_practitioner_report):
+    def __init__(self, cardiologist_report, psychologist_report, pulmonologist_report, general_practitioner_report, client=None, backend=None):
         extra_info = {
             "cardiologist_report": cardiologist_report,
             "psychologist_report": psychologist_report,
             "pulmonologist_report": pulmonologist_report,
             "general_practitioner_report": general_practitioner_report
         }
-        super().__init__(role="MultidisciplinaryTeam", extra_info=extra_info)
+        super().__init__(role="MultidisciplinaryTeam", extra_info=extra_info, client=client, backend=backend)
 
-def evaluate_with_gemini(medical_report: str, agent_name: str, agent_output: str) -> dict:
-    """
-    Usa Gemini (google.genai) como 'juiz' para avaliar a qualidade da resposta de um agente.
-    Devolve um dicionário com: score (0-100), rating (poor/fair/good/excellent) e explanation.
-    """
-
-    api_key = os.getenv("GENAI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        # Sem chave, devolvemos uma métrica neutra para não partir o fluxo
-        return {
-            "score": 0,
-            "rating": "unknown",
-            "explanation": "No Gemini API key configured (GENAI_API_KEY / GOOGLE_API_KEY)."
-        }
-
-    client = genai.Client(api_key=api_key)
-
-    eval_prompt = f"""
+EVAL_PROMPT = """
     You are a senior medical quality reviewer.
 
     You will be given:
-    1) A patient medical report (may be synthetic or incomplete).
+    1) A patient medical report (the CASE CONTEXT above; may be synthetic or incomplete).
     2) The name of an AI agent (its role).
     3) The agent's answer.
 
@@ -499,9 +322,6 @@ def evaluate_with_gemini(medical_report: str, agent_name: str, agent_output: str
     - "rating": one of ["poor", "fair", "good", "excellent"].
     - "explanation": short text (max 5 sentences) justifying the score.
 
-    --- PATIENT REPORT ---
-    {medical_report}
-
     --- AGENT NAME ---
     {agent_name}
 
@@ -509,29 +329,292 @@ def evaluate_with_gemini(medical_report: str, agent_name: str, agent_output: str
     {agent_output}
     """
 
-    try:
-        response = client.models.generate_content(
-            model=os.getenv("GEMINI_EVAL_MODEL", "gemini-2.0-flash"),
-            contents=eval_prompt,
-        )
-        raw = response.text or ""
+BATCH_EVAL_PROMPT = """
+    You are a senior medical quality reviewer.
 
-        # tentar extrair um JSON de forma robusta
-        try:
-            m = re.search(r'(\{.*\})', raw, re.S)
-            if m:
-                return json.loads(m.group(1))
-            return json.loads(raw)
-        except Exception:
-            return {
-                "score": 0,
-                "rating": "parse_error",
-                "explanation": f"Could not parse evaluation JSON. Raw output (truncated): {raw[:300]}"
-            }
+    You will be given:
+    1) A patient medical report (the CASE CONTEXT above; may be synthetic or incomplete).
+    2) The answers of several AI agents, each one introduced by its agent name (its role).
 
-    except Exception as e:
+    Rate the QUALITY of EACH agent's answer independently, ONLY in terms of:
+    - Clinical coherence and plausibility (not perfect factual accuracy).
+    - Internal consistency (no contradictions).
+    - Clarity and usefulness of the reasoning for a human clinician.
+    - Adherence to the requested format (headings, JSON, etc., when applicable).
+
+    Ignore minor language or grammar issues. Focus on whether each answer would be
+    helpful and reasonably safe as a draft for a human clinician to review.
+
+    Return ONLY a valid JSON object with one key per agent, using the agent names exactly
+    as given. Each value must be an object with the following fields:
+    - "score": integer between 0 and 100 (0 = unusable, 100 = excellent).
+    - "rating": one of ["poor", "fair", "good", "excellent"].
+    - "explanation": short text (max 5 sentences) justifying the score.
+
+    --- AGENT OUTPUTS ---
+    {agent_outputs}
+    """
+
+ROLES = [
+    "Triage_Balancer",
+    "Senior_Cardiologist", "Novice_Cardiologist",
+    "Senior_Psychologist", "Novice_Psychologist",
+    "Senior_Pulmonologist", "Novice_Pulmonologist",
+    "Senior_General_Practitioner", "Novice_General_Practitioner",
+    "MultidisciplinaryTeam",
+]
+
+def prompt_set_version() -> str:
+    """
+    Hash curto de todos os templates (agentes + juiz) e da configuração de geração.
+    Muda sempre que um prompt é alterado, o que invalida resultados antigos no manifesto.
+    """
+    material = [Agent.template_text(role) for role in ROLES]
+    # O contexto partilhado já entra pelos templates dos agentes
+    material.append(EVAL_PROMPT)
+    material.append(BATCH_EVAL_PROMPT)
+    material.append(json.dumps(Agent.GENERATION_CONFIG, sort_keys=True))
+    # O que cada agente recebe do relatório depende do modo de secções e do orçamento
+    material.append(preprocessing_signature())
+    # Com o handoff estruturado os especialistas respondem segundo o esquema e a equipa recebe os achados
+    material.append(f"handoff:{handoff_mode()}")
+    if structured_handoff():
+        material.append(HANDOFF_INSTRUCTIONS)
+        material.append(json.dumps(HANDOFF_SCHEMA, sort_keys=True))
+    return hashlib.sha256("\n".join(material).encode("utf-8")).hexdigest()[:12]
+
+def model_signature() -> str:
+    """Modelos usados pelos agentes (por tier) e pelo juiz, para registo no manifesto/resultados."""
+    router = get_model_router()
+    return f"{router.signature()}+judge:{router.primary('Judge').signature}"
+
+def _eval_model():
+    return os.getenv("GEMINI_EVAL_MODEL", "gemini-2.0-flash")
+
+def _judge_backend(client=None, backend=None) -> LLMBackend:
+    """Backend do juiz: o injetado, um client Gemini injetado, ou o configurado em LLM_BACKEND."""
+    if backend is not None:
+        return backend
+    if client is not None:
+        return GeminiBackend(_eval_model(), client=client)
+    return get_model_router().primary("Judge")
+
+def _judge_generate(backend: LLMBackend, role: str, call, prompt: str) -> str:
+    """call(backend) com repetições; pelo router (fallback e disjuntor) se for o juiz por omissão."""
+    router = get_model_router()
+    if backend is router.primary(role):
+        return router.call(role, call, prompt)[1]
+    return get_call_policy().call(lambda: call(backend), (backend.signature, role), prompt)
+
+async def _ajudge_generate(backend: LLMBackend, role: str, call, prompt: str) -> str:
+    router = get_model_router()
+    if backend is router.primary(role):
+        return (await router.acall(role, call, prompt))[1]
+    return await get_call_policy().acall(lambda: call(backend), (backend.signature, role), prompt)
+
+def _missing_key_metric():
+    # Sem chave, devolvemos uma métrica neutra para não partir o fluxo
+    return {
+        "score": 0,
+        "rating": "unknown",
+        "explanation": "No Gemini API key configured (GENAI_API_KEY / GOOGLE_API_KEY)."
+    }
+
+def _parse_evaluation(raw: str) -> dict:
+    # tentar extrair um JSON de forma robusta
+    raw = raw or ""
+    try:
+        m = re.search(r'(\{.*\})', raw, re.S)
+        if m:
+            return json.loads(m.group(1))
+        return json.loads(raw)
+    except Exception:
         return {
             "score": 0,
-            "rating": "error",
-            "explanation": f"Error calling Gemini evaluator: {e}"
+            "rating": "parse_error",
+            "explanation": f"Could not parse evaluation JSON. Raw output (truncated): {raw[:300]}"
         }
+
+def _eval_prompt_parts(medical_report: str, agent_name: str, agent_output: str):
+    """(contexto partilhado, instruções) do prompt do juiz; o relatório vai no contexto."""
+    return case_context(medical_report), EVAL_PROMPT.format(agent_name=agent_name, agent_output=agent_output)
+
+def _eval_cache_lookup(backend: LLMBackend, agent_name: str, eval_prompt: str):
+    cache = get_response_cache()
+    if cache is None:
+        return None, None, None
+    key = make_key(f"Judge:{agent_name}", eval_prompt, backend.signature)
+    return cache, key, cache.get(key)
+
+async def _aeval_cache_lookup(backend: LLMBackend, agent_name: str, eval_prompt: str):
+    cache = get_response_cache()
+    if cache is None:
+        return None, None, None
+    key = make_key(f"Judge:{agent_name}", eval_prompt, backend.signature)
+    return cache, key, await cache.aget(key)
+
+def _eval_cache_store(cache, key, backend: LLMBackend, agent_name: str, raw: str, metric: dict):
+    # Só guardamos avaliações que foram interpretadas com sucesso
+    if cache is not None and metric.get("rating") != "parse_error":
+        cache.put(key, raw, role=f"Judge:{agent_name}", model=backend.signature)
+
+async def _aeval_cache_store(cache, key, backend: LLMBackend, agent_name: str, raw: str, metric: dict):
+    if cache is not None and metric.get("rating") != "parse_error":
+        await cache.aput(key, raw, role=f"Judge:{agent_name}", model=backend.signature)
+
+def _evaluation_error(e: Exception) -> dict:
+    return {
+        "score": 0,
+        "rating": "error",
+        "explanation": f"Error calling Gemini evaluator: {e}"
+    }
+
+def evaluate_with_gemini(medical_report: str, agent_name: str, agent_output: str, client=None, backend=None) -> dict:
+    """
+    Usa o LLM 'juiz' (Gemini por omissão) para avaliar a qualidade da resposta de um agente.
+    Devolve um dicionário com: score (0-100), rating (poor/fair/good/excellent) e explanation.
+    `client`/`backend` permitem injetar um client ou backend já existente; por omissão usa LLM_BACKEND.
+    """
+
+    backend = _judge_backend(client, backend)
+    if not backend.configured:
+        return _missing_key_metric()
+    context, instructions = _eval_prompt_parts(medical_report, agent_name, agent_output)
+    eval_prompt = with_context(instructions, context)
+    with span(f"Judge:{agent_name}", "judge", role=agent_name, model=backend.signature) as current:
+        cache, cache_key, cached = _eval_cache_lookup(backend, agent_name, eval_prompt)
+        if cached is not None:
+            mark_cached()
+            return _parse_evaluation(cached)
+
+        try:
+            raw = _judge_generate(backend, "Judge", lambda b: b.generate(instructions, context=context), eval_prompt)
+            metric = _parse_evaluation(raw)
+            _eval_cache_store(cache, cache_key, backend, agent_name, raw, metric)
+            return metric
+        except Exception as e:
+            current.error = f"{type(e).__name__}: {e}"
+            return _evaluation_error(e)
+
+async def aevaluate_with_gemini(medical_report: str, agent_name: str, agent_output: str, client=None, backend=None) -> dict:
+    """Versão assíncrona de evaluate_with_gemini."""
+
+    backend = _judge_backend(client, backend)
+    if not backend.configured:
+        return _missing_key_metric()
+    context, instructions = _eval_prompt_parts(medical_report, agent_name, agent_output)
+    eval_prompt = with_context(instructions, context)
+    with span(f"Judge:{agent_name}", "judge", role=agent_name, model=backend.signature) as current:
+        cache, cache_key, cached = await _aeval_cache_lookup(backend, agent_name, eval_prompt)
+        if cached is not None:
+            mark_cached()
+            return _parse_evaluation(cached)
+
+        try:
+            raw = await _ajudge_generate(
+                backend, "Judge", lambda b: b.agenerate(instructions, context=context), eval_prompt)
+            metric = _parse_evaluation(raw)
+            await _aeval_cache_store(cache, cache_key, backend, agent_name, raw, metric)
+            return metric
+        except Exception as e:
+            current.error = f"{type(e).__name__}: {e}"
+            return _evaluation_error(e)
+
+# ==========================================
+# JUIZ EM LOTE (uma chamada por relatório)
+# ==========================================
+def _format_agent_outputs(outputs: dict) -> str:
+    return "\n".join(f"=== AGENT: {name} ===\n{output}\n" for name, output in outputs.items())
+
+def _parse_batch_evaluation(raw: str, agent_names) -> dict:
+    """Extrai as métricas válidas por agente; agentes em falta ficam de fora (para fallback)."""
+    try:
+        raw = strip_triple_backticks(raw or "")
+        m = re.search(r'(\{.*\})', raw, re.S)
+        obj = json.loads(m.group(1) if m else raw)
+    except Exception:
+        return {}
+    if not isinstance(obj, dict):
+        return {}
+    parsed = {}
+    for name in agent_names:
+        metric = obj.get(name)
+        if isinstance(metric, dict) and "score" in metric:
+            parsed[name] = metric
+    return parsed
+
+def _batch_eval_prompt_parts(medical_report: str, outputs: dict):
+    return case_context(medical_report), BATCH_EVAL_PROMPT.format(agent_outputs=_format_agent_outputs(outputs))
+
+def evaluate_batch_with_gemini(medical_report: str, outputs: dict, client=None, backend=None) -> dict:
+    """
+    Avalia as respostas de todos os agentes de um relatório numa só chamada ao juiz
+    (o relatório é enviado uma única vez). `outputs` é {nome_do_agente: resposta}.
+    Devolve {nome_do_agente: {score, rating, explanation}}; os agentes cuja avaliação
+    não for possível interpretar são avaliados individualmente com evaluate_with_gemini.
+    """
+    if not outputs:
+        return {}
+    backend = _judge_backend(client, backend)
+    if not backend.configured:
+        return {name: _missing_key_metric() for name in outputs}
+
+    context, instructions = _batch_eval_prompt_parts(medical_report, outputs)
+    eval_prompt = with_context(instructions, context)
+    with span("Judge:batch", "judge", role="batch", model=backend.signature) as current:
+        cache, cache_key, cached = _eval_cache_lookup(backend, "batch", eval_prompt)
+        parsed = _parse_batch_evaluation(cached, outputs) if cached is not None else {}
+
+        if len(parsed) < len(outputs):
+            try:
+                raw = _judge_generate(
+                    backend, "Judge",
+                    lambda b: b.generate(instructions, {"response_mime_type": "application/json"}, context), eval_prompt)
+                parsed = _parse_batch_evaluation(raw, outputs)
+                if cache is not None and len(parsed) == len(outputs):
+                    cache.put(cache_key, raw, role="Judge:batch", model=backend.signature)
+            except Exception as e:
+                current.error = f"{type(e).__name__}: {e}"
+                print(f"Juiz em lote falhou ({e}); a avaliar agente a agente")
+        else:
+            mark_cached()
+
+    for name, output in outputs.items():
+        if name not in parsed:
+            parsed[name] = evaluate_with_gemini(medical_report, name, output, backend=backend)
+    return {name: parsed[name] for name in outputs}
+
+async def aevaluate_batch_with_gemini(medical_report: str, outputs: dict, client=None, backend=None) -> dict:
+    """Versão assíncrona de evaluate_batch_with_gemini."""
+    if not outputs:
+        return {}
+    backend = _judge_backend(client, backend)
+    if not backend.configured:
+        return {name: _missing_key_metric() for name in outputs}
+
+    context, instructions = _batch_eval_prompt_parts(medical_report, outputs)
+    eval_prompt = with_context(instructions, context)
+    with span("Judge:batch", "judge", role="batch", model=backend.signature) as current:
+        cache, cache_key, cached = await _aeval_cache_lookup(backend, "batch", eval_prompt)
+        parsed = _parse_batch_evaluation(cached, outputs) if cached is not None else {}
+
+        if len(parsed) < len(outputs):
+            try:
+                raw = await _ajudge_generate(
+                    backend, "Judge",
+                    lambda b: b.agenerate(instructions, {"response_mime_type": "application/json"}, context), eval_prompt)
+                parsed = _parse_batch_evaluation(raw, outputs)
+                if cache is not None and len(parsed) == len(outputs):
+                    await cache.aput(cache_key, raw, role="Judge:batch", model=backend.signature)
+            except Exception as e:
+                current.error = f"{type(e).__name__}: {e}"
+                print(f"Juiz em lote falhou ({e}); a avaliar agente a agente")
+        else:
+            mark_cached()
+
+    missing = [name for name in outputs if name not in parsed]
+    fallback = await asyncio.gather(
+        *(aevaluate_with_gemini(medical_report, name, outputs[name], backend=backend) for name in missing)
+    )
+    parsed.update(zip(missing, fallback))
+    return {name: parsed[name] for name in outputs}
@@ -0,0 +1,376 @@
+"""Columnar analytics over the stored results: judge scores, triage weights and latencies.
+
+The result payloads (result store and legacy JSON files, see Utils/result_store.py) are
+flattened once into NumPy arrays and saved as an ``.npz`` cache; later queries load the
+arrays and answer with vectorized operations instead of re-parsing every result. The cache
+is rebuilt whenever the results change (new runs, judge metrics merged, files added).
+
+    python -m Utils.analytics [all|scores|triage|fallback|latency] [--since 2025-12-01]
+                              [--until ...] [--model ...] [--role ...] [--json] [--rebuild]
+
+* scores:   judge score per role and model (n, mean, p50, p90, share of failed evaluations)
+* triage:   distribution of the LLM triage weights per specialty and how often each is selected
+* fallback: how often triage selects nothing and the all-seniors fallback runs
+* latency:  score vs. agent latency (correlation and mean score per latency quartile)
+
+Settings come from the environment:
+    ANALYTICS_CACHE     .npz cache file (default <repo>/.cache/analytics.npz)
+    TRIAGE_THRESHOLD    weight from which a specialty is selected (default 3, as in Main)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from Utils.local_triage import SPECIALTIES, parse_weights, selection
+from Utils.result_store import DEFAULT_NAME, ResultStore, iter_results, normalize_ts
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_CACHE = BASE_DIR / ".cache" / "analytics.npz"
+
+# Spans de agentes (o juiz é avaliado, não avaliador)
+AGENT_KINDS = ("triage", "specialist", "mdt")
+# Avaliações que falharam: o score 0 não é uma nota
+FAILED_RATINGS = ("error", "parse_error", "unknown")
+
+QUERIES = ("scores", "triage", "fallback", "latency")
+# Os pesos da triagem vão de 0 a 10 (prompt do TriageBalancer)
+MAX_WEIGHT = 10
+
+
+def source_signature(results_dir) -> str:
+    """Changes whenever a run is added, its metrics are merged or a legacy JSON changes."""
+    results_dir = Path(results_dir)
+    parts = []
+    db = results_dir / DEFAULT_NAME
+    if db.is_file():
+        store = ResultStore(db)
+        try:
+            with store.lock:
+                row = store.conn.execute(
+                    "SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(metrics_status = 'complete'), 0) FROM results"
+                ).fetchone()
+        finally:
+            store.close()
+        parts.append("store:%d:%d:%d" % tuple(row))
+    files = list(results_dir.glob("*.json"))
+    parts.append("files:%d:%d" % (len(files), max((p.stat().st_mtime_ns for p in files), default=0)))
+    return "|".join(parts)
+
+
+class _Vocab:
+    """String → small integer code (the string columns are stored as codes + one vocabulary)."""
+
+    def __init__(self, values=()):
+        self.index = {v: i for i, v in enumerate(values)}
+
+    def code(self, value) -> int:
+        value = "" if value is None else str(value)
+        return self.index.setdefault(value, len(self.index))
+
+    def array(self) -> np.ndarray:
+        return np.array(list(self.index), dtype=str)
+
+
+def _ts_number(ts) -> int:
+    digits = "".join(ch for ch in str(ts or "") if ch.isdigit())[:14]
+    return int(digits.ljust(14, "0")) if digits else 0
+
+
+class ResultColumns:
+    """Results flattened into three tables of parallel NumPy arrays.
+
+    runs:   run_ts (YYYYMMDDHHMMSS), run_model, run_source (triage source), run_fallback
+    scores: score_run, score_role, score_model, score, score_failed, score_latency, score_cached
+    triage: triage_run, triage_specialty (index into SPECIALTIES), triage_weight
+    String columns hold codes into the ``roles``, ``models`` and ``sources`` vocabularies.
+    """
+
+    def __init__(self, arrays: dict):
+        self.arrays = arrays
+        for name, value in arrays.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def build(cls, results_dir, threshold: int = 3):
+        roles, models, sources = _Vocab(), _Vocab(), _Vocab()
+        runs = {"run_ts": [], "run_model": [], "run_source": [], "run_fallback": []}
+        scores = {k: [] for k in ("score_run", "score_role", "score_model", "score", "score_failed",
+                                  "score_latency", "score_cached")}
+        triage = {"triage_run": [], "triage_specialty": [], "triage_weight": []}
+
+        for payload in iter_results(results_dir):
+            meta = payload.get("meta") or {}
+            agents = payload.get("agents") or {}
+            run = len(runs["run_ts"])
+            weights = parse_weights(agents.get("Triage") or "")
+            runs["run_ts"].append(_ts_number(payload.get("timestamp")))
+            runs["run_model"].append(models.code(meta.get("model")))
+            runs["run_source"].append(sources.code((meta.get("triage") or {}).get("source", "llm")))
+            # Mesma regra do Main.select_specialties: nenhuma especialidade ≥ limiar → todos os seniores
+            runs["run_fallback"].append(weights is None or not selection(weights, threshold))
+            for i, specialty in enumerate(SPECIALTIES):
+                weight = (weights or {}).get(specialty)
+                triage["triage_run"].append(run)
+                triage["triage_specialty"].append(i)
+                triage["triage_weight"].append(np.nan if weight is None else weight)
+
+            # Modelo e latência de cada role: spans do trace; resultados antigos só têm meta.model/timings
+            span_model, span_latency, span_cached = {}, {}, {}
+            for s in (payload.get("trace") or {}).get("spans", []):
+                if s.get("kind") in AGENT_KINDS and s.get("role"):
+                    span_model[s["role"]] = s.get("model")
+                    span_latency[s["role"]] = s.get("wall_seconds")
+                    span_cached[s["role"]] = bool(s.get("cached"))
+            timings = meta.get("timings") or {}
+            for role, metric in (payload.get("metrics") or {}).items():
+                if not isinstance(metric, dict):
+                    continue
+                latency = span_latency.get(role)
+                if latency is None:
+                    latency = (timings.get(role) or {}).get("total_seconds")
+                rating = str(metric.get("rating", "")).lower()
+                try:
+                    value = float(metric.get("score"))
+                except (TypeError, ValueError):
+                    value, rating = np.nan, rating or "parse_error"
+                scores["score_run"].append(run)
+                scores["score_role"].append(roles.code(role))
+                scores["score_model"].append(models.code(span_model.get(role) or meta.get("model")))
+                scores["score"].append(value)
+                scores["score_failed"].append(rating in FAILED_RATINGS or np.isnan(value))
+                scores["score_latency"].append(np.nan if latency is None else latency)
+                scores["score_cached"].append(span_cached.get(role, (timings.get(role) or {}).get("cached", False)))
+
+        dtypes = {
+            "run_ts": np.int64, "run_model": np.int32, "run_source": np.int32, "run_fallback": bool,
+            "score_run": np.int32, "score_role": np.int32, "score_model": np.int32, "score": np.float32,
+            "score_failed": bool, "score_latency": np.float32, "score_cached": bool,
+            "triage_run": np.int32, "triage_specialty": np.int8, "triage_weight": np.float32,
+        }
+        arrays = {name: np.array(values, dtype=dtypes[name]) for name, values in {**runs, **scores, **triage}.items()}
+        arrays.update(roles=roles.array(), models=models.array(), sources=sources.array(),
+                      threshold=np.array(threshold))
+        return cls(arrays)
+
+    def save(self, path, signature: str):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, signature=np.array(signature), **self.arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, signature: str | None = None, threshold: int | None = None):
+        """Arrays from the cache, or ``None`` if missing, unreadable or stale."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except Exception:
+            return None
+        if signature is not None and str(arrays.pop("signature")) != signature:
+            return None
+        if threshold is not None and int(arrays["threshold"]) != threshold:
+            return None
+        arrays.pop("signature", None)
+        return cls(arrays)
+
+    # ---------- filtros ----------
+    def run_mask(self, since=None, until=None) -> np.ndarray:
+        mask = np.ones(len(self.run_ts), dtype=bool)
+        if since:
+            mask &= self.run_ts >= _ts_number(normalize_ts(since))
+        if until:
+            mask &= self.run_ts <= _ts_number(normalize_ts(until, end=True))
+        return mask
+
+    def _code(self, vocab: np.ndarray, value) -> int:
+        found = np.flatnonzero(vocab == value)
+        return int(found[0]) if len(found) else -1
+
+    def score_mask(self, runs: np.ndarray, model=None, role=None) -> np.ndarray:
+        mask = runs[self.score_run]
+        if model:
+            mask &= self.score_model == self._code(self.models, model)
+        if role:
+            mask &= self.score_role == self._code(self.roles, role)
+        return mask
+
+    # ---------- consultas ----------
+    def scores_by_role_model(self, mask: np.ndarray, percentiles=(50, 90)) -> list[dict]:
+        """Judge score per (role, model): n, mean and percentiles of the valid scores."""
+        groups = self.score_role.astype(np.int64) * len(self.models) + self.score_model
+        rows = []
+        for group in np.unique(groups[mask]):
+            in_group = mask & (groups == group)
+            valid = in_group & ~self.score_failed
+            values = self.score[valid]
+            row = {
+                "role": str(self.roles[group // len(self.models)]),
+                "model": str(self.models[group % len(self.models)]),
+                "n": int(valid.sum()),
+                "failed": int(in_group.sum() - valid.sum()),
+                "mean": round(float(values.mean()), 2) if len(values) else None,
+            }
+            for p, value in zip(percentiles, np.percentile(values, percentiles) if len(values) else [None] * len(percentiles)):
+                row[f"p{p}"] = None if value is None else round(float(value), 2)
+            rows.append(row)
+        return sorted(rows, key=lambda r: (r["role"], r["model"]))
+
+    def triage_distribution(self, runs: np.ndarray) -> dict:
+        """Per specialty: weight histogram (0–10, the TriageBalancer scale), mean weight and selection rate."""
+        threshold = int(self.threshold)
+        mask = runs[self.triage_run] & ~np.isnan(self.triage_weight)
+        out = {}
+        for i, specialty in enumerate(SPECIALTIES):
+            weights = self.triage_weight[mask & (self.triage_specialty == i)]
+            counts = np.bincount(np.clip(weights.astype(np.int64), 0, MAX_WEIGHT), minlength=MAX_WEIGHT + 1)
+            out[specialty] = {
+                "n": int(len(weights)),
+                "mean": round(float(weights.mean()), 2) if len(weights) else None,
+                "histogram": {str(w): int(counts[w]) for w in range(MAX_WEIGHT + 1)},
+                "selected_rate": round(float((weights >= threshold).mean()), 3) if len(weights) else None,
+            }
+        return out
+
+    def fallback_rate(self, runs: np.ndarray) -> dict:
+        """How often triage selects nothing and every senior runs (overall and per triage source)."""
+        fallback = self.run_fallback[runs]
+        per_source = {}
+        for code in np.unique(self.run_source[runs]):
+            in_source = fallback[self.run_source[runs] == code]
+            per_source[str(self.sources[code])] = {"runs": int(len(in_source)),
+                                                   "rate": round(float(in_source.mean()), 3)}
+        return {
+            "runs": int(runs.sum()),
+            "fallbacks": int(fallback.sum()),
+            "rate": round(float(fallback.mean()), 3) if len(fallback) else None,
+            "per_triage_source": per_source,
+        }
+
+    def score_vs_latency(self, mask: np.ndarray) -> dict:
+        """Pearson/Spearman correlation of score and agent latency, mean score per latency quartile.
+
+        Cached answers are left out (their latency is not the model's).
+        """
+        valid = mask & ~self.score_failed & ~np.isnan(self.score_latency) & ~self.score_cached
+        scores, latency = self.score[valid].astype(np.float64), self.score_latency[valid].astype(np.float64)
+        out = {"n": int(len(scores)), "pearson": None, "spearman": None, "quartiles": []}
+        if len(scores) < 3 or scores.std() == 0 or latency.std() == 0:
+            return out
+        out["pearson"] = round(float(np.corrcoef(scores, latency)[0, 1]), 3)
+        ranks = lambda x: np.argsort(np.argsort(x))
+        out["spearman"] = round(float(np.corrcoef(ranks(scores), ranks(latency))[0, 1]), 3)
+        edges = np.quantile(latency, [0, 0.25, 0.5, 0.75, 1])
+        bucket = np.clip(np.searchsorted(edges, latency, side="right") - 1, 0, 3)
+        for q in range(4):
+            in_bucket = bucket == q
+            if in_bucket.any():
+                out["quartiles"].append({
+                    "latency_s": [round(float(edges[q]), 3), round(float(edges[q + 1]), 3)],
+                    "n": int(in_bucket.sum()),
+                    "mean_score": round(float(scores[in_bucket].mean()), 2),
+                })
+        return out
+
+
+def load_columns(results_dir, cache_path=None, rebuild: bool = False, threshold: int | None = None):
+    """(columns, built) — from the cache when it matches the current results, else rebuilt and saved."""
+    cache_path = Path(cache_path or os.getenv("ANALYTICS_CACHE") or DEFAULT_CACHE)
+    threshold = int(os.getenv("TRIAGE_THRESHOLD", "3")) if threshold is None else threshold
+    signature = f"{Path(results_dir).resolve()}|{source_signature(results_dir)}"
+    if not rebuild:
+        columns = ResultColumns.load(cache_path, signature, threshold)
+        if columns is not None:
+            return columns, False
+    columns = ResultColumns.build(results_dir, threshold)
+    columns.save(cache_path, signature)
+    return columns, True
+
+
+def run_queries(columns: ResultColumns, queries=QUERIES, since=None, until=None, model=None, role=None) -> dict:
+    runs = columns.run_mask(since, until)
+    if model:
+        # Para triagem e fallback o modelo é o da execução (meta.model)
+        run_runs = runs & (columns.run_model == columns._code(columns.models, model))
+    else:
+        run_runs = runs
+    scores = columns.score_mask(runs, model, role)
+    out = {}
+    if "scores" in queries:
+        out["scores"] = columns.scores_by_role_model(scores)
+    if "triage" in queries:
+        out["triage"] = columns.triage_distribution(run_runs)
+    if "fallback" in queries:
+        out["fallback"] = columns.fallback_rate(run_runs)
+    if "latency" in queries:
+        out["latency"] = columns.score_vs_latency(scores)
+    return out
+
+
+def _print_report(out: dict):
+    if "scores" in out:
+        print("== Score do juiz por role e modelo ==")
+        print(f"{'role':<28} {'modelo':<30} {'n':>5} {'falhas':>6} {'média':>6} {'p50':>6} {'p90':>6}")
+        for r in out["scores"]:
+            fmt = lambda v: "-" if v is None else f"{v:.1f}"
+            print(f"{r['role']:<28} {r['model'][:30]:<30} {r['n']:>5} {r['failed']:>6} "
+                  f"{fmt(r['mean']):>6} {fmt(r['p50']):>6} {fmt(r['p90']):>6}")
+    if "triage" in out:
+        print("== Pesos da triagem por especialidade ==")
+        for specialty, d in out["triage"].items():
+            hist = " ".join(f"{w}:{n}" for w, n in d["histogram"].items())
+            print(f"{specialty:<12} n={d['n']:<5} média={d['mean']}  selecionada={d['selected_rate']}  [{hist}]")
+    if "fallback" in out:
+        fb = out["fallback"]
+        print("== Fallback para todos os seniores ==")
+        print(f"{fb['fallbacks']}/{fb['runs']} execuções ({fb['rate']})  por origem da triagem: "
+              + ", ".join(f"{k}={v['rate']} (n={v['runs']})" for k, v in fb["per_triage_source"].items()))
+    if "latency" in out:
+        lat = out["latency"]
+        print("== Score vs. latência ==")
+        print(f"n={lat['n']}  pearson={lat['pearson']}  spearman={lat['spearman']}")
+        for q in lat["quartiles"]:
+            print(f"  {q['latency_s'][0]:.2f}–{q['latency_s'][1]:.2f}s  n={q['n']:<5} score médio={q['mean_score']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análise das métricas do juiz e das decisões de triagem")
+    parser.add_argument("query", nargs="?", default="all", choices=("all",) + QUERIES)
+    parser.add_argument("--results", type=Path, default=BASE_DIR / "Results", help="diretório de resultados")
+    parser.add_argument("--cache", type=Path, help="ficheiro .npz (ANALYTICS_CACHE)")
+    parser.add_argument("--rebuild", action="store_true", help="reconstrói a cache colunar")
+    parser.add_argument("--since", help="data/timestamp inicial (inclusive)")
+    parser.add_argument("--until", help="data/timestamp final (inclusive)")
+    parser.add_argument("--model")
+    parser.add_argument("--role")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    columns, built = load_columns(args.results, args.cache, args.rebuild)
+    loaded = time.perf_counter()
+    queries = QUERIES if args.query == "all" else (args.query,)
+    out = run_queries(columns, queries, args.since, args.until, args.model, args.role)
+    done = time.perf_counter()
+
+    out["timing_ms"] = {"build" if built else "load": round((loaded - started) * 1000, 2),
+                        "query": round((done - loaded) * 1000, 2)}
+    out["rows"] = {"runs": int(len(columns.run_ts)), "scores": int(len(columns.score))}
+    if args.json:
+        print(json.dumps(out, ensure_ascii=False, indent=2))
+    else:
+        _print_report(out)
+        t = out["timing_ms"]
+        print(f"{out['rows']['runs']} execuções, {out['rows']['scores']} avaliações; "
+              f"cache {'reconstruída' if built else 'carregada'} em {t.get('build', t.get('load'))} ms, "
+              f"consultas em {t['query']} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""LLM backends behind a single interface, selected with LLM_BACKEND.
+
+    gemini   google-genai through the pooled clients of Utils/llm_client.py (default).
+             GEMINI_BASE_URL points it at another endpoint (e.g. Utils/stub_llm.py).
+    openai   any OpenAI-compatible chat-completions API over httpx: OpenRouter by default
+             (OPENAI_BASE_URL, key from OPENROUTER_API_KEY / OPENAI_API_KEY, model from
+             OPENROUTER_MODEL and OPENROUTER_EVAL_MODEL for the judge).
+    stub     in-process fake with canned/replayed answers, latency and errors
+             (Utils/stub_llm.py); no network, no key.
+
+A backend only moves text: rate limiting, caching and parsing stay in Agents.py.
+Each backend exposes ``generate`` (sync), ``agenerate`` and ``astream`` (async), and
+reports the token usage of each call to the active tracing span (Utils/tracing.py).
+
+``context`` is the prefix shared by all the prompts of a report (the CASE CONTEXT of
+Utils/prompts.py). Backends send it first, so implicit provider prefix caching applies;
+the Gemini backend also stores it in an explicit context cache (Utils/context_cache.py).
+"""
+import asyncio
+import json
+import os
+import time
+
+from Utils.context_cache import get_context_caches, is_cache_rejection
+from Utils.llm_client import get_client, get_http_pool, get_async_http_pool, http_timeout
+from Utils.stub_llm import get_stub_responder, split_chunks, stream_delays
+from Utils.tracing import record_usage
+
+BACKENDS = ("gemini", "openai", "stub")
+GEMINI_MODEL = "gemini-2.5-flash"
+OPENROUTER_URL = "https://openrouter.ai/api/v1"
+
+
+class BackendError(RuntimeError):
+    """An HTTP error returned by a backend (``status`` holds the HTTP status code)."""
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+def with_context(prompt: str, context: str | None) -> str:
+    """Full prompt text: the shared context (if any) followed by the call-specific part."""
+    return context + prompt if context else prompt
+
+
+class LLMBackend:
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @property
+    def signature(self) -> str:
+        """Identifies backend + model in cache keys and in the manifest."""
+        return f"{self.name}:{self.model}"
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    def generate(self, prompt: str, config: dict | None = None, context: str | None = None) -> str:
+        raise NotImplementedError
+
+    async def agenerate(self, prompt: str, config: dict | None = None, context: str | None = None) -> str:
+        raise NotImplementedError
+
+    async def astream(self, prompt: str, config: dict | None = None, context: str | None = None):
+        """Async iterator over the text chunks of the answer."""
+        yield await self.agenerate(prompt, config, context)
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model: str = GEMINI_MODEL, api_key: str | None = None, client=None,
+                 base_url: str | None = None):
+        super().__init__(model)
+        self.api_key = api_key
+        self.client = client
+        self.base_url = base_url
+
+    @property
+    def signature(self) -> str:
+        # Só o modelo, para manter as assinaturas já gravadas no manifesto
+        return self.model
+
+    @property
+    def configured(self) -> bool:
+        return self.client is not None or bool(self.api_key)
+
+    def _client(self):
+        return self.client if self.client is not None else get_client(self.api_key, self.base_url)
+
+    @staticmethod
+    def _record_usage(usage):
+        if usage is None:
+            return
+        record_usage(
+            usage.prompt_token_count,
+            (usage.candidates_token_count or 0) + (getattr(usage, "thoughts_token_count", None) or 0),
+            usage.cached_content_token_count,
+        )
+
+    @staticmethod
+    def _with_cache(config, cache_name):
+        return {**(config or {}), "cached_content": cache_name}
+
+    def _request(self, client, prompt, config, context):
+        """(contents, config) with the context in an explicit cache when possible, else inline."""
+        cache_name = get_context_caches().get(client, self.model, context) if context else None
+        if cache_name is None:
+            return with_context(prompt, context), config
+        return prompt, self._with_cache(config, cache_name)
+
+    async def _arequest(self, client, prompt, config, context):
+        cache_name = await get_context_caches().aget(client, self.model, context) if context else None
+        if cache_name is None:
+            return with_context(prompt, context), config
+        return prompt, self._with_cache(config, cache_name)
+
+    def _retry_inline(self, error, prompt, contents, context):
+        """True when a call that used a context cache should be repeated with the context inline."""
+        if contents is prompt and context and is_cache_rejection(error):
+            # A cache expirou ou foi apagada do lado do servidor
+            get_context_caches().invalidate(self.model, context)
+            return True
+        return False
+
+    def generate(self, prompt, config=None, context=None):
+        client = self._client()
+        contents, call_config = self._request(client, prompt, config, context)
+        try:
+            response = client.models.generate_content(model=self.model, contents=contents, config=call_config)
+        except Exception as e:
+            if not self._retry_inline(e, prompt, contents, context):
+                raise
+            response = client.models.generate_content(
+                model=self.model, contents=with_context(prompt, context), config=config)
+        self._record_usage(response.usage_metadata)
+        return response.text
+
+    async def agenerate(self, prompt, config=None, context=None):
+        client = self._client()
+        contents, call_config = await self._arequest(client, prompt, config, context)
+        try:
+            response = await client.aio.models.generate_content(model=self.model, contents=contents, config=call_config)
+        except Exception as e:
+            if not self._retry_inline(e, prompt, contents, context):
+                raise
+            response = await client.aio.models.generate_content(
+                model=self.model, contents=with_context(prompt, context), config=config)
+        self._record_usage(response.usage_metadata)
+        return response.text
+
+    async def astream(self, prompt, config=None, context=None):
+        client = self._client()
+        contents, call_config = await self._arequest(client, prompt, config, context)
+        try:
+            stream = await client.aio.models.generate_content_stream(
+                model=self.model, contents=contents, config=call_config)
+        except Exception as e:
+            if not self._retry_inline(e, prompt, contents, context):
+                raise
+            stream = await client.aio.models.generate_content_stream(
+                model=self.model, contents=with_context(prompt, context), config=config)
+        usage = None
+        async for chunk in stream:
+            # usage_metadata é cumulativo; o último valor é o total da chamada
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                yield chunk.text
+        self._record_usage(usage)
+
+
+class OpenAICompatBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, model: str, base_url: str = OPENROUTER_URL, api_key: str | None = None):
+        super().__init__(model)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = http_timeout()
+
+    @property
+    def configured(self) -> bool:
+        # Um endpoint próprio (ex.: o stub local) pode não precisar de chave
+        return bool(self.api_key) or self.base_url != OPENROUTER_URL
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _body(self, prompt: str, config: dict | None, stream: bool = False, context: str | None = None) -> dict:
+        config = config or {}
+        # Contexto partilhado à cabeça: é o prefixo que o fornecedor reaproveita da cache
+        body = {"model": self.model, "messages": [{"role": "user", "content": with_context(prompt, context)}]}
+        for ours, theirs in (("temperature", "temperature"), ("top_p", "top_p"), ("top_k", "top_k"),
+                             ("max_output_tokens", "max_tokens")):
+            if ours in config:
+                body[theirs] = config[ours]
+        if config.get("response_schema"):
+            body["response_format"] = {"type": "json_schema",
+                                       "json_schema": {"name": "response", "schema": config["response_schema"]}}
+        elif config.get("response_mime_type") == "application/json":
+            body["response_format"] = {"type": "json_object"}
+        if stream:
+            body["stream"] = True
+            body["stream_options"] = {"include_usage": True}
+        return body
+
+    @staticmethod
+    def _check(response, text: str | None = None):
+        if response.status_code >= 400:
+            raise BackendError(f"HTTP {response.status_code}: {(text or response.text)[:300]}", response.status_code)
+
+    @staticmethod
+    def _record_usage(usage: dict | None):
+        if usage:
+            details = usage.get("prompt_tokens_details") or {}
+            record_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"), details.get("cached_tokens"))
+
+    def _content(self, data: dict) -> str:
+        self._record_usage(data.get("usage"))
+        choice = data["choices"][0]
+        return (choice.get("message") or {}).get("content") or choice.get("text") or ""
+
+    def generate(self, prompt, config=None, context=None):
+        response = get_http_pool(self.base_url).post(
+            f"{self.base_url}/chat/completions", json=self._body(prompt, config, context=context),
+            headers=self._headers(), timeout=self.timeout,
+        )
+        self._check(response)
+        return self._content(response.json())
+
+    async def agenerate(self, prompt, config=None, context=None):
+        response = await get_async_http_pool(self.base_url).post(
+            f"{self.base_url}/chat/completions", json=self._body(prompt, config, context=context),
+            headers=self._headers(), timeout=self.timeout,
+        )
+        self._check(response)
+        return self._content(response.json())
+
+    async def astream(self, prompt, config=None, context=None):
+        pool = get_async_http_pool(self.base_url)
+        async with pool.stream("POST", f"{self.base_url}/chat/completions",
+                               json=self._body(prompt, config, True, context),
+                               headers=self._headers(), timeout=self.timeout) as response:
+            if response.status_code >= 400:
+                self._check(response, (await response.aread()).decode("utf-8", errors="replace"))
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                # Com include_usage o último evento traz o usage (e choices vazio)
+                self._record_usage(event.get("usage"))
+                delta = (event.get("choices") or [{}])[0].get("delta") or {}
+                if delta.get("content"):
+                    yield delta["content"]
+
+
+class StubBackend(LLMBackend):
+    name = "stub"
+
+    def __init__(self, model: str = "stub", responder=None):
+        super().__init__(model)
+        self.responder = responder
+
+    def _plan(self, prompt, context=None):
+        responder = self.responder or get_stub_responder()
+        prompt = with_context(prompt, context)
+        latency, error, text = responder.plan(prompt)
+        if error is None:
+            # Estimativa ~4 caracteres por token, como o limitador; o prefixo já visto conta como cache
+            record_usage(len(prompt) // 4, len(text) // 4, responder.cached_prefix_tokens(prompt))
+        return latency, error, text
+
+    def generate(self, prompt, config=None, context=None):
+        latency, error, text = self._plan(prompt, context)
+        time.sleep(latency)
+        if error:
+            raise BackendError(str(error), error.status)
+        return text
+
+    async def agenerate(self, prompt, config=None, context=None):
+        latency, error, text = self._plan(prompt, context)
+        await asyncio.sleep(latency)
+        if error:
+            raise BackendError(str(error), error.status)
+        return text
+
+    async def astream(self, prompt, config=None, context=None):
+        latency, error, text = self._plan(prompt, context)
+        chunks = split_chunks(text)
+        delays = stream_delays(latency, len(chunks))
+        await asyncio.sleep(delays[0])
+        if error:
+            raise BackendError(str(error), error.status)
+        for chunk, delay in zip(chunks, [0.0] + delays[1:]):
+            await asyncio.sleep(delay)
+            yield chunk
+
+
+def backend_name() -> str:
+    name = os.getenv("LLM_BACKEND", "gemini").strip().lower()
+    if name not in BACKENDS:
+        print(f"LLM_BACKEND inválido: {name!r} (a usar 'gemini')")
+        name = "gemini"
+    return name
+
+
+def get_backend(purpose: str = "agent", model: str | None = None, name: str | None = None) -> LLMBackend:
+    """Backend configured for the agents (``purpose='agent'``) or for the judge (``'judge'``).
+
+    ``name`` picks another backend than LLM_BACKEND and ``model`` another model than the
+    default of that backend (both used by the model router, Utils/model_router.py).
+    """
+    name = name or backend_name()
+    judge = purpose == "judge"
+    if name == "stub":
+        return StubBackend(model or ("stub-judge" if judge else "stub"))
+    if name == "openai":
+        if model is None:
+            model = os.getenv("OPENROUTER_MODEL", "openai/gpt-oss-20b:free")
+            if judge:
+                model = os.getenv("OPENROUTER_EVAL_MODEL", model)
+        return OpenAICompatBackend(
+            model,
+            base_url=os.getenv("OPENAI_BASE_URL", OPENROUTER_URL),
+            api_key=os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY"),
+        )
+    if judge:
+        return GeminiBackend(
+            model or os.getenv("GEMINI_EVAL_MODEL", "gemini-2.0-flash"),
+            api_key=os.getenv("GENAI_API_KEY") or os.getenv("GOOGLE_API_KEY"),
+            base_url=os.getenv("GEMINI_BASE_URL"),
+        )
+    return GeminiBackend(
+        model or GEMINI_MODEL,
+        api_key=os.getenv("GENAI_API_KEY") or os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("GEMINI_BASE_URL"),
+    )
@@ -0,0 +1,426 @@
+"""Offline batch submission of a whole corpus, one pipeline stage at a time (``python Main.py --batch-api``).
+
+For overnight backfills latency does not matter, but per-request calls are bound by the
+RPM/TPM quota. Batch mode renders the prompts of one stage for every report into a JSONL
+job file, submits it through a batch provider, and writes the answers into the response
+cache (Utils/response_cache.py) under the exact key the live agent would look up. The next
+stage is rendered from those cached answers:
+
+    triage        TriageBalancer of every report (skipped when the local triage decides)
+    specialists   the specialists selected by each triage
+    mdt           MultidisciplinaryTeam, plus the judge requests of the specialist answers
+
+Finally Main runs the normal pipeline over the same reports, where every call is a cache
+hit; requests that failed in the batch fall back to live calls there.
+
+Providers (BATCH_PROVIDER, default auto = gemini with LLM_BACKEND=gemini, otherwise local):
+    gemini   Gemini Batch API (``client.batches``) with inlined requests, split into jobs of
+             at most BATCH_MAX_REQUESTS requests / BATCH_MAX_MB of prompt text; polled every
+             BATCH_POLL_SECONDS. Requests routed to another backend run locally.
+    local    stand-in that runs the job file through the configured backends, sharing the
+             global rate limiter, with BATCH_LOCAL_CONCURRENCY calls at a time. The OpenAI-
+             compatible backend (OpenRouter) has no batch interface, so it always uses this.
+
+Every run lives in its own directory (``Results/batches/<name>``): ``state.json`` records
+each phase (rendered → submitted → ingested) and the provider job names, next to the
+``<phase>.requests.jsonl`` and ``<phase>.results.jsonl`` files. Running the same command
+again resumes where it stopped: submitted jobs are polled instead of resubmitted and the
+local provider skips the requests that already have a result line.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from Utils.Agents import strip_triple_backticks, _parse_evaluation, _parse_batch_evaluation, \
+    _eval_prompt_parts, _batch_eval_prompt_parts
+from Utils.backends import with_context
+from Utils.model_router import get_model_router
+from Utils.resilience import get_call_policy
+from Utils.response_cache import get_response_cache, make_key
+
+PHASES = ("triage", "specialists", "mdt")
+PROVIDERS = ("auto", "local", "gemini")
+
+# Estados finais de um job do Gemini Batch API
+GEMINI_DONE = ("JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED", "JOB_STATE_FAILED",
+               "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED")
+
+
+def read_jsonl(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    rows = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rows.append(json.loads(line))
+        except json.JSONDecodeError:
+            # Última linha cortada por uma interrupção a meio da escrita
+            continue
+    return rows
+
+
+def write_jsonl(path: Path, rows: list[dict]):
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+# =========================
+# Pedidos
+# =========================
+def cached_answer(agent):
+    """Resposta do agente já na cache de respostas (ou None), sem chamar o modelo."""
+    context, instructions = agent.build_prompt_parts()
+    return agent._cache_lookup(with_context(instructions, context))[2]
+
+
+def agent_request(agent) -> dict | None:
+    """Linha do ficheiro de job para o prompt do agente, ou None se a resposta já está em cache."""
+    context, instructions = agent.build_prompt_parts()
+    cache, key, cached = agent._cache_lookup(with_context(instructions, context))
+    if cache is None or cached is not None:
+        return None
+    return {
+        "custom_id": key,
+        "role": agent.role,
+        "route": agent.role,
+        "backend": agent.backend.name,
+        "model": agent.backend.signature,
+        "api_model": agent.backend.model,
+        "config": agent.generation_config,
+        "context": context,
+        "instructions": instructions,
+        "check": "text",
+    }
+
+
+def judge_requests(medical_report: str, outputs: dict, batch: bool) -> list[dict]:
+    """Pedidos do juiz para as respostas `outputs` de um relatório (um só, ou um por agente)."""
+    cache = get_response_cache()
+    backend = get_model_router().primary("Judge")
+    if cache is None or not outputs or not backend.configured:
+        return []
+    if batch:
+        jobs = [("batch", _batch_eval_prompt_parts(medical_report, outputs),
+                 {"response_mime_type": "application/json"}, "judge_batch")]
+    else:
+        jobs = [(name, _eval_prompt_parts(medical_report, name, output), None, "judge")
+                for name, output in outputs.items()]
+    rows = []
+    for name, (context, instructions), config, check in jobs:
+        key = make_key(f"Judge:{name}", with_context(instructions, context), backend.signature)
+        cached = cache.get(key)
+        if cached is not None and (check == "judge" or len(_parse_batch_evaluation(cached, outputs)) == len(outputs)):
+            continue
+        rows.append({
+            "custom_id": key,
+            "role": f"Judge:{name}",
+            "route": "Judge",
+            "backend": backend.name,
+            "model": backend.signature,
+            "api_model": backend.model,
+            "config": config,
+            "context": context,
+            "instructions": instructions,
+            "check": check,
+            "agents": sorted(outputs) if check == "judge_batch" else [name],
+        })
+    return rows
+
+
+def cache_value(row: dict, raw: str) -> str | None:
+    """Texto a guardar na cache para a resposta `raw` (o mesmo que a chamada ao vivo guardaria), ou None."""
+    if row["check"] == "text":
+        return strip_triple_backticks(raw) or None
+    if row["check"] == "judge":
+        return raw if _parse_evaluation(raw).get("rating") != "parse_error" else None
+    return raw if len(_parse_batch_evaluation(raw, row["agents"])) == len(row["agents"]) else None
+
+
+# =========================
+# Providers
+# =========================
+class LocalBatchProvider:
+    """Stand-in for a provider batch API: runs the job file through the configured backends."""
+
+    name = "local"
+
+    def __init__(self, concurrency: int | None = None):
+        self.concurrency = max(1, concurrency or int(os.getenv("BATCH_LOCAL_CONCURRENCY", "8")))
+
+    def supports(self, row: dict) -> bool:
+        return True
+
+    async def submit(self, rows: list[dict], display_name: str) -> list[str]:
+        # Não há nada para submeter: os pedidos correm no collect()
+        return ["local"]
+
+    async def _answer(self, row: dict) -> dict:
+        backend = get_model_router().primary(row["route"])
+        if backend.signature != row["model"]:
+            return {"custom_id": row["custom_id"], "error": f"modelo mudou ({row['model']} → {backend.signature})"}
+        prompt = with_context(row["instructions"], row["context"])
+        try:
+            raw = await get_call_policy().acall(
+                lambda: backend.agenerate(row["instructions"], row["config"], row["context"]),
+                (backend.signature, row["role"]), prompt)
+            return {"custom_id": row["custom_id"], "text": raw}
+        except Exception as e:
+            return {"custom_id": row["custom_id"], "error": f"{type(e).__name__}: {e}"}
+
+    async def collect(self, jobs: list[str], rows: list[dict], results_path: Path):
+        """Corre os pedidos sem linha em `results_path`, acrescentando cada resultado assim que chega."""
+        # Pedidos que falharam numa execução anterior voltam a ser tentados
+        done = {r["custom_id"] for r in read_jsonl(results_path) if r.get("text")}
+        todo = [row for row in rows if row["custom_id"] not in done]
+        if done:
+            print(f"   {len(done)} pedidos já respondidos, {len(todo)} por correr")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(row):
+            async with semaphore:
+                result = await self._answer(row)
+            # Uma linha por resultado: uma interrupção perde no máximo os pedidos em curso
+            with results_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+        await asyncio.gather(*(one(row) for row in todo))
+
+
+class GeminiBatchProvider:
+    """Gemini Batch API with inlined requests (one job per model and chunk)."""
+
+    name = "gemini"
+
+    def __init__(self, max_requests: int | None = None, max_bytes: int | None = None,
+                 poll_seconds: float | None = None):
+        self.max_requests = max(1, max_requests or int(os.getenv("BATCH_MAX_REQUESTS", "500")))
+        self.max_bytes = max_bytes or int(float(os.getenv("BATCH_MAX_MB", "15")) * 1024 * 1024)
+        self.poll_seconds = poll_seconds if poll_seconds is not None else float(os.getenv("BATCH_POLL_SECONDS", "60"))
+
+    def supports(self, row: dict) -> bool:
+        return row["backend"] == "gemini"
+
+    @staticmethod
+    def _client(row: dict):
+        backend = get_model_router().primary(row["route"])
+        return backend._client()
+
+    def _chunks(self, rows: list[dict]):
+        by_model = {}
+        for row in rows:
+            by_model.setdefault(row["api_model"], []).append(row)
+        for model, model_rows in by_model.items():
+            chunk, size = [], 0
+            for row in model_rows:
+                row_size = len((row["context"] or "").encode("utf-8")) + len(row["instructions"].encode("utf-8"))
+                if chunk and (len(chunk) >= self.max_requests or size + row_size > self.max_bytes):
+                    yield model, chunk
+                    chunk, size = [], 0
+                chunk.append(row)
+                size += row_size
+            if chunk:
+                yield model, chunk
+
+    async def submit(self, rows: list[dict], display_name: str) -> list[str]:
+        jobs = []
+        for index, (model, chunk) in enumerate(self._chunks(rows)):
+            client = self._client(chunk[0])
+            # O contexto do relatório vai inline: as caches explícitas expiram antes de o job correr
+            src = [{
+                "contents": with_context(row["instructions"], row["context"]),
+                "config": row["config"] or None,
+                "metadata": {"key": row["custom_id"]},
+            } for row in chunk]
+            job = await client.aio.batches.create(
+                model=model, src=src, config={"display_name": f"{display_name}-{index}"})
+            print(f"   Job {job.name} submetido ({len(chunk)} pedidos, {model})")
+            jobs.append(job.name)
+        return jobs
+
+    @staticmethod
+    def _state(job) -> str:
+        state = job.state
+        return getattr(state, "name", None) or str(state)
+
+    @staticmethod
+    def _file_results(data: bytes) -> list[dict]:
+        # Formato do ficheiro de saída: {"key": ..., "response": {...}} ou {"key": ..., "error": {...}}
+        results = []
+        for line in data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            key = item.get("key") or (item.get("metadata") or {}).get("key")
+            try:
+                parts = item["response"]["candidates"][0]["content"]["parts"]
+                results.append({"custom_id": key, "text": "".join(p.get("text", "") for p in parts)})
+            except (KeyError, IndexError, TypeError):
+                results.append({"custom_id": key, "error": json.dumps(item.get("error") or item.get("response"))[:500]})
+        return results
+
+    async def _results(self, client, job, rows: list[dict]) -> list[dict]:
+        dest = job.dest
+        if dest is not None and dest.file_name:
+            return self._file_results(await client.aio.files.download(file=dest.file_name))
+        items = (dest.inlined_responses if dest is not None else None) or []
+        results = []
+        for index, item in enumerate(items):
+            key = (item.metadata or {}).get("key")
+            if key is None and index < len(rows):
+                # Sem metadata, as respostas vêm pela ordem dos pedidos
+                key = rows[index]["custom_id"]
+            if item.error is not None or item.response is None:
+                results.append({"custom_id": key, "error": str(item.error or "sem resposta")})
+            else:
+                try:
+                    results.append({"custom_id": key, "text": item.response.text})
+                except Exception as e:
+                    results.append({"custom_id": key, "error": f"{type(e).__name__}: {e}"})
+        return results
+
+    async def collect(self, jobs: list[str], rows: list[dict], results_path: Path):
+        """Espera que os jobs terminem (podem demorar horas) e escreve os resultados em `results_path`."""
+        client = self._client(rows[0]) if rows else None
+        pending = list(jobs)
+        results = []
+        while pending:
+            for name in list(pending):
+                job = await client.aio.batches.get(name=name)
+                state = self._state(job)
+                if state not in GEMINI_DONE:
+                    continue
+                pending.remove(name)
+                found = await self._results(client, job, rows)
+                results.extend(found)
+                print(f"   Job {name}: {state} ({len(found)} respostas)")
+            if pending:
+                print(f"   {len(pending)} jobs em curso; nova verificação em {self.poll_seconds:.0f}s")
+                await asyncio.sleep(self.poll_seconds)
+        write_jsonl(results_path, results)
+
+
+def provider_name(name: str | None = None, backend: str | None = None) -> str:
+    name = (name or os.getenv("BATCH_PROVIDER", "auto")).strip().lower()
+    if name not in PROVIDERS:
+        print(f"BATCH_PROVIDER inválido: {name!r} (a usar 'auto')")
+        name = "auto"
+    if name == "auto":
+        name = "gemini" if backend == "gemini" else "local"
+    return name
+
+
+def get_batch_provider(name: str | None = None, backend: str | None = None):
+    return GeminiBatchProvider() if provider_name(name, backend) == "gemini" else LocalBatchProvider()
+
+
+# =========================
+# Estado e fases
+# =========================
+class BatchRun:
+    """State directory of one batch run; each phase goes rendered → submitted → ingested."""
+
+    def __init__(self, directory, provider, files: list[str] | None = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.provider = provider
+        self.local = LocalBatchProvider()
+        self.state_path = self.directory / "state.json"
+        if self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        else:
+            self.state = {
+                "name": self.directory.name,
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "provider": provider.name,
+                "files": files or [],
+                "phases": {},
+            }
+            self.save()
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.state["phases"])
+
+    def save(self):
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp.write_text(json.dumps(self.state, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    def phase(self, name: str) -> dict:
+        return self.state["phases"].setdefault(name, {"status": "new"})
+
+    def _set(self, name: str, **fields):
+        self.phase(name).update(fields, updated=datetime.now().isoformat(timespec="seconds"))
+        self.save()
+
+    async def run_phase(self, name: str, render) -> dict:
+        """Renderiza (`render()` → pedidos), submete, espera e ingere uma fase; retoma do estado gravado."""
+        phase = self.phase(name)
+        if phase["status"] == "ingested":
+            print(f" Fase {name}: já ingerida ({phase['succeeded']} respostas, {phase['failed']} falhadas)")
+            return phase
+        requests_path = self.directory / f"{name}.requests.jsonl"
+        results_path = self.directory / f"{name}.results.jsonl"
+        local_path = self.directory / f"{name}.local.results.jsonl"
+
+        if phase["status"] == "new":
+            rows = list({row["custom_id"]: row for row in render()}.values())
+            write_jsonl(requests_path, rows)
+            results_path.unlink(missing_ok=True)
+            local_path.unlink(missing_ok=True)
+            self._set(name, status="rendered", requests=len(rows))
+        rows = read_jsonl(requests_path)
+        print(f" Fase {name}: {len(rows)} pedidos em {requests_path.name}")
+
+        remote = [row for row in rows if self.provider.supports(row)]
+        local = [row for row in rows if not self.provider.supports(row)]
+        started = time.perf_counter()
+        if phase["status"] == "rendered":
+            jobs = await self.provider.submit(remote, f"{self.directory.name}-{name}") if remote else []
+            self._set(name, status="submitted", provider=self.provider.name, jobs=jobs)
+        else:
+            print(f"   A retomar {len(phase.get('jobs', []))} jobs ({phase.get('provider')})")
+
+        if remote:
+            await self.provider.collect(phase["jobs"], remote, results_path)
+        if local:
+            # Pedidos encaminhados para um backend sem batch API (ex.: OpenRouter)
+            print(f"   {len(local)} pedidos sem batch no fornecedor: a correr localmente")
+            await self.local.collect(["local"], local, local_path)
+
+        succeeded, failed = self.ingest(rows, read_jsonl(results_path) + read_jsonl(local_path))
+        self._set(name, status="ingested", succeeded=succeeded, failed=failed,
+                  seconds=round(phase.get("seconds", 0) + time.perf_counter() - started, 1))
+        print(f"   Ingeridas {succeeded} respostas na cache"
+              + (f"; {failed} falharam (serão pedidas ao vivo)" if failed else ""))
+        return phase
+
+    @staticmethod
+    def ingest(rows: list[dict], results: list[dict]) -> tuple[int, int]:
+        """Guarda na cache de respostas as respostas válidas; devolve (guardadas, falhadas)."""
+        cache = get_response_cache()
+        by_id = {row["custom_id"]: row for row in rows}
+        stored = set()
+        for result in results:
+            row = by_id.get(result.get("custom_id"))
+            text = result.get("text")
+            if row is None or not text or row["custom_id"] in stored:
+                continue
+            value = cache_value(row, text)
+            if value is not None:
+                cache.put(row["custom_id"], value, role=row["role"], model=row["model"])
+                stored.add(row["custom_id"])
+        return len(stored), len(rows) - len(stored)
+
+    def summary(self) -> dict:
+        return {name: {k: v for k, v in phase.items() if k != "updated"}
+                for name, phase in self.state["phases"].items()}
@@ -0,0 +1,274 @@
+"""Explicit Gemini context caches for the report prefix shared by a patient's prompts.
+
+Every specialist, triage and judge prompt of a report starts with the same CASE CONTEXT
+block (Utils/prompts.py). With an explicit cache that block is uploaded once as a
+``CachedContent`` and later calls only send their role instructions plus the cache name;
+the cached tokens are billed at the reduced rate and reported by the API in
+``cached_content_token_count``.
+
+One cache per (model, context), created on the first call that needs it and shared by all
+the others (concurrent callers wait for the same creation). Each cache remembers the reports
+(their ``ReportTrace``) that used it; when the pipeline releases a report (``arelease``, after
+its judge evaluations) the caches no other report is using are deleted instead of being
+billed until the TTL runs out. Expired entries are dropped from the registry as new ones
+are stored, so a long-running ``--serve``/``--watch`` process does not accumulate them.
+Contexts below the API minimum are sent inline instead. A model whose cache creation fails
+because it does not support explicit caching is remembered and served inline from then on;
+any other creation failure only sends that one request inline.
+
+Settings come from the environment:
+    GEMINI_CONTEXT_CACHE     "off" sends the context inline on every call (default on)
+    GEMINI_CACHE_TTL         lifetime of each cache in seconds (default 600)
+    GEMINI_CACHE_MIN_TOKENS  smallest context worth caching, estimated at ~4 chars/token
+                             (default 1024, the API minimum for the 2.5 models)
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+from Utils.tracing import current_trace
+
+# Não usar uma cache que expira durante o pedido
+EXPIRY_MARGIN_SECONDS = 30
+
+
+def _status(error: Exception) -> int | None:
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _mentions_cache(error: Exception) -> bool:
+    message = str(error).lower().replace(" ", "").replace("_", "")
+    return "cachedcontent" in message or "contextcach" in message
+
+
+def is_cache_rejection(error: Exception) -> bool:
+    """The cache named in a request is gone (expired or deleted): 404, or a 4xx about the cached content.
+
+    Other 4xx errors (quota, permissions, a malformed request) are not about the cache and
+    must not invalidate it.
+    """
+    status = _status(error)
+    if status is None or not 400 <= status < 500 or status == 429:
+        return False
+    return status == 404 or _mentions_cache(error)
+
+
+def is_caching_unsupported(error: Exception) -> bool:
+    """A cache creation error saying the model/endpoint does not do explicit caching at all."""
+    status = _status(error)
+    if status == 404:
+        return True
+    message = str(error).lower()
+    return status == 400 and "cach" in message and any(
+        phrase in message for phrase in ("not supported", "unsupported", "does not support", "not available"))
+
+
+class ContextCacheRegistry:
+    def __init__(self, ttl_seconds: int = 600, min_tokens: int = 1024, enabled: bool = True):
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.entries = {}       # (model, sha256 do contexto) -> {name, expires, client, owners}
+        self.key_locks = {}     # criação síncrona: uma por chave
+        self.pending = {}       # (id(loop), chave) -> Task da criação assíncrona
+        self.unsupported = set()
+        self.created = 0
+        self.reused = 0
+        self.failed = 0
+        self.inline = 0
+        self.deleted = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl_seconds=int(os.getenv("GEMINI_CACHE_TTL", "600")),
+            min_tokens=int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "1024")),
+            enabled=os.getenv("GEMINI_CONTEXT_CACHE", "on").strip().lower() not in ("off", "0", "false", "no"),
+        )
+
+    @staticmethod
+    def _key(model: str, context: str) -> tuple[str, str]:
+        return model, hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+    def _eligible(self, model: str, context: str) -> bool:
+        ok = self.enabled and model not in self.unsupported and len(context) // 4 >= self.min_tokens
+        if not ok:
+            with self.lock:
+                self.inline += 1
+        return ok
+
+    def _lookup(self, key, owner) -> str | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["expires"] - time.monotonic() > EXPIRY_MARGIN_SECONDS:
+                self.reused += 1
+                if owner is not None:
+                    entry["owners"].add(owner)
+                return entry["name"]
+            return None
+
+    def _own(self, key, owner):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and owner is not None:
+                entry["owners"].add(owner)
+
+    def _create_config(self, context: str):
+        from google.genai import types
+        return types.CreateCachedContentConfig(
+            contents=[context], ttl=f"{self.ttl_seconds}s", display_name="mdt-case-context",
+        )
+
+    def _store(self, key, cached, client) -> str:
+        now = time.monotonic()
+        with self.lock:
+            self.created += 1
+            self._prune(now)
+            self.entries[key] = {"name": cached.name, "expires": now + self.ttl_seconds, "client": client,
+                                 "owners": set()}
+        return cached.name
+
+    def _prune(self, now: float):
+        # Chamado com self.lock: caches já expiradas no servidor e locks de chaves sem cache
+        for key in [k for k, entry in self.entries.items() if entry["expires"] <= now]:
+            del self.entries[key]
+        for key in [k for k, lock in self.key_locks.items() if k not in self.entries and not lock.locked()]:
+            del self.key_locks[key]
+
+    def _failed(self, model: str, error: Exception):
+        with self.lock:
+            self.failed += 1
+            first = model not in self.unsupported
+            # Só um erro que diz que o modelo não suporta caches desliga-as de vez; os outros
+            # (quota, permissões, contexto pequeno demais...) mandam só este pedido inline
+            permanent = is_caching_unsupported(error)
+            if permanent:
+                self.unsupported.add(model)
+        if permanent and first:
+            print(f"Cache de contexto não suportada para {model} ({error}); o relatório segue inline")
+        elif not permanent:
+            print(f"Falha ao criar a cache de contexto para {model} ({error}); este pedido segue inline")
+
+    def get(self, client, model: str, context: str) -> str | None:
+        """Name of the cache holding ``context`` for ``model`` (creating it), or None to send it inline."""
+        if not self._eligible(model, context):
+            return None
+        key, owner = self._key(model, context), current_trace()
+        name = self._lookup(key, owner)
+        if name is not None:
+            return name
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            name = self._lookup(key, owner)
+            if name is not None:
+                return name
+            try:
+                cached = client.caches.create(model=model, config=self._create_config(context))
+            except Exception as e:
+                self._failed(model, e)
+                return None
+            name = self._store(key, cached, client)
+        self._own(key, owner)
+        return name
+
+    async def aget(self, client, model: str, context: str) -> str | None:
+        """Async counterpart of get(); concurrent callers share one creation."""
+        if not self._eligible(model, context):
+            return None
+        key, owner = self._key(model, context), current_trace()
+        name = self._lookup(key, owner)
+        if name is not None:
+            return name
+        pending_key = (id(asyncio.get_running_loop()), key)
+        task = self.pending.get(pending_key)
+        if task is None:
+            task = asyncio.ensure_future(self._acreate(client, model, context, key))
+            self.pending[pending_key] = task
+            task.add_done_callback(lambda _: self.pending.pop(pending_key, None))
+        else:
+            with self.lock:
+                self.reused += 1
+        name = await asyncio.shield(task)
+        # Quem esperou pela criação de outro pedido também passa a usar a cache
+        self._own(key, owner)
+        return name
+
+    async def _acreate(self, client, model: str, context: str, key) -> str | None:
+        try:
+            cached = await client.aio.caches.create(model=model, config=self._create_config(context))
+        except Exception as e:
+            self._failed(model, e)
+            return None
+        return self._store(key, cached, client)
+
+    def invalidate(self, model: str, context: str):
+        """Forget the cache for ``context`` (e.g. it expired or was deleted server-side)."""
+        with self.lock:
+            self.entries.pop(self._key(model, context), None)
+
+    def _release(self, owner) -> list[tuple[str, object]]:
+        """Drop ``owner`` from every cache; returns (name, client) of the caches nobody uses any more."""
+        doomed = []
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if owner not in entry["owners"]:
+                    continue
+                entry["owners"].discard(owner)
+                if not entry["owners"]:
+                    del self.entries[key]
+                    self.key_locks.pop(key, None)
+                    doomed.append((entry["name"], entry["client"]))
+        return doomed
+
+    async def arelease(self, owner):
+        """The report traced by ``owner`` is done: delete the caches only it was using.
+
+        A failed deletion is not an error: the cache still expires with its TTL.
+        """
+        if owner is None:
+            return
+        for name, client in self._release(owner):
+            try:
+                await client.aio.caches.delete(name=name)
+            except Exception as e:
+                print(f"Não foi possível apagar a cache de contexto {name} ({e}); expira com o TTL")
+                continue
+            with self.lock:
+                self.deleted += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "created": self.created,
+                "reused": self.reused,
+                "failed": self.failed,
+                "inline": self.inline,
+                "deleted": self.deleted,
+                "live": sum(1 for entry in self.entries.values() if entry["expires"] > time.monotonic()),
+                "unsupported_models": sorted(self.unsupported),
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_context_caches() -> ContextCacheRegistry:
+    """Process-wide registry (created on first use from the environment)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ContextCacheRegistry.from_env()
+        return _registry
+
+
+def set_context_caches(registry: ContextCacheRegistry | None):
+    global _registry
+    with _registry_lock:
+        _registry = registry
@@ -0,0 +1,132 @@
+"""Background queue for the LLM judge (evaluate_with_gemini).
+
+Judging a specialist's answer does not influence the diagnosis, so it should not delay
+the MultidisciplinaryTeam step. Specialists submit their output here as soon as they
+finish; a small pool of asyncio workers runs the evaluations while the pipeline moves
+on, and the metrics are merged into the result JSON when they arrive.
+
+With JUDGE_BATCH enabled (the default) a job holds every specialist answer of a report
+and is graded in a single evaluator call; JUDGE_BATCH=0 grades one answer per call.
+"""
+import asyncio
+import os
+import time
+
+from Utils.Agents import aevaluate_with_gemini, aevaluate_batch_with_gemini
+from Utils.tracing import current_trace, use_trace
+
+
+def judge_batch_enabled() -> bool:
+    return os.getenv("JUDGE_BATCH", "1").strip().lower() not in ("0", "false", "no")
+
+
+class EvaluationQueue:
+    def __init__(self, workers: int | None = None, batch: bool | None = None):
+        self.workers = max(1, workers or int(os.getenv("EVAL_WORKERS", "4")))
+        if batch is None:
+            batch = judge_batch_enabled()
+        self.batch = batch
+        self.queue = None
+        self._worker_tasks = []
+        self._followups = set()
+
+        self.submitted = 0
+        self.completed = 0
+        self.in_progress = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.followup_errors = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        # Criado no primeiro submit para ficar associado ao event loop em uso
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, medical_report: str, outputs: dict) -> asyncio.Future:
+        """Queue the evaluation of ``outputs`` ({agent_name: answer}).
+
+        The returned future resolves to {agent_name: metric dict}.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        # O trace do relatório segue com o job para os spans do juiz lhe ficarem associados
+        self.queue.put_nowait((time.perf_counter(), medical_report, dict(outputs), future, current_trace()))
+        self.submitted += 1
+        return future
+
+    def track(self, coro):
+        """Run a follow-up (e.g. merging metrics into a file) that drain() must wait for."""
+        task = asyncio.create_task(self._guarded(coro))
+        self._followups.add(task)
+        task.add_done_callback(self._followups.discard)
+        return task
+
+    async def _guarded(self, coro):
+        # Uma falha ao juntar as métricas (ex.: base de dados bloqueada) afeta só esse relatório
+        try:
+            return await coro
+        except Exception as e:
+            self.followup_errors += 1
+            print(f"Falha ao guardar as avaliações de um relatório: {type(e).__name__}: {e}")
+
+    async def _worker(self):
+        while True:
+            submitted_at, medical_report, outputs, future, trace = await self.queue.get()
+            if future.cancelled():
+                # O relatório falhou depois de pedir a avaliação: não há resultado onde a juntar
+                self.dropped += 1
+                self.queue.task_done()
+                continue
+            self.in_progress += 1
+            try:
+                with use_trace(trace):
+                    if self.batch and len(outputs) > 1:
+                        metrics = await aevaluate_batch_with_gemini(medical_report, outputs)
+                    else:
+                        metrics = {}
+                        for agent_name, agent_output in outputs.items():
+                            metrics[agent_name] = await aevaluate_with_gemini(medical_report, agent_name, agent_output)
+            except Exception as e:
+                metrics = {
+                    name: {"score": 0, "rating": "error", "explanation": f"Evaluation queue error: {e}"}
+                    for name in outputs
+                }
+            finally:
+                self.in_progress -= 1
+            lag = time.perf_counter() - submitted_at
+            self.completed += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if not future.done():
+                future.set_result(metrics)
+            self.queue.task_done()
+
+    async def drain(self):
+        """Wait until every queued evaluation and follow-up has finished."""
+        if self.queue is not None:
+            await self.queue.join()
+        while self._followups:
+            await asyncio.gather(*list(self._followups), return_exceptions=True)
+
+    async def close(self):
+        try:
+            await self.drain()
+        finally:
+            for task in self._worker_tasks:
+                task.cancel()
+            await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+            self._worker_tasks = []
+            self.queue = None
+
+    def stats(self) -> dict:
+        return {
+            "depth": (self.queue.qsize() if self.queue is not None else 0) + self.in_progress,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "avg_lag_seconds": round(self.total_lag / self.completed, 3) if self.completed else 0.0,
+            "max_lag_seconds": round(self.max_lag, 3),
+            "followup_errors": self.followup_errors,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,222 @@
+"""Compact structured handoff from the specialists to the MultidisciplinaryTeam.
+
+The MDT used to receive the raw concatenation of the senior and novice answers of each
+specialty, up to eight verbose texts. Now every specialist answers with a JSON object
+constrained by ``HANDOFF_SCHEMA`` (``response_schema``):
+
+    {"assessment": "<the full answer, in the role's output format>",
+     "findings": {"key_findings": [...], "differentials": [{"diagnosis", "likelihood", "evidence"}],
+                  "risk_level": "High|Medium|Low", "red_flags": [...], "recommendations": [...]}}
+
+The assessment is kept in the result JSON for the audit record (and is what the judge
+scores). The findings of the senior and novice of a specialty are merged and deduplicated
+(``merge_findings``), and that compact text is what the MDT prompt receives. An answer
+that is not a valid handoff object reaches the MDT in full, as before.
+
+MDT_HANDOFF=full restores the old behaviour (no schema, full texts to the MDT).
+"""
+import json
+import os
+import re
+
+MODES = ("structured", "full")
+
+LIKELIHOOD = ("High", "Medium", "Low")
+_RANK = {"high": 3, "medium": 2, "low": 1}
+
+FINDINGS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "key_findings": {"type": "array", "items": {"type": "string"}, "maxItems": 6},
+        "differentials": {
+            "type": "array",
+            "maxItems": 3,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "diagnosis": {"type": "string"},
+                    "likelihood": {"type": "string", "enum": list(LIKELIHOOD)},
+                    "evidence": {"type": "string"},
+                },
+                "required": ["diagnosis", "likelihood", "evidence"],
+            },
+        },
+        "risk_level": {"type": "string", "enum": list(LIKELIHOOD)},
+        "red_flags": {"type": "array", "items": {"type": "string"}},
+        "recommendations": {"type": "array", "items": {"type": "string"}, "maxItems": 4},
+    },
+    "required": ["key_findings", "differentials", "risk_level", "red_flags", "recommendations"],
+}
+
+HANDOFF_SCHEMA = {
+    "type": "object",
+    "properties": {"assessment": {"type": "string"}, "findings": FINDINGS_SCHEMA},
+    "required": ["assessment", "findings"],
+}
+
+# Variável do template da equipa -> agentes cuja resposta alimenta essa variável
+TEAM_INPUTS = {
+    "cardiologist_report": ("Senior_Cardiologist", "Novice_Cardiologist"),
+    "psychologist_report": ("Senior_Psychologist", "Novice_Psychologist"),
+    "pulmonologist_report": ("Senior_Pulmonologist", "Novice_Pulmonologist"),
+    "general_practitioner_report": ("Senior_General_Practitioner", "Novice_General_Practitioner"),
+}
+
+
+def handoff_mode() -> str:
+    mode = os.getenv("MDT_HANDOFF", "structured").strip().lower()
+    return mode if mode in MODES else "structured"
+
+
+def structured_handoff() -> bool:
+    return handoff_mode() == "structured"
+
+
+def _strings(value) -> list[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def _likelihood(value) -> str:
+    value = str(value or "").strip().capitalize()
+    return value if value in LIKELIHOOD else "Low"
+
+
+def normalize_findings(findings: dict) -> dict:
+    differentials = []
+    for item in findings.get("differentials") or []:
+        if isinstance(item, dict) and str(item.get("diagnosis") or "").strip():
+            differentials.append({
+                "diagnosis": str(item["diagnosis"]).strip(),
+                "likelihood": _likelihood(item.get("likelihood")),
+                "evidence": str(item.get("evidence") or "").strip(),
+            })
+    return {
+        "key_findings": _strings(findings.get("key_findings")),
+        "differentials": differentials,
+        "risk_level": _likelihood(findings.get("risk_level")),
+        "red_flags": _strings(findings.get("red_flags")),
+        "recommendations": _strings(findings.get("recommendations")),
+    }
+
+
+def parse_handoff(raw: str) -> tuple[str, dict | None]:
+    """(assessment text, findings) from a specialist answer; (raw, None) if it is not a handoff object."""
+    if not isinstance(raw, str):
+        return raw, None
+    try:
+        obj = json.loads(raw)
+    except ValueError:
+        m = re.search(r"(\{.*\})", raw, re.S)
+        try:
+            obj = json.loads(m.group(1)) if m else None
+        except ValueError:
+            obj = None
+    if not isinstance(obj, dict) or not isinstance(obj.get("assessment"), str) or not isinstance(obj.get("findings"), dict):
+        return raw, None
+    return obj["assessment"].strip(), normalize_findings(obj["findings"])
+
+
+def _norm(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def dedupe(items: list[str]) -> list[str]:
+    """Drop repeated items, ignoring case/punctuation; an item contained in another keeps the longer one."""
+    kept: list[tuple[str, str]] = []
+    for item in items:
+        key = _norm(item)
+        if not key:
+            continue
+        for i, (other_key, _) in enumerate(kept):
+            if key in other_key:
+                break
+            if other_key in key:
+                kept[i] = (key, item)
+                break
+        else:
+            kept.append((key, item))
+    return [item for _, item in kept]
+
+
+def merge_findings(findings: list[dict]) -> dict:
+    """One findings object for a specialty out of its agents' findings (senior + novice)."""
+    differentials = {}
+    for f in findings:
+        for d in f["differentials"]:
+            key = _norm(d["diagnosis"])
+            merged = differentials.get(key)
+            if merged is None:
+                differentials[key] = {**d, "evidence": [d["evidence"]] if d["evidence"] else [], "agreement": 1}
+                continue
+            merged["agreement"] += 1
+            if _RANK[d["likelihood"].lower()] > _RANK[merged["likelihood"].lower()]:
+                merged["likelihood"] = d["likelihood"]
+            if d["evidence"]:
+                merged["evidence"].append(d["evidence"])
+    ranked = sorted(differentials.values(), key=lambda d: (-_RANK[d["likelihood"].lower()], -d["agreement"]))
+    return {
+        "key_findings": dedupe([x for f in findings for x in f["key_findings"]]),
+        "differentials": [{**d, "evidence": "; ".join(dedupe(d["evidence"]))} for d in ranked],
+        "risk_level": max((f["risk_level"] for f in findings), key=lambda r: _RANK[r.lower()], default="Low"),
+        "red_flags": dedupe([x for f in findings for x in f["red_flags"]]),
+        "recommendations": dedupe([x for f in findings for x in f["recommendations"]]),
+    }
+
+
+def format_findings(merged: dict) -> str:
+    """Compact text of a merged findings object, as the MDT prompt receives it."""
+    lines = [f"Risk level: {merged['risk_level']}"]
+    if merged["key_findings"]:
+        lines.append("Key findings: " + "; ".join(merged["key_findings"]))
+    if merged["differentials"]:
+        lines.append("Differentials:")
+        for d in merged["differentials"]:
+            agreement = ", both reviewers" if d["agreement"] > 1 else ""
+            lines.append(f"- {d['diagnosis']} ({d['likelihood']}{agreement}): {d['evidence']}")
+    if merged["red_flags"]:
+        lines.append("Red flags: " + "; ".join(merged["red_flags"]))
+    if merged["recommendations"]:
+        lines.append("Recommendations: " + "; ".join(merged["recommendations"]))
+    return "\n".join(lines)
+
+
+def build_team_inputs(responses: dict, findings: dict | None = None) -> tuple[dict, dict]:
+    """(MDT template variables, handoff stats for the result meta).
+
+    Without findings (or with MDT_HANDOFF=full) each variable is the concatenation of the
+    full answers, as before; the stats compare both sizes either way.
+    """
+    findings = findings or {}
+    use_findings = structured_handoff()
+    inputs, fallback = {}, []
+    full_chars = compact_chars = 0
+    for variable, names in TEAM_INPUTS.items():
+        full = "".join(responses.get(name, "") for name in names)
+        full_chars += len(full)
+        if not use_findings:
+            inputs[variable] = full
+            compact_chars += len(full)
+            continue
+        parts = []
+        found = [findings[name] for name in names if findings.get(name)]
+        if found:
+            parts.append(format_findings(merge_findings(found)))
+        for name in names:
+            # Resposta sem objeto de handoff válido: segue completa, como antes
+            if responses.get(name) and not findings.get(name):
+                parts.append(responses[name])
+                fallback.append(name)
+        inputs[variable] = "\n\n".join(parts)
+        compact_chars += len(inputs[variable])
+    stats = {
+        "mode": handoff_mode(),
+        "full_chars": full_chars,
+        "mdt_input_chars": compact_chars,
+        "reduction": round(full_chars / compact_chars, 2) if compact_chars else None,
+        "fallback_agents": fallback,
+    }
+    return inputs, stats
@@ -0,0 +1,397 @@
+"""Job queue and HTTP front end for the diagnosis pipeline (``python Main.py --serve``).
+
+Upstream systems POST a report and get a job id back at once; a fixed pool of asyncio
+workers runs the pipeline in one long-lived process, so clients pay neither Python start-up
+nor client construction per report. The queue is bounded: when it is full, submissions get
+``429 Too Many Requests`` with ``Retry-After`` instead of piling up work.
+
+    POST /jobs                 JSON {"report": "...", "filename": "Medical Report - Name - X.txt"}
+                               (or the raw text with ?filename=...) → 202 {"job_id", ...}
+    GET  /jobs                 recent jobs (id, status)
+    GET  /jobs/<id>[?wait=30]  status, and the result once done (long-poll up to ``wait`` s)
+    GET  /jobs/<id>/events     Server-Sent Events: status changes, each agent finishing
+                               (and its chunks with --stream), then the result
+    GET  /health               liveness + queue figures (503 while draining)
+    GET  /metrics              Prometheus text: pipeline counters + job queue gauges
+
+The HTTP server runs in threads (``http.server``, like the stub LLM server); the pipeline
+runs on the asyncio loop that owns the ``JobService``. A job's result is the same payload
+stored in the result store; its judge metrics are merged into it when they arrive
+(``meta.metrics_status``).
+"""
+import asyncio
+import json
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+FINISHED = ("done", "failed")
+
+# Tamanho máximo de um relatório submetido
+MAX_REPORT_BYTES = 2 * 1024 * 1024
+
+
+class QueueFull(Exception):
+    """The job queue is at capacity (HTTP 429)."""
+
+
+class ServiceClosed(Exception):
+    """The service is draining and no longer accepts jobs (HTTP 503)."""
+
+
+def _safe_filename(name: str) -> str:
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", Path(name).name).strip(" .")
+    if not name:
+        return "report.txt"
+    return name if name.lower().endswith(".txt") else name + ".txt"
+
+
+class Job:
+    """One submitted report: status, timings, progress events and, once done, the result."""
+
+    def __init__(self, job_id: str, filename: str, path: Path):
+        self.id = job_id
+        self.filename = filename
+        self.path = path
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self.cond = threading.Condition()
+        self.emit("status", status="queued")
+
+    # Interface de listener do arun_single_report (igual à do ProgressWriter)
+    def chunk(self, role: str, text: str):
+        self.emit("chunk", role=role, text=text)
+
+    def done(self, role: str, timing: dict | None):
+        self.emit("agent", role=role, **(timing or {}))
+
+    def emit(self, event: str, **data):
+        with self.cond:
+            self.events.append({"seq": len(self.events), "event": event,
+                                "t": round(time.time() - self.submitted_at, 3), **data})
+            self.cond.notify_all()
+
+    def set_status(self, status: str, **data):
+        now = time.time()
+        if status == "running":
+            self.started_at = now
+        elif status in FINISHED:
+            self.finished_at = now
+        with self.cond:
+            self.status = status
+        self.emit("status", status=status, **data)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def wait(self, timeout: float) -> bool:
+        """Block (HTTP thread) until the job finishes or ``timeout`` expires."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.finished, timeout)
+
+    def events_after(self, seq: int, timeout: float) -> list[dict]:
+        """Events with ``seq`` >= the given one, waiting up to ``timeout`` for new ones."""
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.events) > seq, timeout)
+            return self.events[seq:]
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        out = {
+            "job_id": self.id,
+            "status": self.status,
+            "filename": self.filename,
+            "submitted_at": self.submitted_at,
+            "queue_seconds": round((self.started_at or time.time()) - self.submitted_at, 3),
+            "run_seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+        }
+        if self.error:
+            out["error"] = self.error
+        if self.result is not None:
+            out["result_id"] = f"{self.result['patient_name']}_diagnosis{self.result['timestamp']}"
+            out["metrics_status"] = self.result.get("meta", {}).get("metrics_status")
+            if include_result:
+                out["result"] = self.result
+        return out
+
+
+class JobService:
+    """Bounded job queue served by ``workers`` asyncio workers running ``run(path, job)``.
+
+    ``submit`` is thread-safe (it is called from the HTTP threads); everything else runs on
+    the event loop passed to ``start``.
+    """
+
+    def __init__(self, run, inbox, workers: int = 2, queue_size: int = 8, retention: int = 1000):
+        self.run = run
+        self.inbox = Path(inbox)
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.retention = max(1, retention)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.loop = None
+        self.queue = None
+        self._worker_tasks = []
+        self._running = set()
+        self.closed = False
+        self.started = time.time()
+
+        self.queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.run_seconds = 0.0
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, report: str, filename: str | None = None) -> Job:
+        """Queue a report; raises QueueFull (429) or ServiceClosed (503)."""
+        with self.lock:
+            if self.closed:
+                raise ServiceClosed("o serviço está a terminar")
+            # O limite conta os jobs à espera; os que já estão a correr ocupam workers
+            if self.queued >= self.queue_size:
+                self.rejected += 1
+                raise QueueFull(f"fila cheia ({self.queue_size} jobs à espera)")
+            self.queued += 1
+            self.submitted += 1
+            job_id = uuid.uuid4().hex[:16]
+        filename = _safe_filename(filename or f"Medical Report - {job_id}.txt")
+        # Cada job tem a sua pasta: o nome do ficheiro (e do paciente) pode repetir-se
+        path = self.inbox / job_id / filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(report, encoding="utf-8")
+        job = Job(job_id, filename, path)
+        with self.lock:
+            self.jobs[job_id] = job
+            self._evict()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, job)
+        return job
+
+    def _evict(self):
+        # Guarda em memória só os últimos `retention` jobs terminados (os resultados ficam na base)
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def recent(self, limit: int = 100) -> list[dict]:
+        with self.lock:
+            jobs = list(self.jobs.values())[-limit:]
+        return [{"job_id": j.id, "status": j.status, "filename": j.filename} for j in reversed(jobs)]
+
+    async def _worker(self):
+        while not self.closed:
+            job = await self.queue.get()
+            with self.lock:
+                self.queued -= 1
+            task = asyncio.current_task()
+            self._running.add(task)
+            job.set_status("running")
+            try:
+                job.result = await self.run(job.path, job)
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.set_status("failed", error=job.error)
+                with self.lock:
+                    self.failed += 1
+            else:
+                # O resultado vai antes do estado final: o stream SSE fecha no "done"
+                job.emit("result", result=job.result)
+                job.set_status("done")
+                with self.lock:
+                    self.completed += 1
+                # O relatório já está no resultado guardado; a cópia na inbox só fica se falhar
+                shutil.rmtree(job.path.parent, ignore_errors=True)
+            finally:
+                self._running.discard(task)
+                with self.lock:
+                    self.run_seconds += time.time() - (job.started_at or time.time())
+                    self._evict()
+
+    async def drain(self):
+        """Stop accepting jobs, finish the running ones and drop the queued ones (marked failed)."""
+        with self.lock:
+            self.closed = True
+        for task in self._worker_tasks:
+            if task not in self._running:
+                task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        while not self.queue.empty():
+            job = self.queue.get_nowait()
+            with self.lock:
+                self.queued -= 1
+                self.failed += 1
+            job.error = "serviço terminado antes de o job começar"
+            job.set_status("failed", error=job.error)
+
+    def stats(self) -> dict:
+        with self.lock:
+            finished = self.completed + self.failed
+            return {
+                "status": "draining" if self.closed else "ok",
+                "workers": self.workers,
+                "running": len(self._running),
+                "queued": self.queued,
+                "queue_size": self.queue_size,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "mean_run_seconds": round(self.run_seconds / finished, 3) if finished else None,
+                "uptime_seconds": round(time.time() - self.started, 1),
+            }
+
+    def prometheus_text(self) -> str:
+        st = self.stats()
+        lines = [
+            "# HELP mdt_service_jobs_total Jobs submitted to the HTTP service by outcome",
+            "# TYPE mdt_service_jobs_total counter",
+        ]
+        for outcome in ("submitted", "completed", "failed", "rejected"):
+            lines.append(f'mdt_service_jobs_total{{outcome="{outcome}"}} {st[outcome]}')
+        lines += [
+            "# HELP mdt_service_queue_depth Jobs waiting for a worker",
+            "# TYPE mdt_service_queue_depth gauge",
+            f"mdt_service_queue_depth {st['queued']}",
+            "# HELP mdt_service_running Jobs being processed",
+            "# TYPE mdt_service_running gauge",
+            f"mdt_service_running {st['running']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: JobService = None
+    metrics_text = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status: int, body, headers: dict | None = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str, headers: dict | None = None):
+        self._send_json(status, {"error": {"code": status, "message": message}}, headers)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._error(404, "not found")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REPORT_BYTES:
+            return self._error(413, f"relatório maior do que {MAX_REPORT_BYTES} bytes")
+        raw = self.rfile.read(length)
+        filename = (parse_qs(url.query).get("filename") or [None])[0]
+        if "json" in (self.headers.get("Content-Type") or ""):
+            try:
+                body = json.loads(raw or b"{}")
+                report, filename = body["report"], body.get("filename") or filename
+            except (ValueError, KeyError, TypeError):
+                return self._error(400, 'JSON inválido: esperado {"report": "...", "filename": "..."}')
+        else:
+            report = raw.decode("utf-8", errors="ignore")
+        if not str(report).strip():
+            return self._error(400, "relatório vazio")
+        try:
+            job = self.service.submit(str(report), filename)
+        except QueueFull as e:
+            return self._error(429, str(e), {"Retry-After": "5"})
+        except ServiceClosed as e:
+            return self._error(503, str(e))
+        self._send_json(202, {**job.to_dict(include_result=False),
+                              "links": {"self": f"/jobs/{job.id}", "events": f"/jobs/{job.id}/events"}},
+                        {"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+        if path in ("/health", "/healthz"):
+            st = self.service.stats()
+            return self._send_json(200 if st["status"] == "ok" else 503, st)
+        if path == "/metrics":
+            data = ((self.metrics_text() if self.metrics_text else "") + self.service.prometheus_text()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if path == "/jobs":
+            return self._send_json(200, {"jobs": self.service.recent()})
+        m = re.fullmatch(r"/jobs/([0-9a-f]+)(/events)?", path)
+        if not m:
+            return self._error(404, "not found")
+        job = self.service.get(m.group(1))
+        if job is None:
+            return self._error(404, "job desconhecido (ou já esquecido: consulte a base de resultados)")
+        if m.group(2):
+            return self._stream(job)
+        wait = float((query.get("wait") or ["0"])[0] or 0)
+        if wait > 0 and not job.finished:
+            job.wait(min(wait, 300))
+        self._send_json(200, job.to_dict())
+
+    def _stream(self, job: Job):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        seq = 0
+        try:
+            while True:
+                events = job.events_after(seq, timeout=15)
+                if not events:
+                    # Comentário SSE para manter a ligação viva
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    continue
+                for event in events:
+                    data = json.dumps(event, ensure_ascii=False)
+                    self.wfile.write(f"event: {event['event']}\ndata: {data}\n\n".encode("utf-8"))
+                seq = events[-1]["seq"] + 1
+                self.wfile.flush()
+                if job.finished and seq >= len(job.events):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+def serve(service: JobService, host: str = "127.0.0.1", port: int = 8080, metrics_text=None) -> ThreadingHTTPServer:
+    """Build the HTTP server (run ``serve_forever()`` in a thread; the service stays on its loop)."""
+    handler = type("BoundServiceHandler", (ServiceHandler,), {
+        "service": service, "metrics_text": staticmethod(metrics_text) if metrics_text else None,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,196 @@
+"""Process-wide registry of pooled Gemini clients (and raw httpx pools for other backends).
+
+Agents and the evaluator used to build a new ``genai.Client`` on every call, each with
+its own connection pool and TLS handshakes. ``get_client()`` hands out one client per
+API key instead, backed by keep-alive ``httpx`` pools (HTTP/2 when ``h2`` is installed).
+
+Pool settings come from the environment:
+    LLM_POOL_SIZE               max. open connections per pool (default 100)
+    LLM_KEEPALIVE_CONNECTIONS   idle connections kept alive (default 20)
+    LLM_KEEPALIVE_EXPIRY        seconds an idle connection is kept (default 60)
+    LLM_HTTP2                   "auto" (default), "1" or "0"
+    LLM_HTTP_TIMEOUT            seconds a request may wait for the server (default LLM_CALL_TIMEOUT,
+                                300); bounds the synchronous calls, which have no deadline of their own
+    LLM_CONNECT_TIMEOUT         seconds to open a connection (default 10)
+
+``connection_stats()`` reports how many requests reused an existing connection.
+
+``httpx`` and ``google.genai`` are imported on first use, so a process that never talks
+to those backends (e.g. LLM_BACKEND=stub) does not pay for loading them.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import os
+import threading
+
+
+class ConnectionStats:
+    """Counts HTTP requests and new TCP connections across every pooled client."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients_created = 0
+        self.requests = 0
+        self.connections_opened = 0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            reused = max(0, self.requests - self.connections_opened)
+            return {
+                "clients_created": self.clients_created,
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": reused,
+                "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+_stats = ConnectionStats()
+_lock = threading.Lock()
+_sync_pools = {}    # api_key / backend URL -> httpx.Client
+_clients = {}       # (name, id(loop) | None) -> (loop | None, genai.Client | httpx.AsyncClient)
+
+
+def _on_trace(event_name, info):
+    if event_name == "connection.connect_tcp.complete":
+        with _stats.lock:
+            _stats.connections_opened += 1
+
+
+async def _aon_trace(event_name, info):
+    _on_trace(event_name, info)
+
+
+def _on_request(request):
+    with _stats.lock:
+        _stats.requests += 1
+    request.extensions["trace"] = _on_trace
+
+
+async def _aon_request(request):
+    with _stats.lock:
+        _stats.requests += 1
+    request.extensions["trace"] = _aon_trace
+
+
+def _env_number(name, default, cast=int):
+    try:
+        return cast(os.getenv(name, default))
+    except ValueError:
+        return cast(default)
+
+
+def _use_http2() -> bool:
+    setting = os.getenv("LLM_HTTP2", "auto").strip().lower()
+    if setting in ("0", "false", "no"):
+        return False
+    available = importlib.util.find_spec("h2") is not None
+    if setting in ("1", "true", "yes") and not available:
+        print("LLM_HTTP2 pedido mas o pacote 'h2' não está instalado; a usar HTTP/1.1")
+    return available
+
+
+def http_timeout() -> float:
+    """Seconds an HTTP request may take (LLM_HTTP_TIMEOUT, else the call deadline, else 300)."""
+    for name in ("LLM_HTTP_TIMEOUT", "LLM_CALL_TIMEOUT"):
+        value = _env_number(name, 0, float)
+        if value > 0:
+            return value
+    return 300.0
+
+
+def _pool_kwargs() -> dict:
+    import httpx
+    return {
+        "limits": httpx.Limits(
+            max_connections=_env_number("LLM_POOL_SIZE", 100),
+            max_keepalive_connections=_env_number("LLM_KEEPALIVE_CONNECTIONS", 20),
+            keepalive_expiry=_env_number("LLM_KEEPALIVE_EXPIRY", 60, float),
+        ),
+        "http2": _use_http2(),
+        # Finito: uma chamada síncrona parada não pode prender a thread para sempre
+        "timeout": httpx.Timeout(http_timeout(), connect=_env_number("LLM_CONNECT_TIMEOUT", 10, float)),
+    }
+
+
+def _current_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _async_pool() -> httpx.AsyncClient:
+    import httpx
+    return httpx.AsyncClient(event_hooks={"request": [_aon_request]}, **_pool_kwargs())
+
+
+def _sync_pool(name: str) -> httpx.Client:
+    # chamado com _lock adquirido
+    pool = _sync_pools.get(name)
+    if pool is None:
+        import httpx
+        pool = httpx.Client(event_hooks={"request": [_on_request]}, **_pool_kwargs())
+        _sync_pools[name] = pool
+    return pool
+
+
+def _per_loop(name: str, factory):
+    """Object built by ``factory()`` for ``name`` and the running loop (if any).
+
+    ``factory`` runs with ``_lock`` held.
+    """
+    loop = _current_loop()
+    key = (name, id(loop) if loop is not None else None)
+    with _lock:
+        entry = _clients.get(key)
+        if entry is not None and entry[0] is loop:
+            return entry[1]
+
+        # Forget clients whose event loop is gone; their async pools are unusable.
+        for stale in [k for k, (lp, _) in _clients.items() if lp is not None and lp.is_closed()]:
+            del _clients[stale]
+
+        obj = factory()
+        _clients[key] = (loop, obj)
+        with _stats.lock:
+            _stats.clients_created += 1
+        return obj
+
+
+def get_client(api_key: str, base_url: str | None = None) -> genai.Client:
+    """Return the shared client for ``api_key`` (and optional ``base_url`` override).
+
+    The sync connection pool is shared by the whole process. Async pools are bound to
+    an event loop, so each running loop gets its own client (clients of closed loops
+    are dropped).
+    """
+    from google import genai
+    from google.genai import types
+
+    name = f"{api_key}@{base_url}" if base_url else api_key
+    return _per_loop(name, lambda: genai.Client(
+        api_key=api_key,
+        # O genai envia o seu próprio timeout em cada pedido (None = sem limite), por isso vai aqui também
+        http_options=types.HttpOptions(
+            base_url=base_url, httpx_client=_sync_pool(name), httpx_async_client=_async_pool(),
+            timeout=int(http_timeout() * 1000),
+        ),
+    ))
+
+
+def get_http_pool(name: str) -> httpx.Client:
+    """Shared sync httpx pool for a non-Gemini backend (e.g. an OpenAI-compatible URL)."""
+    with _lock:
+        return _sync_pool(name)
+
+
+def get_async_http_pool(name: str) -> httpx.AsyncClient:
+    """httpx.AsyncClient for ``name`` bound to the running event loop."""
+    return _per_loop(f"async:{name}", _async_pool)
+
+
+def connection_stats() -> dict:
+    return _stats.snapshot()
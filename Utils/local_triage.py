@@ -0,0 +1,193 @@
+"""Local, CPU-only triage engine.
+
+Scores each specialty by scanning the report for the same kind of keywords the
+Triage_Balancer prompt asks the LLM to look for ("palpitations" -> Cardiology,
+"wheezing" -> Pulmonology, "panic" -> Psychology, ...). It returns the exact structure
+the LLM produces, so ``select_specialties`` can consume it unchanged:
+
+    {"Cardiology": {"weight": 7, "reasoning": "..."}, "Psychology": {...}, "Pulmonology": {...}}
+
+Each decision carries a confidence, the lowest over the three specialties:
+
+    no matching keyword at all      1.0  (the LLM leaves such specialties at 0-1)
+    some keywords, below threshold  0.2  (the LLM escalates weak mentions to 4-7)
+    at or above TRIAGE_THRESHOLD    (weight - threshold + 1) / 3, capped at 1
+
+Below LOCAL_TRIAGE_MIN_CONFIDENCE (default 0.5) the caller falls back to the LLM. On the
+20 historical runs in Results/ (``Benchmarks/triage_agreement.py``), the LLM agrees with
+itself across runs of the same report 70% of the time. The local engine agrees with the LLM
+on 65% of all runs, and on 90% of the 50% of runs it is confident about; the runs it hands
+to the LLM agree 40% of the time.
+
+The keyword scores can be calibrated against the historical LLM triage in Results/
+(``fit_calibration``); the calibration is a per-specialty linear map stored as JSON.
+"""
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+SPECIALTIES = ("Cardiology", "Psychology", "Pulmonology")
+
+# (padrão, pontos). Cada termo conta uma vez; no "Chief Complaint" vale a dobrar.
+LEXICON = {
+    "Cardiology": [
+        (r"palpitation", 3), (r"chest (?:pain|tightness|pressure)", 3), (r"angina", 3),
+        (r"arrhythmi", 2), (r"atrial fibrillation|\bafib\b", 3), (r"tachycardi", 2), (r"bradycardi", 2),
+        (r"syncope|faint", 2), (r"\b(?:ecg|ekg)\b|electrocardiogram", 1), (r"echocardiogra", 1),
+        (r"holter", 1), (r"troponin|ck-mb", 1), (r"murmur", 2), (r"heart (?:attack|failure|disease)", 2),
+        (r"hypertension", 2), (r"cholesterol|\bldl\b|dyslipid", 1), (r"edema|swelling of (?:the )?(?:legs|ankles)", 1),
+        (r"diabetes", 1), (r"smok", 1), (r"sedentary", 1),
+        (r"lisinopril|amlodipine|hydrochlorothiazide|losartan|statin|aspirin", 1),
+    ],
+    "Psychology": [
+        (r"panic", 3), (r"anxiety|anxious", 3), (r"depress", 3), (r"impending doom", 2), (r"stress", 1),
+        (r"insomnia|difficulty (?:falling|staying|initiating) (?:a)?sleep|night(?:time)? awakening", 3),
+        (r"sleep", 1), (r"fatigue", 1), (r"caffeine", 1), (r"mood", 2),
+        (r"suicid", 3), (r"memory loss|forgetful", 2), (r"cognitive|disorient|confusion", 2),
+        (r"dementia|alzheimer", 3), (r"irritab", 1), (r"trauma|ptsd", 2), (r"worr", 1),
+        (r"benzodiazepine|lorazepam|ssri|sertraline|fluoxetine|escitalopram", 2), (r"psychiatr|psycholog", 2),
+        # sintomas funcionais (eixo intestino-cérebro) que a triagem LLM costuma enviar para Psicologia
+        (r"irritable bowel|bloating", 2),
+    ],
+    "Pulmonology": [
+        (r"wheez", 3), (r"cough", 2), (r"sputum|phlegm", 2), (r"shortness of breath|dyspn", 3),
+        (r"copd|emphysema|bronchitis", 3), (r"asthma", 3), (r"pneumonia", 3), (r"fev1|spirometr|pulmonary function", 2),
+        (r"chest x-ray|chest ct", 1), (r"\blungs?\b", 1), (r"pack-years?", 2), (r"smok", 1),
+        (r"inhaler|salbutamol|albuterol|tiotropium", 2), (r"(?:spo2|oxygen saturation)", 1), (r"crackles", 2),
+    ],
+}
+
+# Confiança de uma especialidade com palavras-chave mas abaixo do limiar (ver docstring)
+WEAK_EVIDENCE_CONFIDENCE = 0.2
+
+NEGATION = re.compile(r"\b(?:no|not|non|never|denies|denied|without|negative for|absence of)\b[^.;:\n]{0,30}$", re.I)
+BP = re.compile(r"(?:BP|blood pressure)\s*:?\s*(\d{2,3})\s*/\s*(\d{2,3})", re.I)
+CHIEF_COMPLAINT = re.compile(r"chief complaint:?(.*?)(?:\n\s*\n|medical history)", re.I | re.S)
+
+
+@dataclass
+class TriageResult:
+    triage: dict
+    confidence: float
+    raw_scores: dict = field(default_factory=dict)
+
+    def to_json(self) -> str:
+        return json.dumps(self.triage, ensure_ascii=False)
+
+
+class LocalTriage:
+    def __init__(self, threshold: int | None = None, calibration: dict | None = None):
+        self.threshold = threshold if threshold is not None else int(os.getenv("TRIAGE_THRESHOLD", "3"))
+        # {specialty: [slope, intercept]}; sem calibração usa o score tal como está
+        self.calibration = calibration or {}
+        self.patterns = {
+            sp: [(re.compile(pat, re.I), pts) for pat, pts in terms] for sp, terms in LEXICON.items()
+        }
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("LOCAL_TRIAGE_MODEL")
+        calibration = None
+        if path and Path(path).is_file():
+            calibration = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(calibration=calibration)
+
+    def _score(self, specialty: str, text: str, chief_complaint: str):
+        score, hits = 0.0, []
+        for pattern, points in self.patterns[specialty]:
+            for m in pattern.finditer(text):
+                # Ignora menções negadas ("no wheezing", "denies chest pain")
+                if NEGATION.search(text[max(0, m.start() - 40):m.start()]):
+                    continue
+                bonus = 2 if pattern.search(chief_complaint) else 1
+                score += points * bonus
+                hits.append(m.group(0).lower())
+                break
+        if specialty == "Cardiology":
+            bp = BP.search(text)
+            if bp and (int(bp.group(1)) >= 140 or int(bp.group(2)) >= 90):
+                score += 2
+                hits.append(f"BP {bp.group(1)}/{bp.group(2)}")
+        return score, hits
+
+    def _weight(self, specialty: str, score: float) -> int:
+        slope, intercept = self.calibration.get(specialty, (1.0, 0.0))
+        return int(max(0, min(10, round(slope * score + intercept))))
+
+    def _confidence(self, weight: int, hits: list) -> float:
+        if weight >= self.threshold:
+            return min(1.0, (weight - self.threshold + 1) / 3)
+        # Nenhuma menção: a triagem LLM também não seleciona; menções fracas costuma selecionar
+        return WEAK_EVIDENCE_CONFIDENCE if hits else 1.0
+
+    def classify(self, medical_report: str) -> TriageResult:
+        text = medical_report or ""
+        cc = CHIEF_COMPLAINT.search(text)
+        chief_complaint = cc.group(1) if cc else ""
+
+        triage, raw, confidences = {}, {}, []
+        for specialty in SPECIALTIES:
+            score, hits = self._score(specialty, text, chief_complaint)
+            weight = self._weight(specialty, score)
+            raw[specialty] = score
+            triage[specialty] = {
+                "weight": weight,
+                "reasoning": ("Local keyword match: " + ", ".join(hits)) if hits else "No matching keywords.",
+            }
+            confidences.append(self._confidence(weight, hits))
+        return TriageResult(triage=triage, confidence=round(min(confidences), 3), raw_scores=raw)
+
+
+def fit_calibration(pairs) -> dict:
+    """Least-squares fit of LLM weight ~ slope * raw_score + intercept, per specialty.
+
+    ``pairs`` is an iterable of (raw_scores: dict, llm_weights: dict).
+    """
+    calibration = {}
+    pairs = list(pairs)
+    for specialty in SPECIALTIES:
+        xs, ys = [], []
+        for raw, weights in pairs:
+            if specialty in raw and weights.get(specialty) is not None:
+                xs.append(float(raw[specialty]))
+                ys.append(float(weights[specialty]))
+        if len(xs) < 2:
+            continue
+        mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+        var_x = sum((x - mean_x) ** 2 for x in xs)
+        if not var_x:
+            continue
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+        calibration[specialty] = [round(slope, 4), round(mean_y - slope * mean_x, 4)]
+    return calibration
+
+
+def selection(weights: dict, threshold: int) -> frozenset:
+    """Specialties a set of weights selects (empty set = the all-seniors fallback)."""
+    return frozenset(sp for sp in SPECIALTIES if weights.get(sp) is not None and weights[sp] >= threshold)
+
+
+def parse_weights(triage) -> dict | None:
+    """{specialty: int weight} from an LLM triage response (str or dict), or None if unreadable."""
+    if isinstance(triage, str):
+        try:
+            triage = json.loads(triage)
+        except Exception:
+            m = re.search(r"(\{.*\})", triage, re.S)
+            if not m:
+                return None
+            try:
+                triage = json.loads(m.group(1))
+            except Exception:
+                return None
+    if not isinstance(triage, dict):
+        return None
+    weights = {}
+    for sp in SPECIALTIES:
+        try:
+            weights[sp] = int(triage.get(sp, {}).get("weight"))
+        except Exception:
+            weights[sp] = None
+    return weights
@@ -0,0 +1,329 @@
+"""Per-role model routing with circuit breakers and failover to a secondary backend.
+
+Each role is served by the model of its tier:
+
+    fast    Triage_Balancer and the novice specialists
+    strong  the senior specialists and the MultidisciplinaryTeam
+    judge   the evaluator (Judge and Judge:batch)
+
+Every model of the primary backend has a ``CircuitBreaker`` fed with the outcome of each
+attempt (Utils/resilience.py). It opens when the error rate or the p95 latency of the last
+calls crosses its limit. While it is open the calls go to the secondary backend
+(FALLBACK_BACKEND, only if set). After the cooldown one probe call goes back to the primary: success
+closes the breaker, failure opens it again. A call that still fails on the primary after
+its retries is repeated once on the secondary. Each decision (tier, backend, model, path,
+reason) is stored on the call's tracing span and summarised in ``meta.routing``.
+
+Settings come from the environment:
+    MODEL_ROUTING          on (default) | off: off serves every agent role with the strong model
+    GEMINI_MODEL_FAST      gemini fast tier (default gemini-2.5-flash-lite)
+    GEMINI_MODEL_STRONG    gemini strong tier (default gemini-2.5-flash)
+    OPENROUTER_MODEL_FAST  openai fast tier (default OPENROUTER_MODEL); strong is OPENROUTER_MODEL,
+                           judge OPENROUTER_EVAL_MODEL / GEMINI_EVAL_MODEL as before
+    MODEL_ROUTES           per-role overrides, "Triage_Balancer=gemini-2.0-flash-lite;MultidisciplinaryTeam=gemini-2.5-pro"
+    FALLBACK_BACKEND       gemini | openai | stub | off (default off). Failover only happens when
+                           this is set explicitly: it sends the full report to that provider
+    CIRCUIT_WINDOW         attempts remembered per model (default 20)
+    CIRCUIT_MIN_CALLS      attempts needed before the breaker can open (default 5)
+    CIRCUIT_ERROR_RATE     error rate that opens it (default 0.5)
+    CIRCUIT_LATENCY_P95    p95 latency in seconds that opens it (default 0 = ignore latency)
+    CIRCUIT_COOLDOWN       seconds open before a probe call (default 30)
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from Utils.backends import BACKENDS, GEMINI_MODEL, backend_name, get_backend
+from Utils.resilience import get_call_policy, is_retryable
+from Utils.tracing import record_route
+
+TIERS = ("fast", "strong", "judge")
+
+ROLE_TIERS = {
+    "Triage_Balancer": "fast",
+    "Novice_Cardiologist": "fast", "Novice_Psychologist": "fast",
+    "Novice_Pulmonologist": "fast", "Novice_General_Practitioner": "fast",
+    "Senior_Cardiologist": "strong", "Senior_Psychologist": "strong",
+    "Senior_Pulmonologist": "strong", "Senior_General_Practitioner": "strong",
+    "MultidisciplinaryTeam": "strong",
+}
+
+
+def role_tier(role: str) -> str:
+    if role.startswith("Judge"):
+        return "judge"
+    return ROLE_TIERS.get(role, "strong")
+
+
+def tier_models(name: str, routing: bool = True) -> dict:
+    """{tier: model} for backend ``name``; without routing the fast tier uses the strong model."""
+    if name == "stub":
+        models = {"fast": "stub-fast", "strong": "stub", "judge": "stub-judge"}
+    elif name == "openai":
+        strong = os.getenv("OPENROUTER_MODEL", "openai/gpt-oss-20b:free")
+        models = {"fast": os.getenv("OPENROUTER_MODEL_FAST", strong), "strong": strong,
+                  "judge": os.getenv("OPENROUTER_EVAL_MODEL", strong)}
+    else:
+        models = {"fast": os.getenv("GEMINI_MODEL_FAST", "gemini-2.5-flash-lite"),
+                  "strong": os.getenv("GEMINI_MODEL_STRONG", GEMINI_MODEL),
+                  "judge": os.getenv("GEMINI_EVAL_MODEL", "gemini-2.0-flash")}
+    if not routing:
+        models["fast"] = models["strong"]
+    return models
+
+
+def parse_routes(spec: str | None) -> dict:
+    """'Triage_Balancer=gemini-2.0-flash-lite;Judge=gemini-2.5-flash' -> {role: model}."""
+    if not spec:
+        return {}
+    pairs = (item.split("=", 1) for item in spec.split(";") if "=" in item)
+    return {role.strip(): model.strip() for role, model in pairs if role.strip() and model.strip()}
+
+
+class CircuitBreaker:
+    """closed -> open (errors/latency over the limit) -> half_open (one probe) -> closed | open."""
+
+    def __init__(self, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 latency_p95: float | None = None, cooldown: float = 30.0):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.latency_p95 = latency_p95 or None
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.outcomes = deque(maxlen=window)   # (ok, segundos)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def allow(self) -> str | None:
+        """"closed", "half_open" (this call is the probe) or None (open: use the fallback)."""
+        with self.lock:
+            if self.state == "closed":
+                return "closed"
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return "half_open"
+            return None
+
+    def record(self, ok: bool, seconds: float):
+        with self.lock:
+            if self.state == "half_open":
+                if ok:
+                    self.state = "closed"
+                    self.outcomes.clear()
+                else:
+                    self._open()
+                return
+            self.outcomes.append((ok, seconds))
+            if self.state == "closed" and self._degraded():
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.trips += 1
+
+    def _degraded(self) -> bool:
+        if len(self.outcomes) < self.min_calls:
+            return False
+        errors = sum(1 for ok, _ in self.outcomes if not ok)
+        if errors / len(self.outcomes) >= self.error_rate:
+            return True
+        return self.latency_p95 is not None and self._p95() > self.latency_p95
+
+    def _p95(self) -> float:
+        latencies = sorted(seconds for _, seconds in self.outcomes)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def health(self) -> dict:
+        with self.lock:
+            calls = len(self.outcomes)
+            errors = sum(1 for ok, _ in self.outcomes if not ok)
+            return {
+                "state": self.state,
+                "recent_calls": calls,
+                "error_rate": round(errors / calls, 3) if calls else 0.0,
+                "p95_seconds": round(self._p95(), 3) if calls else None,
+                "trips": self.trips,
+            }
+
+
+class ModelRouter:
+    def __init__(self, primary: str | None = None, fallback: str | None = None, routing: bool = True,
+                 routes: dict | None = None, breaker_settings: dict | None = None):
+        self.primary_name = primary or backend_name()
+        self.fallback_name = fallback if fallback != self.primary_name else None
+        self.routing = routing
+        self.routes = routes or {}
+        self.breaker_settings = breaker_settings or {}
+        self.lock = threading.Lock()
+        self.backends = {}
+        self.breakers = {}
+        self.failovers = 0
+
+    @classmethod
+    def from_env(cls):
+        primary = backend_name()
+        # Sem opt-in explícito não há fallback: o relatório nunca sai para outro fornecedor
+        fallback = os.getenv("FALLBACK_BACKEND", "off").strip().lower() or "off"
+        if fallback not in BACKENDS:
+            if fallback != "off":
+                print(f"FALLBACK_BACKEND inválido: {fallback!r} (sem fallback)")
+            fallback = None
+        latency = float(os.getenv("CIRCUIT_LATENCY_P95", "0"))
+        return cls(
+            primary=primary,
+            fallback=fallback,
+            routing=os.getenv("MODEL_ROUTING", "on").strip().lower() not in ("off", "0", "false", "no"),
+            routes=parse_routes(os.getenv("MODEL_ROUTES")),
+            breaker_settings={
+                "window": int(os.getenv("CIRCUIT_WINDOW", "20")),
+                "min_calls": int(os.getenv("CIRCUIT_MIN_CALLS", "5")),
+                "error_rate": float(os.getenv("CIRCUIT_ERROR_RATE", "0.5")),
+                "latency_p95": latency or None,
+                "cooldown": float(os.getenv("CIRCUIT_COOLDOWN", "30")),
+            },
+        )
+
+    def model_for(self, role: str, name: str | None = None) -> str:
+        name = name or self.primary_name
+        if name == self.primary_name and role in self.routes:
+            return self.routes[role]
+        return tier_models(name, self.routing)[role_tier(role)]
+
+    def _backend(self, name: str, role: str):
+        purpose = "judge" if role_tier(role) == "judge" else "agent"
+        model = self.model_for(role, name)
+        with self.lock:
+            key = (name, purpose, model)
+            if key not in self.backends:
+                self.backends[key] = get_backend(purpose, model=model, name=name)
+            return self.backends[key]
+
+    def primary(self, role: str):
+        return self._backend(self.primary_name, role)
+
+    def fallback(self, role: str):
+        if self.fallback_name is None:
+            return None
+        backend = self._backend(self.fallback_name, role)
+        return backend if backend.configured else None
+
+    def breaker(self, backend) -> CircuitBreaker:
+        with self.lock:
+            if backend.signature not in self.breakers:
+                self.breakers[backend.signature] = CircuitBreaker(**self.breaker_settings)
+            return self.breakers[backend.signature]
+
+    def choose(self, role: str):
+        """(backend, decision) for the next call of ``role``."""
+        primary = self.primary(role)
+        state = self.breaker(primary).allow()
+        decision = {"tier": role_tier(role), "backend": primary.name, "model": primary.model,
+                    "path": "primary", "reason": "closed" if state == "closed" else "probe"}
+        if state is not None:
+            return primary, decision
+        fallback = self.fallback(role)
+        if fallback is None:
+            # Sem alternativa: continua no primário mesmo com o circuito aberto
+            return primary, {**decision, "reason": "circuit_open_no_fallback"}
+        return fallback, {**decision, "backend": fallback.name, "model": fallback.model,
+                          "path": "fallback", "reason": "circuit_open"}
+
+    def _observer(self, backend, path: str):
+        # Só o primário tem disjuntor; o fallback não tem para onde recuar
+        return self.breaker(backend).record if path == "primary" else None
+
+    def _failover(self, role: str, decision: dict, error: Exception):
+        """(fallback, decision) for repeating a call that failed on the primary, or None."""
+        fallback = self.fallback(role)
+        if decision["path"] != "primary" or fallback is None or not is_retryable(error):
+            return None
+        with self.lock:
+            self.failovers += 1
+        print(f"{role}: {decision['model']} falhou ({type(error).__name__}); a repetir em {fallback.signature}")
+        return fallback, {**decision, "backend": fallback.name, "model": fallback.model,
+                          "path": "fallback", "reason": "failover_after_error"}
+
+    async def acall(self, role: str, call, prompt=None, hedge: bool = True):
+        """(backend used, result) of ``call(backend)`` for ``role``, with retries, breaker and failover."""
+        policy = get_call_policy()
+        backend, decision = self.choose(role)
+        record_route(decision, backend.signature)
+        try:
+            return backend, await policy.acall(lambda: call(backend), (backend.signature, role), prompt, hedge,
+                                               self._observer(backend, decision["path"]))
+        except Exception as e:
+            failover = self._failover(role, decision, e)
+            if failover is None:
+                raise
+            backend, decision = failover
+            record_route(decision, backend.signature)
+            return backend, await policy.acall(lambda: call(backend), (backend.signature, role), prompt, hedge)
+
+    def call(self, role: str, call, prompt=None):
+        """Synchronous counterpart of acall()."""
+        policy = get_call_policy()
+        backend, decision = self.choose(role)
+        record_route(decision, backend.signature)
+        try:
+            return backend, policy.call(lambda: call(backend), (backend.signature, role), prompt,
+                                        self._observer(backend, decision["path"]))
+        except Exception as e:
+            failover = self._failover(role, decision, e)
+            if failover is None:
+                raise
+            backend, decision = failover
+            record_route(decision, backend.signature)
+            return backend, policy.call(lambda: call(backend), (backend.signature, role), prompt)
+
+    def signature(self) -> str:
+        """Primary models per tier (and per-role overrides), for the manifest."""
+        models = tier_models(self.primary_name, self.routing)
+        parts = [f"{tier}={models[tier]}" for tier in ("fast", "strong")]
+        parts += [f"{role}={model}" for role, model in sorted(self.routes.items())]
+        return f"{self.primary_name}[{','.join(parts)}]"
+
+    def assignments(self) -> dict:
+        return {tier: model for tier, model in tier_models(self.primary_name, self.routing).items()}
+
+    def health(self) -> dict:
+        with self.lock:
+            breakers = dict(self.breakers)
+            failovers = self.failovers
+        return {"fallback": self.fallback_name, "failovers": failovers,
+                "models": {signature: breaker.health() for signature, breaker in sorted(breakers.items())}}
+
+
+def route_summary(spans) -> dict:
+    """Routing decisions of a report's calls (for ``meta.routing``)."""
+    calls = {s.name: s.route for s in spans if s.route}
+    return {
+        "calls": calls,
+        "fallback_calls": sorted(name for name, route in calls.items() if route["path"] == "fallback"),
+    }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Process-wide router (created on first use from the environment)."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter.from_env()
+        return _router
+
+
+def set_model_router(router: ModelRouter | None):
+    global _router
+    with _router_lock:
+        _router = router
@@ -0,0 +1,43 @@
+"""Progressive result file for streaming runs.
+
+While a report is being processed, every streamed chunk is appended to
+``Results/<patient>_diagnosis<ts>.stream.jsonl`` as one JSON event per line, so an
+operator can ``tail -f`` a long batch and see the specialists writing. Events:
+
+    {"t": 0.41, "role": "Senior_Cardiologist", "event": "chunk", "text": "..."}
+    {"t": 9.87, "role": "Senior_Cardiologist", "event": "done", "ttft_seconds": 0.41, "total_seconds": 9.87}
+
+The file is removed once the final TXT/JSON pair is written (unless STREAM_KEEP_PARTIAL=1)
+and left in place if the report fails, as a record of how far it got.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class ProgressWriter:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.file = open(self.path, "a", encoding="utf-8", buffering=1)
+
+    def _write(self, event: dict):
+        event = {"t": round(time.perf_counter() - self.started, 3), **event}
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def chunk(self, role: str, text: str):
+        self._write({"role": role, "event": "chunk", "text": text})
+
+    def done(self, role: str, timing: dict | None):
+        self._write({"role": role, "event": "done", **(timing or {})})
+
+    def close(self, success: bool = True):
+        with self.lock:
+            self.file.close()
+        if success and os.getenv("STREAM_KEEP_PARTIAL", "").strip() not in ("1", "true", "yes"):
+            self.path.unlink(missing_ok=True)
@@ -0,0 +1,230 @@
+"""Global rate limiting for LLM calls.
+
+Every call to the model (agents and the evaluator) goes through the limiter
+returned by ``get_rate_limiter()``. The default limiter does not limit anything;
+batch mode installs a real one with ``set_rate_limiter()`` so that all reports
+running at the same time share a single quota.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+
+def estimate_tokens(text) -> int:
+    """Rough token estimate (~4 characters per token) used before the call is made."""
+    if not text:
+        return 0
+    return max(1, len(str(text)) // 4)
+
+
+class TokenBucket:
+    """Classic token bucket: ``capacity`` tokens, refilled at ``capacity`` per ``period`` seconds."""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens and return how long the caller must wait before using them.
+
+        Requests bigger than the whole bucket are clamped to the capacity, otherwise
+        they could never be served.
+        """
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, amount: float = 1.0) -> float:
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+
+class SlotPool:
+    """Counting semaphore shared by threads and coroutines, served in FIFO order.
+
+    ``release`` hands the slot directly to the oldest waiter (waking a thread, or resolving
+    a coroutine's future on its own loop), so there is no polling and no waiter can starve.
+    """
+
+    def __init__(self, size: int):
+        self.available = size
+        self.lock = threading.Lock()
+        self.waiters = deque()
+
+    def acquire(self):
+        with self.lock:
+            if self.available > 0 and not self.waiters:
+                self.available -= 1
+                return
+            waiter = _Waiter()
+            self.waiters.append(waiter)
+        waiter.event.wait()
+
+    async def aacquire(self):
+        with self.lock:
+            if self.available > 0 and not self.waiters:
+                self.available -= 1
+                return
+            waiter = _Waiter(asyncio.get_running_loop())
+            self.waiters.append(waiter)
+        try:
+            await waiter.future
+        except BaseException:
+            with self.lock:
+                granted = waiter.granted
+                if not granted:
+                    self.waiters.remove(waiter)
+            # O lugar já tinha sido entregue a este waiter: passa-o ao seguinte
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self.lock:
+            while self.waiters:
+                waiter = self.waiters.popleft()
+                if waiter.loop is None:
+                    waiter.granted = True
+                    waiter.event.set()
+                    return
+                if waiter.loop.is_closed():
+                    continue
+                waiter.granted = True
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+                return
+            self.available += 1
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Concurrency cap + requests-per-minute + tokens-per-minute limits.
+
+    Any of the limits can be ``None``/0 to disable it. The same limiter serves
+    threads (``slot``) and coroutines (``aslot``), so mixed workloads share one quota.
+    """
+
+    def __init__(self, max_in_flight=None, rpm=None, tpm=None):
+        self.max_in_flight = max_in_flight or None
+        self.semaphore = SlotPool(max_in_flight) if max_in_flight else None
+        self.rpm_bucket = TokenBucket(rpm) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm else None
+
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.tokens = 0
+        self.wait_seconds = 0.0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @contextmanager
+    def slot(self, prompt=None, estimated_tokens=None):
+        """Block until the call fits in every limit, then hold a concurrency slot."""
+        if estimated_tokens is None:
+            estimated_tokens = estimate_tokens(prompt)
+
+        started = time.monotonic()
+        if self.semaphore is not None:
+            self.semaphore.acquire()
+        try:
+            if self.rpm_bucket is not None:
+                self.rpm_bucket.acquire(1)
+            if self.tpm_bucket is not None:
+                self.tpm_bucket.acquire(estimated_tokens)
+            self._start(estimated_tokens, time.monotonic() - started)
+            try:
+                yield
+            finally:
+                self._finish()
+        finally:
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    def _start(self, estimated_tokens, waited):
+        with self.stats_lock:
+            self.requests += 1
+            self.tokens += estimated_tokens
+            self.wait_seconds += waited
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _finish(self):
+        with self.stats_lock:
+            self.in_flight -= 1
+
+    @asynccontextmanager
+    async def aslot(self, prompt=None, estimated_tokens=None):
+        """Async version of ``slot``: waits with ``asyncio.sleep`` instead of blocking the loop."""
+        if estimated_tokens is None:
+            estimated_tokens = estimate_tokens(prompt)
+
+        started = time.monotonic()
+        if self.semaphore is not None:
+            # Partilhado com as threads; o release acorda diretamente o waiter mais antigo
+            await self.semaphore.aacquire()
+        try:
+            if self.rpm_bucket is not None:
+                await asyncio.sleep(self.rpm_bucket.reserve(1))
+            if self.tpm_bucket is not None:
+                await asyncio.sleep(self.tpm_bucket.reserve(estimated_tokens))
+            self._start(estimated_tokens, time.monotonic() - started)
+            try:
+                yield
+            finally:
+                self._finish()
+        finally:
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    def snapshot(self) -> dict:
+        with self.stats_lock:
+            return {
+                "requests": self.requests,
+                "estimated_tokens": self.tokens,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _rate_limiter
+
+
+def set_rate_limiter(limiter: RateLimiter) -> RateLimiter:
+    """Install ``limiter`` as the process-wide limiter and return the previous one."""
+    global _rate_limiter
+    previous = _rate_limiter
+    _rate_limiter = limiter
+    return previous
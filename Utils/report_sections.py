@@ -0,0 +1,269 @@
+"""Report preprocessing: section extraction and a token budget per specialty.
+
+Reports are parsed into entries (one per line) tagged with a section category:
+
+    demographics  header lines before the first heading (ID, name, age, ...)
+    complaint     chief complaint / presenting problem
+    history       medical, family, social history
+    medications   any "Medications:" / prescriptions entry, wherever it appears
+    vitals        vital signs (BP, HR, SpO2, BMI, ...)
+    exam          physical examination
+    labs          lab and diagnostic tests (bloods, ECG, PFT, ...)
+    imaging       X-ray, CT, MRI, echo, ultrasound
+    other         anything else (plan, notes, unknown headings)
+
+Each specialty weighs the categories (RELEVANCE) and also keeps any entry matching its
+triage keywords (Utils/local_triage.py), e.g. "Respiratory Exam: wheezing" for Pulmonology.
+When a report exceeds its budget, each specialty gets only its relevant entries, highest
+priority first, until the budget is used. The omitted entries are listed in a note at the
+end of the text, so the model knows data was left out. Reports within the budget are sent
+whole and identical to every agent, so the shared CASE CONTEXT prefix still caches.
+
+Settings come from the environment:
+    REPORT_TOKEN_BUDGET  estimated tokens of report text per agent (default 6000)
+    REPORT_SECTIONS      auto (default): extract only when a report is over the budget
+                         always: every specialty gets only its relevant entries
+                         off: every agent gets the full report
+"""
+import os
+import re
+from dataclasses import dataclass
+
+from Utils.local_triage import LEXICON
+from Utils.rate_limiter import estimate_tokens
+
+MODES = ("auto", "always", "off")
+CATEGORIES = ("demographics", "complaint", "history", "medications", "vitals", "exam", "labs", "imaging", "other")
+
+# Títulos de secção -> categoria (o primeiro padrão que coincide ganha)
+HEADINGS = [
+    (re.compile(r"chief complaint|presenting (?:complaint|problem)|reason for (?:visit|referral|admission)", re.I), "complaint"),
+    (re.compile(r"medication|prescription|current therapy|drug", re.I), "medications"),
+    (re.compile(r"vital", re.I), "vitals"),
+    (re.compile(r"imaging|radiolog", re.I), "imaging"),
+    (re.compile(r"lab|diagnostic|result|investigation|test", re.I), "labs"),
+    (re.compile(r"physical exam|examination|exam findings", re.I), "exam"),
+    (re.compile(r"history|background|lifestyle|social|allerg", re.I), "history"),
+]
+
+# Entradas "Chave: valor" que mudam de categoria qualquer que seja a secção onde estão
+ENTRY_KEYS = [
+    (re.compile(r"medication|prescri|current therapy|\bdrugs?\b", re.I), "medications"),
+    (re.compile(r"vital|blood pressure|\bbp\b|heart rate|pulse|temperature|respiratory rate|spo2|"
+                r"oxygen saturation|\bbmi\b|weight|height", re.I), "vitals"),
+    (re.compile(r"x-ray|\bct\b|\bmri\b|ultrasound|sonogra|echocardiogra|angiogra|imaging|radiograph|"
+                r"\bpet\b|mammogra|\bscan\b", re.I), "imaging"),
+]
+
+HEADING_LINE = re.compile(r"^\s*([A-Za-z][A-Za-z0-9 /&(),'-]{1,60}):\s*(.*)$")
+
+# 3 = essencial, 2 = relevante, 1 = secundário (só entra se tiver palavras-chave da especialidade), 0 = nunca
+RELEVANCE = {
+    "Cardiology": {"demographics": 3, "complaint": 3, "vitals": 3, "labs": 2, "imaging": 2, "medications": 2,
+                   "history": 2, "exam": 1, "other": 1},
+    "Psychology": {"demographics": 3, "complaint": 3, "history": 3, "medications": 2, "exam": 1, "vitals": 1,
+                   "labs": 1, "imaging": 0, "other": 1},
+    "Pulmonology": {"demographics": 3, "complaint": 3, "imaging": 3, "labs": 2, "vitals": 2, "exam": 2,
+                    "history": 2, "medications": 1, "other": 1},
+    "General_Practitioner": {"demographics": 3, "complaint": 3, "history": 2, "medications": 2, "vitals": 2,
+                             "exam": 2, "labs": 2, "imaging": 2, "other": 2},
+}
+# Triagem e juiz precisam de uma visão geral do doente
+RELEVANCE["Triage"] = RELEVANCE["General_Practitioner"]
+RELEVANCE["Judge"] = RELEVANCE["General_Practitioner"]
+
+ROLE_TARGETS = {
+    "Triage_Balancer": "Triage",
+    "Senior_Cardiologist": "Cardiology", "Novice_Cardiologist": "Cardiology",
+    "Senior_Psychologist": "Psychology", "Novice_Psychologist": "Psychology",
+    "Senior_Pulmonologist": "Pulmonology", "Novice_Pulmonologist": "Pulmonology",
+    "Senior_General_Practitioner": "General_Practitioner", "Novice_General_Practitioner": "General_Practitioner",
+    "Judge": "Judge",
+}
+
+# Tokens reservados para a nota "[Report condensed for ...]"
+NOTE_TOKENS = 40
+
+_KEYWORDS = {sp: [re.compile(pat, re.I) for pat, _ in terms] for sp, terms in LEXICON.items()}
+
+
+@dataclass
+class Entry:
+    position: int
+    category: str
+    heading: str | None   # título da secção a repetir antes da entrada quando ela é extraída
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def _heading_category(title: str) -> str | None:
+    for pattern, category in HEADINGS:
+        if pattern.search(title):
+            return category
+    return None
+
+
+def _entry_category(key: str | None, section: str) -> str:
+    if key:
+        for pattern, category in ENTRY_KEYS:
+            if pattern.search(key):
+                return category
+    return section
+
+
+def parse_sections(report: str) -> list[Entry]:
+    """Split a report into entries tagged with their section category, in original order."""
+    entries = []
+    section, heading = "demographics", None
+    for line in (report or "").splitlines():
+        if not line.strip():
+            continue
+        m = HEADING_LINE.match(line)
+        key, value = (m.group(1).strip(), m.group(2).strip()) if m else (None, line)
+        if m and not value:
+            # Linha só com título: muda de secção
+            section = _heading_category(key) or "other"
+            heading = line.strip()
+            continue
+        if key and section in ("demographics", "complaint") and _heading_category(key):
+            # Título com o texto na mesma linha ("Chief Complaint: ...") ainda no cabeçalho
+            section, heading = _heading_category(key), None
+        entries.append(Entry(len(entries), _entry_category(key, section), heading, line.rstrip()))
+    return entries
+
+
+def _keyword_hit(target: str, text: str) -> bool:
+    # Ao contrário da triagem, menções negadas contam: "no wheezing" é um negativo pertinente
+    return any(pattern.search(text) for pattern in _KEYWORDS.get(target, ()))
+
+
+def _render(entries: list[Entry]) -> str:
+    lines, last_heading = [], None
+    for entry in entries:
+        if entry.heading and entry.heading != last_heading:
+            if lines:
+                lines.append("")
+            lines.append(entry.heading)
+        last_heading = entry.heading
+        lines.append(entry.text)
+    return "\n".join(lines)
+
+
+@dataclass
+class ReportView:
+    target: str
+    text: str
+    report_tokens: int
+    sent_tokens: int
+    omitted: dict          # categoria -> nº de entradas deixadas de fora
+
+    @property
+    def trimmed_tokens(self) -> int:
+        return max(0, self.report_tokens - self.sent_tokens)
+
+    def to_dict(self) -> dict:
+        return {"sent_tokens": self.sent_tokens, "trimmed_tokens": self.trimmed_tokens, "omitted": self.omitted}
+
+
+class PreparedReport:
+    """A report plus the text each specialty / the triage / the judge receives."""
+
+    def __init__(self, report: str, budget: int | None = None, mode: str | None = None):
+        self.report = report
+        self.budget = budget if budget is not None else int(os.getenv("REPORT_TOKEN_BUDGET", "6000"))
+        mode = (mode or os.getenv("REPORT_SECTIONS", "auto")).strip().lower()
+        if mode not in MODES:
+            print(f"REPORT_SECTIONS inválido: {mode!r} (a usar 'auto')")
+            mode = "auto"
+        self.mode = mode
+        self.tokens = estimate_tokens(report)
+        self.entries = parse_sections(report) if self.extracting else []
+        self.views = {}
+
+    @property
+    def extracting(self) -> bool:
+        return self.mode == "always" or (self.mode == "auto" and self.tokens > self.budget)
+
+    def for_target(self, target: str) -> str:
+        """Report text for a specialty ("Cardiology", ...), "Triage" or "Judge"."""
+        view = self.views.get(target)
+        if view is None:
+            view = self.views[target] = self._build(target)
+        return view.text
+
+    def for_role(self, role: str) -> str:
+        return self.for_target(ROLE_TARGETS.get(role, "General_Practitioner"))
+
+    def _build(self, target: str) -> ReportView:
+        if not self.extracting or not self.entries:
+            return ReportView(target, self.report, self.tokens, self.tokens, {})
+        weights = RELEVANCE.get(target, RELEVANCE["General_Practitioner"])
+        candidates = []
+        for entry in self.entries:
+            weight = weights.get(entry.category, 1)
+            hit = _keyword_hit(target, entry.text)
+            if weight >= 2 or (weight == 1 and hit):
+                # Identificação do doente sempre primeiro, depois essenciais; palavras-chave sobem um nível
+                priority = 99 if entry.category == "demographics" else 2 * weight + (2 if hit else 0)
+                candidates.append((-priority, entry.position, entry))
+
+        # Reserva para a nota final; os títulos de secção contam quando a primeira entrada entra
+        chosen, headings, remaining = [], set(), self.budget - NOTE_TOKENS
+        for _, _, entry in sorted(candidates):
+            cost = entry.tokens + (estimate_tokens(entry.heading) if entry.heading not in headings else 0)
+            if cost <= remaining:
+                chosen.append(entry)
+            elif weights.get(entry.category) == 3 and remaining - (cost - entry.tokens) > 50:
+                # Entrada essencial maior que o que resta: entra cortada
+                room = remaining - (cost - entry.tokens)
+                entry = Entry(entry.position, entry.category, entry.heading, entry.text[:room * 4 - 6].rstrip() + " [...]")
+                cost = remaining
+                chosen.append(entry)
+            else:
+                continue
+            headings.add(entry.heading)
+            remaining -= cost
+
+        # Títulos repetidos e linhas em branco só se conhecem ao montar o texto: acerta no fim,
+        # retirando as entradas de menor prioridade (as últimas escolhidas)
+        while chosen and estimate_tokens(_render(sorted(chosen, key=lambda e: e.position))) > self.budget - NOTE_TOKENS:
+            chosen.pop()
+        chosen.sort(key=lambda e: e.position)
+        kept = {e.position for e in chosen}
+        omitted = {}
+        for entry in self.entries:
+            if entry.position not in kept:
+                omitted[entry.category] = omitted.get(entry.category, 0) + 1
+        text = _render(chosen)
+        if omitted:
+            summary = ", ".join(f"{category} ({count})" for category, count in omitted.items())
+            text += f"\n\n[Report condensed for {target.replace('_', ' ')}; omitted entries: {summary}]"
+        return ReportView(target, text, self.tokens, estimate_tokens(text), omitted)
+
+    def summary(self, roles=()) -> dict:
+        """What was sent to each target and how much was trimmed (stored in the result meta).
+
+        ``roles`` lists the calls actually made (role names, "Judge" once per judge call), so
+        ``trimmed_tokens`` is the report text not sent, summed over those calls.
+        """
+        trimmed = 0
+        for role in roles:
+            target = ROLE_TARGETS.get(role, "General_Practitioner")
+            if target in self.views:
+                trimmed += self.views[target].trimmed_tokens
+        return {
+            "mode": self.mode,
+            "budget_tokens": self.budget,
+            "report_tokens": self.tokens,
+            "extracted": self.extracting,
+            "trimmed_tokens": trimmed,
+            "views": {target: view.to_dict() for target, view in sorted(self.views.items())} if self.extracting else {},
+        }
+
+
+def preprocessing_signature() -> str:
+    """Settings that change what the agents receive (part of the prompt-set version)."""
+    return f"sections:{os.getenv('REPORT_SECTIONS', 'auto').strip().lower()}:{os.getenv('REPORT_TOKEN_BUDGET', '6000')}"
@@ -0,0 +1,281 @@
+"""Deadlines, retries and hedged requests for the LLM calls.
+
+Every agent and judge call goes through the process-wide ``CallPolicy``
+(``get_call_policy()``), which also takes the rate-limiter slot for each attempt:
+
+* deadline: an attempt that has not answered after LLM_CALL_TIMEOUT seconds is cancelled
+  and counts as a retryable failure (the wait for a rate-limiter slot is not included);
+* retries: 429, 5xx, timeouts and connection errors are retried up to LLM_MAX_RETRIES
+  times, with exponential backoff and full jitter between LLM_RETRY_BASE and
+  LLM_RETRY_MAX seconds; any other error (400, 401, ...) fails at once;
+* hedging (LLM_HEDGE=on): when an attempt takes longer than the LLM_HEDGE_QUANTILE (p95)
+  latency seen for the same model and role, a duplicate request is sent and the first
+  answer wins; the other one is cancelled. Both the latencies and the hedge clock start
+  once the attempt holds its rate-limiter slot, so queueing behind a saturated limiter
+  never triggers a duplicate. It needs LLM_HEDGE_MIN_SAMPLES latencies
+  first, and streamed calls are never hedged (their chunks are already on screen).
+
+Synchronous calls (``call``) retry with backoff but have no deadline of their own; they
+rely on the HTTP client timeout (LLM_HTTP_TIMEOUT, by default the same LLM_CALL_TIMEOUT,
+set on the pooled clients in Utils/llm_client.py). Retries, timeouts and hedges are counted on the active
+tracing span, and from there reach the result meta and the Prometheus metrics. An optional
+``observe(ok, seconds)`` callback sees the outcome of every attempt (the model router uses
+it for its circuit breakers, Utils/model_router.py).
+
+Settings come from the environment:
+    LLM_CALL_TIMEOUT        seconds per attempt (default 300; 0 disables)
+    LLM_MAX_RETRIES         retries after the first attempt (default 3)
+    LLM_RETRY_BASE          first backoff ceiling in seconds, doubled per retry (default 1)
+    LLM_RETRY_MAX           largest backoff in seconds (default 30)
+    LLM_HEDGE               on | off (default off)
+    LLM_HEDGE_QUANTILE      latency quantile that triggers the duplicate (default 0.95)
+    LLM_HEDGE_MIN_SAMPLES   latencies needed per model/role before hedging (default 20)
+    LLM_HEDGE_MIN_DELAY     never hedge earlier than this, in seconds (default 1)
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from Utils.rate_limiter import get_rate_limiter
+from Utils.tracing import record_queue_wait, record_call_event
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+# Latências guardadas por (modelo, role) para o quantil de hedging
+LATENCY_WINDOW = 200
+
+
+class CallTimeout(TimeoutError):
+    """An attempt exceeded LLM_CALL_TIMEOUT."""
+
+
+class StreamInterrupted(RuntimeError):
+    """A streamed call failed after part of the answer was delivered (not retried)."""
+
+
+def error_status(error: Exception) -> int | None:
+    # BackendError usa .status; google-genai usa .code (o .status é o nome, ex. "UNAVAILABLE")
+    for attr in ("status", "code", "status_code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, StreamInterrupted):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    # Erros de transporte do httpx (ligação recusada, timeout de leitura...) não têm estado HTTP
+    return any(cls.__name__ == "TransportError" for cls in type(error).__mro__)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per key."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def observe(self, key, seconds: float):
+        with self.lock:
+            self.samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key, q: float, min_samples: int = 1) -> float | None:
+        with self.lock:
+            values = sorted(self.samples.get(key, ()))
+        if len(values) < max(1, min_samples):
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class CallPolicy:
+    def __init__(self, timeout: float | None = 300.0, max_retries: int = 3, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0, hedge: bool = False, hedge_quantile: float = 0.95,
+                 hedge_min_samples: int = 20, hedge_min_delay: float = 1.0):
+        self.timeout = timeout or None
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = LatencyTracker()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            timeout=float(os.getenv("LLM_CALL_TIMEOUT", "300")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            backoff_base=float(os.getenv("LLM_RETRY_BASE", "1")),
+            backoff_max=float(os.getenv("LLM_RETRY_MAX", "30")),
+            hedge=os.getenv("LLM_HEDGE", "off").strip().lower() in ("on", "1", "true", "yes"),
+            hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+            hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+            hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "1")),
+        )
+
+    def backoff(self, retry: int) -> float:
+        """Full jitter: uniform between 0 and base * 2^retry (capped)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    def hedge_delay(self, key) -> float | None:
+        if not self.hedge:
+            return None
+        delay = self.latency.quantile(key, self.hedge_quantile, self.hedge_min_samples)
+        return None if delay is None else max(delay, self.hedge_min_delay)
+
+    def _give_up(self, error: Exception, retry: int) -> bool:
+        return retry >= self.max_retries or not is_retryable(error)
+
+    # ---------- assíncrono ----------
+    async def acall(self, call, key, prompt=None, hedge: bool = True, observe=None):
+        """Run ``call`` (a coroutine function making one request) with deadline, retries and hedging.
+
+        ``key`` identifies the latency distribution (model + role); ``prompt`` is used by the
+        rate limiter to estimate tokens for each attempt.
+        """
+        retry = 0
+        while True:
+            try:
+                return await self._ahedged(call, key, prompt, hedge, observe)
+            except Exception as e:
+                if self._give_up(e, retry):
+                    raise
+                delay = self.backoff(retry)
+                retry += 1
+                record_call_event("retries")
+                print(f"Chamada LLM falhou ({type(e).__name__}: {e}); tentativa {retry + 1} em {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _observe(observe, error: Exception | None, seconds: float):
+        # Só falhas do serviço contam para a saúde do modelo (um 400 é um erro do pedido)
+        if observe is not None and (error is None or is_retryable(error)):
+            observe(error is None, seconds)
+
+    async def _aattempt(self, call, key, prompt, observe=None, admitted: asyncio.Event | None = None):
+        waiting = time.perf_counter()
+        async with get_rate_limiter().aslot(prompt):
+            record_queue_wait(time.perf_counter() - waiting)
+            if admitted is not None:
+                admitted.set()
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(call(), self.timeout)
+            except asyncio.TimeoutError:
+                record_call_event("timeouts")
+                error = CallTimeout(f"sem resposta em {self.timeout:g}s")
+                self._observe(observe, error, time.perf_counter() - started)
+                raise error from None
+            except Exception as e:
+                self._observe(observe, e, time.perf_counter() - started)
+                raise
+        seconds = time.perf_counter() - started
+        self.latency.observe(key, seconds)
+        self._observe(observe, None, seconds)
+        return result
+
+    async def _ahedged(self, call, key, prompt, hedge: bool, observe=None):
+        delay = self.hedge_delay(key) if hedge else None
+        admitted = asyncio.Event()
+        first = asyncio.ensure_future(self._aattempt(call, key, prompt, observe, admitted))
+        tasks = {first}
+        try:
+            if delay is None:
+                return await first
+            # O quantil mede o tempo depois de obtido o lugar no limitador: o relógio do duplicado
+            # só começa aí, senão com o limitador saturado todas as chamadas em fila duplicavam
+            started = asyncio.ensure_future(admitted.wait())
+            try:
+                await asyncio.wait({first, started}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                started.cancel()
+            if first.done():
+                return first.result()
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result()
+            # Demorou mais do que o quantil: envia um duplicado e fica com a primeira resposta
+            record_call_event("hedges")
+            second = asyncio.ensure_future(self._aattempt(call, key, prompt, observe))
+            tasks.add(second)
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            record_call_event("hedge_wins")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ---------- síncrono ----------
+    def call(self, call, key, prompt=None, observe=None):
+        """Synchronous counterpart of acall(): retries with backoff, no deadline or hedging."""
+        retry = 0
+        while True:
+            try:
+                waiting = time.perf_counter()
+                with get_rate_limiter().slot(prompt):
+                    record_queue_wait(time.perf_counter() - waiting)
+                    started = time.perf_counter()
+                    try:
+                        result = call()
+                    except Exception as e:
+                        self._observe(observe, e, time.perf_counter() - started)
+                        raise
+                seconds = time.perf_counter() - started
+                self.latency.observe(key, seconds)
+                self._observe(observe, None, seconds)
+                return result
+            except Exception as e:
+                if self._give_up(e, retry):
+                    raise
+                delay = self.backoff(retry)
+                retry += 1
+                record_call_event("retries")
+                print(f"Chamada LLM falhou ({type(e).__name__}: {e}); tentativa {retry + 1} em {delay:.1f}s")
+                time.sleep(delay)
+
+    def settings(self) -> dict:
+        return {
+            "timeout_seconds": self.timeout,
+            "max_retries": self.max_retries,
+            "hedge": self.hedge,
+            "hedge_quantile": self.hedge_quantile if self.hedge else None,
+        }
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_call_policy() -> CallPolicy:
+    """Process-wide policy (created on first use from the environment)."""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = CallPolicy.from_env()
+        return _policy
+
+
+def set_call_policy(policy: CallPolicy | None):
+    global _policy
+    with _policy_lock:
+        _policy = policy
@@ -0,0 +1,220 @@
+"""Content-addressed on-disk cache of LLM responses (SQLite).
+
+Entries are keyed by a hash of (role, rendered prompt, model, generation config), so
+re-running the same reports only pays for the roles whose prompt actually changed.
+Old entries are evicted by age and, when the store grows past its size limit, in
+least-recently-used order.
+
+Settings come from the environment:
+    LLM_CACHE_PATH          SQLite file (default <repo>/.cache/llm_responses.sqlite3)
+    LLM_CACHE_MAX_MB        size limit before LRU eviction (default 512)
+    LLM_CACHE_MAX_AGE_DAYS  entries older than this are ignored and evicted (default 30)
+    LLM_CACHE_BYPASS        "1" skips lookups (fresh responses are still stored)
+    LLM_CACHE_DISABLED      "1" turns the cache off completely
+
+The async pipeline uses ``aget``/``aput``: the SQLite reads and writes run on the cache's own
+thread, so a lookup never blocks the event loop (and the other reports running on it).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+DEFAULT_PATH = Path(__file__).resolve().parents[1] / ".cache" / "llm_responses.sqlite3"
+# Intervalo mínimo entre remoções por idade
+AGE_SWEEP_SECONDS = 60
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes")
+
+
+def make_key(role, prompt, model, config=None) -> str:
+    material = json.dumps(
+        {"role": role, "prompt": prompt, "model": model, "config": config or {}},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=None, max_bytes=None, max_age_seconds=None, bypass=False):
+        self.path = Path(path or DEFAULT_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.bypass = bypass
+
+        self.lock = threading.Lock()
+        # Uma só thread para as chamadas assíncronas: as operações já são serializadas pelo lock
+        self._executor = None
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   role TEXT,
+                   model TEXT,
+                   response TEXT NOT NULL,
+                   size INTEGER NOT NULL,
+                   created REAL NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses(created)")
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        # Total de bytes mantido a cada put: a soma completa só é refeita quando passa do limite
+        self.total_bytes = self._sum_sizes()
+        self._next_age_sweep = 0.0
+        with self.lock:
+            self._evict(time.time())
+
+    @classmethod
+    def from_env(cls):
+        max_mb = float(os.getenv("LLM_CACHE_MAX_MB", "512"))
+        max_age_days = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH") or None,
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb > 0 else None,
+            max_age_seconds=max_age_days * 86400 if max_age_days > 0 else None,
+            bypass=_env_flag("LLM_CACHE_BYPASS"),
+        )
+
+    def get(self, key: str):
+        """Return the cached response for ``key`` or ``None`` (also when bypassed or expired)."""
+        if self.bypass:
+            return None
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, role=None, model=None):
+        if not response:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, role, model, response, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, role, model, response, size, now, now),
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            self.writes += 1
+            self._evict(now)
+
+    def _run(self, fn, *args, **kwargs):
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+        return asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def aget(self, key: str):
+        """``get`` off the event loop."""
+        return await self._run(self.get, key)
+
+    async def aput(self, key: str, response: str, role=None, model=None):
+        """``put`` off the event loop."""
+        await self._run(self.put, key, response, role=role, model=model)
+
+    def _sum_sizes(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self, now):
+        # Expiração por idade no máximo uma vez por minuto (pelo índice de created)
+        if self.max_age_seconds and now >= self._next_age_sweep:
+            self._next_age_sweep = now + AGE_SWEEP_SECONDS
+            cutoff = now - self.max_age_seconds
+            expired, expired_bytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE created < ?", (cutoff,)
+            ).fetchone()
+            if expired:
+                self.conn.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+                self.evictions += expired
+                self.total_bytes -= expired_bytes
+        if not self.max_bytes or self.total_bytes <= self.max_bytes:
+            return
+        # Outros processos podem ter escrito no mesmo ficheiro: confirma o total antes de remover
+        self.total_bytes = self._sum_sizes()
+        if self.total_bytes <= self.max_bytes:
+            return
+        # Remove least-recently-used entries until the store fits again
+        excess = self.total_bytes - self.max_bytes
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if excess <= 0:
+                break
+            doomed.append((key,))
+            excess -= size
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+            "bypass": self.bypass,
+        }
+
+
+_response_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide cache (created on first use), or ``None`` when LLM_CACHE_DISABLED is set."""
+    global _response_cache
+    if _env_flag("LLM_CACHE_DISABLED"):
+        return None
+    with _cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache.from_env()
+        return _response_cache
+
+
+def set_response_cache(cache):
+    """Install ``cache`` as the process-wide cache and return the previous one.
+
+    Installing ``None`` makes the next ``get_response_cache()`` rebuild it from the environment.
+    """
+    global _response_cache
+    with _cache_lock:
+        previous = _response_cache
+        _response_cache = cache
+        return previous
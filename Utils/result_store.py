@@ -0,0 +1,416 @@
+"""Append-only store of diagnosis results (SQLite).
+
+Every run of a report adds one row holding the full result payload, indexed by patient,
+source hash, timestamp and model, so "the latest diagnosis for patient X" or "all runs
+between two dates" is an index lookup instead of parsing every JSON in Results/. Rows are
+never replaced by later runs; the only update is the judge metrics being merged into the
+row of the same run when they arrive.
+
+The legacy ``<patient>_diagnosis<ts>.txt/.json`` pair can still be produced on demand
+(``export``), and results written as files before the store existed can be imported once:
+
+    python -m Utils.result_store import [--dir Results]
+    python -m Utils.result_store query --patient "Anna Thompson" --latest
+    python -m Utils.result_store query --since 2025-12-01 --until 2025-12-31 --model gemini-2.5-flash
+    python -m Utils.result_store export --out /tmp/legacy [--patient ...]
+
+Settings come from the environment:
+    RESULT_STORE_PATH       SQLite file (default <RESULTS_DIR>/results.sqlite3)
+    LEGACY_RESULT_FILES     "1" also writes the TXT/JSON pair of every run (default off)
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+DEFAULT_NAME = "results.sqlite3"
+
+# Nome dos resultados: <paciente>_diagnosis<YYYYMMDD-HHMMSS> (timestamps ordenáveis como texto)
+_RESULT_FILE = re.compile(r"^(?P<patient>.+)_diagnosis(?P<ts>\d{8}-\d{6})$")
+
+COLUMNS = ("id", "run_id", "patient", "timestamp", "source_file", "source_hash", "model",
+           "model_signature", "prompt_version", "backend", "metrics_status")
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes")
+
+
+def legacy_files_enabled() -> bool:
+    return _env_flag("LEGACY_RESULT_FILES")
+
+
+def store_path(results_dir) -> Path:
+    return Path(os.getenv("RESULT_STORE_PATH") or Path(results_dir) / DEFAULT_NAME)
+
+
+def run_id(payload: dict) -> str:
+    """Base name of the legacy files of a run: ``<patient>_diagnosis<ts>``."""
+    return f"{payload['patient_name']}_diagnosis{payload['timestamp']}"
+
+
+def normalize_ts(value, end: bool = False) -> str | None:
+    """``YYYY-MM-DD[ HH:MM[:SS]]`` or ``YYYYMMDD[-HHMMSS]`` → ``YYYYMMDD-HHMMSS``.
+
+    A bare date is the start of the day, or its last second with ``end=True``.
+    """
+    if not value:
+        return None
+    digits = re.sub(r"\D", "", str(value))
+    if len(digits) < 8:
+        raise ValueError(f"data inválida: {value!r}")
+    time_part = digits[8:14]
+    time_part += ("235959" if end else "000000")[len(time_part):]
+    return f"{digits[:8]}-{time_part}"
+
+
+def legacy_txt(payload: dict) -> str:
+    return "### Final Diagnosis\n\n" + str(payload.get("final_diagnosis"))
+
+
+def write_legacy_files(payload: dict, directory) -> tuple[Path, Path]:
+    """Write the TXT/JSON pair of a run to ``directory`` (the JSON atomically)."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    base = run_id(payload)
+    txt_output, json_output = directory / f"{base}.txt", directory / f"{base}.json"
+    txt_output.write_text(legacy_txt(payload), encoding="utf-8")
+    tmp = json_output.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, json_output)
+    return txt_output, json_output
+
+
+class ResultStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   run_id TEXT NOT NULL,
+                   patient TEXT NOT NULL,
+                   timestamp TEXT NOT NULL,
+                   source_file TEXT,
+                   source_hash TEXT,
+                   model TEXT,
+                   model_signature TEXT,
+                   prompt_version TEXT,
+                   backend TEXT,
+                   metrics_status TEXT,
+                   payload TEXT NOT NULL
+               )"""
+        )
+        for name, columns in (
+            ("results_patient", "patient, timestamp"),
+            ("results_timestamp", "timestamp"),
+            ("results_source", "source_hash"),
+            ("results_model", "model, timestamp"),
+            ("results_run", "run_id"),
+            ("results_source_file", "source_file, timestamp"),
+        ):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON results({columns})")
+
+        self.writes = 0
+        self.updates = 0
+
+    @staticmethod
+    def _row(payload: dict, signature: str | None = None) -> tuple:
+        meta = payload.get("meta") or {}
+        return (
+            run_id(payload), payload["patient_name"], payload["timestamp"], meta.get("source_file"),
+            meta.get("source_hash"), meta.get("model"), signature, meta.get("prompt_version"),
+            meta.get("backend"), meta.get("metrics_status"),
+            json.dumps(payload, ensure_ascii=False),
+        )
+
+    def add(self, payload: dict, model_signature: str | None = None) -> int:
+        """Append a run (one transaction) and return its row id.
+
+        ``model_signature`` is what incremental mode compares (all role models + judge).
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self.conn.execute(
+                    "INSERT INTO results (run_id, patient, timestamp, source_file, source_hash, model, "
+                    "model_signature, prompt_version, backend, metrics_status, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._row(payload, model_signature),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.writes += 1
+            return cur.lastrowid
+
+    def update(self, payload: dict, row_id: int | None = None):
+        """Replace the payload of row ``row_id`` (as returned by ``add``) with judge metrics merged.
+
+        Without ``row_id`` the latest row of the same run id is updated; two runs of one patient
+        in the same second share a run id, so the pipeline always passes the row id.
+        """
+        meta = payload.get("meta") or {}
+        values = (json.dumps(payload, ensure_ascii=False), meta.get("metrics_status"))
+        with self.lock:
+            if row_id is not None:
+                self.conn.execute("UPDATE results SET payload = ?, metrics_status = ? WHERE id = ?",
+                                  (*values, row_id))
+            else:
+                self.conn.execute(
+                    "UPDATE results SET payload = ?, metrics_status = ? "
+                    "WHERE id = (SELECT MAX(id) FROM results WHERE run_id = ?)",
+                    (*values, run_id(payload)),
+                )
+            self.updates += 1
+
+    # ---------- consultas ----------
+    @staticmethod
+    def _where(patient=None, source_file=None, source_hash=None, model=None, since=None, until=None):
+        clauses, params = [], []
+        for column, value in (("patient", patient), ("source_file", source_file),
+                              ("source_hash", source_hash), ("model", model)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(normalize_ts(since))
+        if until:
+            clauses.append("timestamp <= ?")
+            params.append(normalize_ts(until, end=True))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _select(self, columns: str, limit, newest_first: bool, filters: dict) -> list:
+        where, params = self._where(**filters)
+        order = "DESC" if newest_first else "ASC"
+        sql = f"SELECT {columns} FROM results{where} ORDER BY timestamp {order}, id {order}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def runs(self, limit: int | None = None, newest_first: bool = True, **filters) -> list[dict]:
+        """Index columns of the matching runs (no payload).
+
+        Filters: ``patient``, ``source_file``, ``source_hash``, ``model`` (exact) and
+        ``since``/``until`` (dates or timestamps, inclusive).
+        """
+        rows = self._select(", ".join(COLUMNS), limit, newest_first, filters)
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def payloads(self, limit: int | None = None, newest_first: bool = True, **filters) -> list[dict]:
+        """Full result payloads of the matching runs (same filters as ``runs``)."""
+        return [json.loads(row[0]) for row in self._select("payload", limit, newest_first, filters)]
+
+    def latest(self, **filters) -> dict | None:
+        """Payload of the most recent run matching the filters (e.g. ``patient=...``)."""
+        found = self.payloads(limit=1, **filters)
+        return found[0] if found else None
+
+    def get(self, run: str) -> dict | None:
+        """Payload of a run by its id (``<patient>_diagnosis<ts>``)."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT payload FROM results WHERE run_id = ? ORDER BY id DESC LIMIT 1", (run,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def run_ids(self) -> set[str]:
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT run_id FROM results")}
+
+    def is_current(self, source_file: str, source_hash: str, prompt_version: str, model_signature: str) -> bool:
+        """True when the latest run of ``source_file`` used the same input, prompts and models."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT source_hash, prompt_version, model_signature FROM results "
+                "WHERE source_file = ? ORDER BY timestamp DESC, id DESC LIMIT 1",
+                (source_file,),
+            ).fetchone()
+        return row is not None and tuple(row) == (source_hash, prompt_version, model_signature)
+
+    # ---------- exportação / importação ----------
+    def export(self, directory, **filters) -> list[Path]:
+        """Write the legacy TXT/JSON pair of every matching run to ``directory``."""
+        written = []
+        for payload in self.payloads(newest_first=False, **filters):
+            written.extend(write_legacy_files(payload, directory))
+        return written
+
+    def import_directory(self, directory) -> dict:
+        """Import the legacy result JSONs of ``directory`` (runs already stored are skipped).
+
+        The model signature of each run is taken from ``manifest.json`` when the manifest
+        still points at that result, so incremental mode keeps skipping those reports.
+        """
+        directory = Path(directory)
+        signatures = {}
+        manifest = directory / "manifest.json"
+        if manifest.is_file():
+            try:
+                for entry in json.loads(manifest.read_text(encoding="utf-8")).get("reports", {}).values():
+                    signatures[Path(entry.get("result_json", "")).stem] = entry.get("model")
+            except Exception as e:
+                print(f"Manifesto ilegível ({manifest.name}): {e}; importado sem assinaturas de modelo")
+
+        known = self.run_ids()
+        counts = {"imported": 0, "skipped": 0, "failed": 0}
+        for path in sorted(directory.glob("*.json")):
+            if not _RESULT_FILE.match(path.stem):
+                continue
+            if path.stem in known:
+                counts["skipped"] += 1
+                continue
+            try:
+                payload = _read_payload(path)
+                self.add(payload, signatures.get(path.stem))
+            except Exception as e:
+                print(f"Não foi possível importar {path.name}: {e}")
+                counts["failed"] += 1
+                continue
+            known.add(path.stem)
+            counts["imported"] += 1
+        return counts
+
+    def stats(self) -> dict:
+        with self.lock:
+            runs, patients = self.conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT patient) FROM results"
+            ).fetchone()
+        return {"runs": runs, "patients": patients, "writes": self.writes, "updates": self.updates}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _read_payload(path: Path) -> dict:
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(payload, dict) or "agents" not in payload:
+        raise ValueError("não é um JSON de resultado")
+    # Resultados antigos podem não ter nome/timestamp no JSON: vêm do nome do ficheiro
+    match = _RESULT_FILE.match(path.stem)
+    payload.setdefault("patient_name", match["patient"])
+    payload.setdefault("timestamp", match["ts"])
+    return payload
+
+
+def iter_results(directory):
+    """Every result payload under ``directory``: the store first, then legacy JSON files not in it.
+
+    Used by the tools that replay past results (stub replay, triage agreement), so they work
+    both with the store and with result files from before it.
+    """
+    directory = Path(directory)
+    seen = set()
+    db = directory / DEFAULT_NAME
+    if db.is_file():
+        store = ResultStore(db)
+        try:
+            for payload in store.payloads(newest_first=False):
+                seen.add(run_id(payload))
+                yield payload
+        finally:
+            store.close()
+    for path in sorted(directory.glob("*.json")):
+        if path.stem in seen or not _RESULT_FILE.match(path.stem):
+            continue
+        try:
+            yield _read_payload(path)
+        except Exception:
+            continue
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_result_store(results_dir) -> ResultStore:
+    """Process-wide store for ``results_dir`` (one connection per database file)."""
+    path = store_path(results_dir).resolve()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ResultStore(path)
+        return _stores[path]
+
+
+def set_result_store(results_dir, store: ResultStore | None):
+    """Install ``store`` for ``results_dir`` (``None`` reopens it from disk on next use)."""
+    path = store_path(results_dir).resolve()
+    with _stores_lock:
+        previous = _stores.pop(path, None)
+        if store is not None:
+            _stores[path] = store
+        return previous
+
+
+def main(argv=None):
+    base_dir = Path(__file__).resolve().parents[1]
+    parser = argparse.ArgumentParser(description="Base de dados de resultados (importar, consultar, exportar)")
+    parser.add_argument("--db", type=Path, help="ficheiro SQLite (por omissão <dir>/results.sqlite3)")
+    parser.add_argument("--dir", type=Path, default=base_dir / "Results", help="diretório de resultados")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("import", help="importa os JSONs de resultados existentes (idempotente)")
+    for name, help_text in (("query", "lista as execuções que correspondem aos filtros"),
+                            ("export", "escreve os pares TXT/JSON antigos das execuções")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--patient")
+        p.add_argument("--source-file")
+        p.add_argument("--source-hash")
+        p.add_argument("--model")
+        p.add_argument("--since", help="data/timestamp inicial (inclusive), ex. 2025-12-01")
+        p.add_argument("--until", help="data/timestamp final (inclusive)")
+        p.add_argument("--limit", type=int)
+        if name == "query":
+            p.add_argument("--latest", action="store_true", help="só a execução mais recente (payload completo)")
+            p.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+        else:
+            p.add_argument("--out", type=Path, required=True, help="diretório de destino")
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.db or store_path(args.dir))
+    if args.command == "import":
+        counts = store.import_directory(args.dir)
+        print(f"{counts['imported']} importados, {counts['skipped']} já existentes, {counts['failed']} falhados "
+              f"→ {store.path}")
+        return 0
+
+    filters = {"patient": args.patient, "source_file": args.source_file, "source_hash": args.source_hash,
+               "model": args.model, "since": args.since, "until": args.until}
+    if args.command == "export":
+        written = store.export(args.out, **filters)
+        print(f"{len(written) // 2} execuções exportadas para {args.out}")
+        return 0
+
+    if args.latest:
+        payload = store.latest(**filters)
+        if payload is None:
+            print("Nenhuma execução encontrada.")
+            return 1
+        print(json.dumps(payload, ensure_ascii=False, indent=2) if args.json else legacy_txt(payload))
+        return 0
+    rows = store.runs(limit=args.limit, **filters)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        for row in rows:
+            print(f"{row['timestamp']}  {row['patient']:<24} {row['model'] or '-':<24} "
+                  f"{row['metrics_status'] or '-':<9} {row['source_file'] or ''}")
+        print(f"{len(rows)} execuções")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
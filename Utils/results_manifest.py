@@ -0,0 +1,63 @@
+"""Manifest of the latest result produced for each input report.
+
+``Results/manifest.json`` maps every source file to the content hash it had when it was
+last processed, the prompt-set version and model used, and the result files written.
+Batch mode uses it to skip reports whose input, prompts and model are all unchanged.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+def file_hash(data) -> str:
+    """SHA-256 of the raw bytes of a report (``bytes`` or a path)."""
+    if not isinstance(data, (bytes, bytearray)):
+        data = Path(data).read_bytes()
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultsManifest:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.entries = {}
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8")).get("reports", {})
+            except Exception as e:
+                print(f"Manifesto ilegível ({self.path.name}): {e}; a começar um novo")
+
+    def is_current(self, source_file: str, source_hash: str, prompt_version: str, model: str) -> bool:
+        """True when the latest result was produced from the same input, prompts and model."""
+        entry = self.entries.get(source_file)
+        if not entry:
+            return False
+        if (entry.get("source_hash"), entry.get("prompt_version"), entry.get("model")) != (
+            source_hash, prompt_version, model
+        ):
+            return False
+        # O resultado tem de continuar a existir em disco
+        return (self.path.parent / entry.get("result_json", "")).is_file()
+
+    def record(self, source_file: str, source_hash: str, prompt_version: str, model: str,
+               result_json: str, result_txt: str, timestamp: str):
+        with self.lock:
+            self.entries[source_file] = {
+                "source_hash": source_hash,
+                "prompt_version": prompt_version,
+                "model": model,
+                "result_json": result_json,
+                "result_txt": result_txt,
+                "timestamp": timestamp,
+            }
+            self._save()
+
+    def _save(self):
+        # Escrita atómica: um batch interrompido nunca deixa o manifesto corrompido
+        data = {"updated": datetime.now().isoformat(timespec="seconds"), "reports": self.entries}
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.path)
@@ -0,0 +1,79 @@
+"""Policy for speculative specialist execution.
+
+Senior specialists can be started at the same time as the TriageBalancer instead of
+waiting for it. Once triage resolves, speculative calls for specialties that were not
+selected are cancelled (or, if they already finished, discarded) and counted as waste.
+
+Modes (SPECULATION env var or ``--speculation``):
+    off      never speculate (default)
+    latency  speculate every senior specialist on every report
+    cost     speculate only the specialties selected in at least SPECULATION_MIN_RATE
+             (default 0.5) of the triage decisions seen so far in this process
+"""
+import os
+import threading
+
+MODES = ("off", "cost", "latency")
+SPECIALTIES = ("Cardiology", "Psychology", "Pulmonology", "General_Practitioner")
+
+
+class SpeculationPolicy:
+    def __init__(self, mode: str | None = None, min_rate: float | None = None):
+        mode = (mode or os.getenv("SPECULATION", "off")).strip().lower()
+        if mode not in MODES:
+            print(f"SPECULATION inválido: {mode!r} (a usar 'off')")
+            mode = "off"
+        self.mode = mode
+        self.min_rate = min_rate if min_rate is not None else float(os.getenv("SPECULATION_MIN_RATE", "0.5"))
+
+        self.lock = threading.Lock()
+        self.decisions = 0
+        self.selected_counts = {s: 0 for s in SPECIALTIES}
+        self.launched = 0
+        self.used = 0
+        self.cancelled = 0
+        self.discarded = 0
+
+    def choose(self) -> list[str]:
+        """Specialties whose senior agent should start before triage resolves."""
+        if self.mode == "off":
+            return []
+        if self.mode == "latency":
+            return list(SPECIALTIES)
+        with self.lock:
+            if not self.decisions:
+                # Sem histórico ainda: especula tudo até haver dados
+                return list(SPECIALTIES)
+            return [s for s in SPECIALTIES if self.selected_counts[s] / self.decisions >= self.min_rate]
+
+    def observe(self, needed: list[str]):
+        """Record which specialties' seniors the triage decision actually needed."""
+        with self.lock:
+            self.decisions += 1
+            for s in needed:
+                if s in self.selected_counts:
+                    self.selected_counts[s] += 1
+
+    def record(self, launched: int, used: int, cancelled: int, discarded: int):
+        with self.lock:
+            self.launched += launched
+            self.used += used
+            self.cancelled += cancelled
+            self.discarded += discarded
+
+    def stats(self) -> dict:
+        with self.lock:
+            wasted = self.cancelled + self.discarded
+            return {
+                "mode": self.mode,
+                "launched": self.launched,
+                "used": self.used,
+                "wasted": wasted,
+                "cancelled": self.cancelled,
+                "discarded": self.discarded,
+                "waste_ratio": round(wasted / self.launched, 3) if self.launched else 0.0,
+                "selection_rates": {
+                    s: round(c / self.decisions, 3) if self.decisions else None
+                    for s, c in self.selected_counts.items()
+                },
+            }
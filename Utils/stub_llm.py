@@ -0,0 +1,578 @@
+"""Offline, deterministic stand-in for the LLM APIs, for load tests without network or quota.
+
+``StubResponder`` decides, for each prompt, how long the "model" takes, whether the call
+fails and what it answers. Answers are canned (shaped like the real ones: triage JSON,
+specialist text, MDT list, judge JSON) or replayed from past result JSONs in Results/;
+specialist prompts carrying the MDT handoff instructions get the JSON handoff object
+(assessment + compact findings, see Utils/handoff.py).
+The same responder backs two things:
+
+* the in-process ``stub`` backend (``LLM_BACKEND=stub``, see Utils/backends.py);
+* an HTTP server speaking the OpenAI chat-completions and Gemini generateContent
+  protocols, so the real client code paths (pools, SSE streaming, HTTP errors) can be
+  exercised too, including Gemini explicit context caches (``cachedContents``):
+
+    python -m Utils.stub_llm --port 8700 --latency lognormal:2,0.5 --error-rate 0.05
+    LLM_BACKEND=openai OPENAI_BASE_URL=http://127.0.0.1:8700/v1 python Main.py
+    LLM_BACKEND=gemini GEMINI_BASE_URL=http://127.0.0.1:8700 python Main.py
+
+Usage reports count as cached the longest prompt prefix already seen (in ~256-token
+blocks), emulating provider prefix caching, so the savings of the shared CASE CONTEXT
+also show up offline.
+
+Configuration (environment or CLI flags):
+    STUB_LATENCY       S | fixed:S | uniform:A,B | normal:MEAN,SD | lognormal:MEDIAN,SIGMA
+                       seconds per call (default lognormal:1.5,0.5); checked at start-up
+    STUB_ROLE_LATENCY  per-role overrides, "Triage_Balancer=fixed:1;Judge=lognormal:3,0.3"
+                       (roles as in Agents.py, "Specialist" for every specialist, plus
+                       Judge and Judge:batch)
+    STUB_TIME_SCALE    multiplies every latency, e.g. 0.01 to replay a day in minutes (default 1)
+    STUB_ERROR_RATE    fraction of calls that fail (default 0)
+    STUB_429_SHARE     share of those failures that are 429 instead of 503 (default 0.5)
+    STUB_SEED          seed; the same seed and prompt give the same answer (default 0)
+    STUB_REPLAY_DIR    directory with result JSONs to replay answers from (default: canned)
+    STUB_WORDS         length of canned specialist answers in words (default 250)
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from Utils.result_store import iter_results
+
+SPECIALTIES = ("Cardiology", "Psychology", "Pulmonology")
+
+# Frases de cada persona nos templates de Agents.py -> role
+PERSONAS = [
+    ("Chief of Cardiology", "Senior_Cardiologist"),
+    ("Cardiology Resident", "Novice_Cardiologist"),
+    ("Clinical Psychologist", "Senior_Psychologist"),
+    ("Psychology Intern", "Novice_Psychologist"),
+    ("Attending Pulmonologist", "Senior_Pulmonologist"),
+    ("respiratory ward", "Novice_Pulmonologist"),
+    ("Senior Internist", "Senior_General_Practitioner"),
+    ("Internal Medicine Resident", "Novice_General_Practitioner"),
+]
+
+SPECIALIST_ROLES = {role for _, role in PERSONAS} | {"Specialist"}
+
+FILLER = (
+    "The presentation is consistent with the reported history. Vital signs should be "
+    "reviewed together with the timeline of symptoms. Red flags are not evident from the "
+    "available data, but serial assessment is advised. Laboratory results support a "
+    "conservative approach. Further testing is recommended if symptoms persist. The "
+    "differential remains broad given the limited objective findings."
+).split(". ")
+
+# Instruções de handoff estruturado (Utils/prompts.py): o especialista responde em JSON
+HANDOFF_MARKER = "### MDT HANDOFF"
+DIFFERENTIALS = (
+    "Generalized anxiety disorder", "Stable angina", "Paroxysmal atrial fibrillation", "Asthma",
+    "Chronic obstructive pulmonary disease", "Hypothyroidism", "Iron-deficiency anaemia",
+    "Gastro-oesophageal reflux disease",
+)
+
+
+class StubError(Exception):
+    """A simulated API failure (``status`` is the HTTP status it stands for)."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status} {message}")
+        self.status = status
+
+
+def _fingerprint(report_text: str) -> str:
+    return report_text.strip()[:160]
+
+
+# Número de parâmetros de cada distribuição de latência
+LATENCY_ARGS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+
+def parse_latency(spec: str):
+    """'lognormal:1.5,0.5' -> function(rng) returning seconds; a bare number means 'fixed:N'.
+
+    Invalid specs raise ValueError here, when the configuration is read, not on the first call.
+    """
+    spec = (spec or "fixed:0").strip()
+    try:
+        seconds = float(spec)
+    except ValueError:
+        seconds = None
+    if seconds is not None:
+        return _constant(seconds)
+    kind, _, args = spec.partition(":")
+    kind = kind.strip().lower()
+    if kind not in LATENCY_ARGS:
+        raise ValueError(f"distribuição de latência desconhecida: {spec!r} "
+                         f"(use um número de segundos ou {' | '.join(LATENCY_ARGS)}:...)")
+    try:
+        values = [float(v) for v in args.split(",") if v.strip()] or [0.0]
+    except ValueError:
+        raise ValueError(f"parâmetros de latência inválidos: {spec!r}") from None
+    if len(values) < LATENCY_ARGS[kind]:
+        raise ValueError(f"{kind} precisa de {LATENCY_ARGS[kind]} parâmetros: {spec!r}")
+    if kind == "fixed":
+        return _constant(values[0])
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: math.exp(math.log(max(values[0], 1e-6)) + values[1] * rng.gauss(0, 1))
+
+
+def _constant(seconds: float):
+    if seconds < 0:
+        raise ValueError(f"latência negativa: {seconds}")
+    return lambda rng: seconds
+
+
+def parse_role_latency(spec: str | dict | None) -> dict:
+    """'Triage_Balancer=fixed:1;Judge=lognormal:3,0.3' (or a dict) -> {role: sampler}."""
+    if not spec:
+        return {}
+    if isinstance(spec, str):
+        spec = dict(item.split("=", 1) for item in spec.split(";") if "=" in item)
+    return {role.strip(): parse_latency(value.strip()) for role, value in spec.items()}
+
+
+def classify_prompt(prompt: str) -> str:
+    """Which kind of agent a prompt belongs to (role name, 'Judge' or 'Judge:batch')."""
+    if "--- AGENT OUTPUTS ---" in prompt:
+        return "Judge:batch"
+    if "--- AGENT OUTPUT ---" in prompt:
+        return "Judge"
+    if "Triage Specialist" in prompt:
+        return "Triage_Balancer"
+    if "Medical Director" in prompt:
+        return "MultidisciplinaryTeam"
+    for marker, role in PERSONAS:
+        if marker in prompt:
+            return role
+    return "Specialist"
+
+
+class StubResponder:
+    def __init__(self, latency: str = "lognormal:1.5,0.5", error_rate: float = 0.0, share_429: float = 0.5,
+                 seed: int = 0, replay_dir=None, words: int = 250, role_latency=None, time_scale: float = 1.0):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.role_latency = parse_role_latency(role_latency)
+        self.time_scale = time_scale
+        self.error_rate = error_rate
+        self.share_429 = share_429
+        self.seed = seed
+        self.words = words
+        self.replay = self._load_replay(replay_dir) if replay_dir else {}
+        self.lock = threading.Lock()
+        self.attempts = {}     # hash do prompt -> nº de chamadas (as repetições podem ter outro destino)
+        self.prefixes = set()  # hashes dos prefixos já vistos (emulação da cache de prefixo)
+        self.contexts = {}     # nome -> texto das caches de contexto explícitas (servidor Gemini)
+        self.contexts_created = 0
+        self.calls = 0
+        self.errors = 0
+        self.cached_tokens = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=os.getenv("STUB_LATENCY", "lognormal:1.5,0.5"),
+            error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+            share_429=float(os.getenv("STUB_429_SHARE", "0.5")),
+            seed=int(os.getenv("STUB_SEED", "0")),
+            replay_dir=os.getenv("STUB_REPLAY_DIR") or None,
+            words=int(os.getenv("STUB_WORDS", "250")),
+            role_latency=os.getenv("STUB_ROLE_LATENCY") or None,
+            time_scale=float(os.getenv("STUB_TIME_SCALE", "1")),
+        )
+
+    @staticmethod
+    def _load_replay(directory) -> dict:
+        """{kind: [answers]} from the results in ``directory`` (result store and/or JSON files).
+
+        Answers are also indexed per source report under (kind, fingerprint), where the
+        fingerprint is the start of the report text, so a prompt carrying that report gets
+        the answers recorded for it.
+        """
+        pools = {}
+        directory = Path(directory)
+        reports_dir = directory.parent / "Medical Reports"
+        for data in iter_results(directory):
+            fingerprint = None
+            source = reports_dir / str((data.get("meta") or {}).get("source_file", ""))
+            if source.is_file():
+                fingerprint = _fingerprint(source.read_text(encoding="utf-8", errors="ignore"))
+
+            def add(kind, text):
+                pools.setdefault(kind, []).append(text)
+                if fingerprint:
+                    pools.setdefault((kind, fingerprint), []).append(text)
+
+            for name, text in (data.get("agents") or {}).items():
+                if text:
+                    add("Triage_Balancer" if name == "Triage" else name, text)
+            if data.get("final_diagnosis"):
+                add("MultidisciplinaryTeam", data["final_diagnosis"])
+            for metric in (data.get("metrics") or {}).values():
+                if isinstance(metric, dict) and "score" in metric:
+                    add("Judge", json.dumps(metric, ensure_ascii=False))
+        return pools
+
+    def _replay_pool(self, kind: str, prompt: str):
+        for key in self.replay:
+            if isinstance(key, tuple) and key[0] == kind and key[1] in prompt:
+                return self.replay[key]
+        return self.replay.get(kind)
+
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(prompt.encode("utf-8", errors="ignore")).hexdigest()
+        with self.lock:
+            attempt = self.attempts.get(digest, 0)
+            self.attempts[digest] = attempt + 1
+            self.calls += 1
+        return random.Random(f"{self.seed}:{digest}:{attempt}")
+
+    def plan(self, prompt: str):
+        """(latency_seconds, StubError | None, answer_text) for one call."""
+        rng = self._rng(prompt)
+        kind = classify_prompt(prompt)
+        sampler = self.role_latency.get(kind)
+        if sampler is None and kind in SPECIALIST_ROLES:
+            sampler = self.role_latency.get("Specialist")
+        latency = (sampler or self.latency)(rng) * self.time_scale
+        error = None
+        if rng.random() < self.error_rate:
+            with self.lock:
+                self.errors += 1
+            if rng.random() < self.share_429:
+                error = StubError(429, "RESOURCE_EXHAUSTED: stub rate limit")
+            else:
+                error = StubError(503, "UNAVAILABLE: stub overloaded")
+        return latency, error, self.answer(prompt, rng, kind)
+
+    # Granularidade da cache de prefixo emulada (~256 tokens)
+    PREFIX_BLOCK = 1024
+
+    def cached_prefix_tokens(self, prompt: str) -> int:
+        """Emulates provider prefix caching: tokens in the longest block-aligned prefix seen before."""
+        digest = hashlib.sha256()
+        blocks = []
+        for end in range(self.PREFIX_BLOCK, len(prompt) + 1, self.PREFIX_BLOCK):
+            digest.update(prompt[end - self.PREFIX_BLOCK:end].encode("utf-8", errors="ignore"))
+            blocks.append(digest.copy().hexdigest())
+        with self.lock:
+            hits = 0
+            for block in blocks:
+                if block not in self.prefixes:
+                    break
+                hits += 1
+            self.prefixes.update(blocks)
+            self.cached_tokens += hits * self.PREFIX_BLOCK // 4
+        return hits * self.PREFIX_BLOCK // 4
+
+    def create_context(self, text: str) -> str:
+        with self.lock:
+            self.contexts_created += 1
+            name = f"cachedContents/stub-{self.contexts_created}"
+            self.contexts[name] = text
+        return name
+
+    def delete_context(self, name: str) -> bool:
+        with self.lock:
+            return self.contexts.pop(name, None) is not None
+
+    def answer(self, prompt: str, rng: random.Random, kind: str | None = None) -> str:
+        kind = kind or classify_prompt(prompt)
+        if kind == "Judge:batch":
+            names = re.findall(r"=== AGENT: (\S+) ===", prompt)
+            return json.dumps({name: self._metric(rng) for name in names}, ensure_ascii=False)
+        pool = self._replay_pool(kind, prompt) if self.replay else None
+        if pool:
+            text = pool[rng.randrange(len(pool))]
+            return self._handoff(rng, text) if self._wants_handoff(kind, prompt) else text
+        if kind == "Judge":
+            return json.dumps(self._metric(rng), ensure_ascii=False)
+        if kind == "Triage_Balancer":
+            return json.dumps({
+                sp: {"weight": rng.randint(0, 10), "reasoning": f"Stub triage for {sp}."} for sp in SPECIALTIES
+            })
+        if kind == "MultidisciplinaryTeam":
+            return json.dumps([
+                {"diagnosis": f"Stub diagnosis {i + 1}", "confidence_level": rng.choice(["High", "Medium", "Low"]),
+                 "synthesis_reasoning": self._text(rng, 40)}
+                for i in range(3)
+            ], ensure_ascii=False)
+        text = f"## {kind} assessment\n\n{self._text(rng, self.words)}"
+        return self._handoff(rng, text) if self._wants_handoff(kind, prompt) else text
+
+    @staticmethod
+    def _wants_handoff(kind: str, prompt: str) -> bool:
+        return kind in SPECIALIST_ROLES and HANDOFF_MARKER in prompt
+
+    @staticmethod
+    def _handoff(rng: random.Random, assessment: str) -> str:
+        findings = {
+            "key_findings": [s.rstrip(".") for s in rng.sample(FILLER, 3)],
+            "differentials": [
+                {"diagnosis": d, "likelihood": rng.choice(["High", "Medium", "Low"]),
+                 "evidence": rng.choice(FILLER).rstrip(".")}
+                for d in rng.sample(DIFFERENTIALS, 2)
+            ],
+            "risk_level": rng.choice(["High", "Medium", "Low"]),
+            "red_flags": [],
+            "recommendations": ["Serial assessment", rng.choice(["Repeat bloods", "Holter monitoring", "Spirometry"])],
+        }
+        return json.dumps({"assessment": assessment, "findings": findings}, ensure_ascii=False)
+
+    @staticmethod
+    def _metric(rng: random.Random) -> dict:
+        score = rng.randint(55, 95)
+        rating = "excellent" if score >= 85 else "good" if score >= 70 else "fair"
+        return {"score": score, "rating": rating, "explanation": "Stub evaluation."}
+
+    @staticmethod
+    def _text(rng: random.Random, words: int) -> str:
+        out = []
+        while sum(len(s.split()) for s in out) < words:
+            out.append(rng.choice(FILLER).rstrip(".") + ".")
+        return " ".join(out)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"calls": self.calls, "errors": self.errors, "latency": self.latency_spec,
+                    "error_rate": self.error_rate, "cached_tokens": self.cached_tokens,
+                    "context_caches": len(self.contexts)}
+
+
+def split_chunks(text: str, size: int = 40) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def stream_delays(latency: float, chunks: int, ttft_share: float = 0.3) -> list[float]:
+    """Spread ``latency`` over a stream: ~30% before the first chunk, the rest evenly."""
+    first = latency * ttft_share
+    rest = (latency - first) / max(1, chunks - 1)
+    return [first] + [rest] * (chunks - 1)
+
+
+_responder = None
+_responder_lock = threading.Lock()
+
+
+def get_stub_responder() -> StubResponder:
+    global _responder
+    with _responder_lock:
+        if _responder is None:
+            _responder = StubResponder.from_env()
+        return _responder
+
+
+def set_stub_responder(responder: StubResponder | None):
+    global _responder
+    with _responder_lock:
+        _responder = responder
+
+
+# ==========================================
+# Servidor HTTP (OpenAI + Gemini)
+# ==========================================
+def _usage(prompt: str, text: str) -> tuple[int, int]:
+    return max(1, len(prompt) // 4), max(1, len(text) // 4)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    responder: StubResponder = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict | None = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, error: StubError):
+        headers = {"Retry-After": "1"} if error.status == 429 else None
+        self._send_json(error.status, {"error": {"code": error.status, "message": str(error)}}, headers)
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _sse(self, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/healthz"):
+            self._send_json(200, {"status": "ok", **self.responder.stats()})
+        elif self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_DELETE(self):
+        m = re.search(r"(cachedContents/[^/?]+)$", self.path.split("?")[0])
+        if m and self.responder.delete_context(m.group(1)):
+            self._send_json(200, {})
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "cached content not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"code": 400, "message": "invalid JSON"}})
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            return self._openai(body)
+        if path.endswith("/cachedContents"):
+            return self._gemini_cache(body)
+        m = re.search(r"/models/([^/:]+):(generateContent|streamGenerateContent)$", path)
+        if m:
+            return self._gemini(body, m.group(1), m.group(2) == "streamGenerateContent")
+        self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+    def _openai(self, body: dict):
+        prompt = "\n".join(str(msg.get("content", "")) for msg in body.get("messages", []))
+        model = body.get("model", "stub")
+        latency, error, text = self.responder.plan(prompt)
+        if not body.get("stream"):
+            time.sleep(latency)
+            if error:
+                return self._send_error(error)
+            return self._send_json(200, {
+                "id": "stub", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": self._openai_usage(prompt, text),
+            })
+        chunks = split_chunks(text)
+        delays = stream_delays(latency, len(chunks))
+        time.sleep(delays[0])
+        if error:
+            return self._send_error(error)
+        self._start_sse()
+        for chunk, delay in zip(chunks, [0.0] + delays[1:]):
+            time.sleep(delay)
+            self._sse({"id": "stub", "object": "chat.completion.chunk", "model": model,
+                       "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._sse({"id": "stub", "object": "chat.completion.chunk", "model": model, "choices": [],
+                       "usage": self._openai_usage(prompt, text)})
+        self._sse("[DONE]")
+
+    def _openai_usage(self, prompt: str, text: str) -> dict:
+        prompt_tokens, completion_tokens = _usage(prompt, text)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": self.responder.cached_prefix_tokens(prompt)}}
+
+    def _gemini_cache(self, body: dict):
+        text = "\n".join(
+            str(part.get("text", "")) for content in body.get("contents", []) for part in content.get("parts", [])
+        )
+        name = self.responder.create_context(text)
+        self._send_json(200, {"name": name, "model": body.get("model"), "displayName": body.get("displayName"),
+                              "usageMetadata": {"totalTokenCount": max(1, len(text) // 4)}})
+
+    def _gemini(self, body: dict, model: str, stream: bool):
+        prompt = "\n".join(
+            str(part.get("text", "")) for content in body.get("contents", []) for part in content.get("parts", [])
+        )
+        cached_name = body.get("cachedContent")
+        if cached_name:
+            if cached_name not in self.responder.contexts:
+                return self._send_json(404, {"error": {"code": 404, "message": f"{cached_name} not found"}})
+            cached_text = self.responder.contexts[cached_name]
+            prompt = cached_text + prompt
+        latency, error, text = self.responder.plan(prompt)
+
+        def candidate(chunk, done):
+            out = {"candidates": [{"content": {"role": "model", "parts": [{"text": chunk}]}, "index": 0}],
+                   "modelVersion": model}
+            if done:
+                prompt_tokens, completion_tokens = _usage(prompt, text)
+                cached = len(cached_text) // 4 if cached_name else self.responder.cached_prefix_tokens(prompt)
+                out["candidates"][0]["finishReason"] = "STOP"
+                out["usageMetadata"] = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                                        "cachedContentTokenCount": cached,
+                                        "totalTokenCount": prompt_tokens + completion_tokens}
+            return out
+
+        if not stream:
+            time.sleep(latency)
+            if error:
+                return self._send_error(error)
+            return self._send_json(200, candidate(text, True))
+        chunks = split_chunks(text)
+        delays = stream_delays(latency, len(chunks))
+        time.sleep(delays[0])
+        if error:
+            return self._send_error(error)
+        self._start_sse()
+        for i, (chunk, delay) in enumerate(zip(chunks, [0.0] + delays[1:])):
+            time.sleep(delay)
+            self._sse(candidate(chunk, i == len(chunks) - 1))
+
+
+def serve(host: str = "127.0.0.1", port: int = 8700, responder: StubResponder | None = None) -> ThreadingHTTPServer:
+    """Build the stub server (call ``serve_forever()`` on it, or run it in a thread)."""
+    handler = type("BoundStubHandler", (StubHandler,), {"responder": responder or StubResponder.from_env()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor LLM falso (OpenAI/Gemini) para testes de carga offline")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--latency", default=os.getenv("STUB_LATENCY", "lognormal:1.5,0.5"))
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("STUB_ERROR_RATE", "0")))
+    parser.add_argument("--share-429", type=float, default=float(os.getenv("STUB_429_SHARE", "0.5")))
+    parser.add_argument("--seed", type=int, default=int(os.getenv("STUB_SEED", "0")))
+    parser.add_argument("--replay", default=os.getenv("STUB_REPLAY_DIR"),
+                        help="diretório com JSONs de resultados para repetir respostas (ex.: Results)")
+    parser.add_argument("--words", type=int, default=int(os.getenv("STUB_WORDS", "250")))
+    parser.add_argument("--role-latency", default=os.getenv("STUB_ROLE_LATENCY"),
+                        help='latência por role, ex.: "Triage_Balancer=fixed:1;Judge=lognormal:3,0.3"')
+    parser.add_argument("--time-scale", type=float, default=float(os.getenv("STUB_TIME_SCALE", "1")))
+    args = parser.parse_args(argv)
+
+    try:
+        responder = StubResponder(args.latency, args.error_rate, args.share_429, args.seed, args.replay, args.words,
+                                  args.role_latency, args.time_scale)
+    except ValueError as e:
+        parser.error(str(e))
+    server = serve(args.host, args.port, responder)
+    print(f"Stub LLM em http://{args.host}:{args.port} (latência {args.latency}, erros {args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""Per-stage tracing with token and cost accounting.
+
+Every LLM call (triage, each specialist, each judge call, MDT synthesis) and every result
+file write runs inside a ``Span`` that records its wall time, the time spent waiting for
+the rate limiter (queue wait), the prompt/output/cached token counts reported by the API
+(``usage_metadata`` for Gemini, ``usage`` for OpenAI-compatible APIs) and the estimated
+cost. The spans of one report are grouped in a ``ReportTrace``. LLM spans also count the
+retries, timeouts and hedged duplicates of the call (Utils/resilience.py).
+
+The active trace and span live in context variables, so Agents.py and the backends can
+attach data without extra parameters (``record_usage``, ``record_queue_wait``).
+
+Outputs:
+    payload["trace"]   spans + totals, stored in the result JSON
+    TRACE_FILE         JSONL, one line per finished span (Main defaults it to
+                       Results/traces.jsonl; "off" disables it)
+    prometheus_text()  process-wide counters/histograms in Prometheus text format
+                       (Main writes them to Results/metrics.prom after each batch)
+
+Prices are USD per 1M tokens (input, output, cached input); LLM_PRICES_FILE points to a
+JSON file with the same shape to override or extend ``PRICES``.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+PRICES = {
+    "gemini-2.5-pro": (1.25, 10.00, 0.31),
+    "gemini-2.5-flash-lite": (0.10, 0.40, 0.025),
+    "gemini-2.5-flash": (0.30, 2.50, 0.075),
+    "gemini-2.0-flash-lite": (0.075, 0.30, 0.019),
+    "gemini-2.0-flash": (0.10, 0.40, 0.025),
+}
+
+# Eventos de resiliência contados por chamada (Utils/resilience.py)
+CALL_EVENTS = ("retries", "timeouts", "hedges", "hedge_wins")
+
+# Limites dos buckets do histograma de duração (segundos)
+BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+
+_current_trace = ContextVar("report_trace", default=None)
+_current_span = ContextVar("span", default=None)
+
+
+def _load_prices() -> dict:
+    prices = dict(PRICES)
+    path = os.getenv("LLM_PRICES_FILE")
+    if path and Path(path).is_file():
+        try:
+            prices.update({k: tuple(v) for k, v in json.loads(Path(path).read_text(encoding="utf-8")).items()})
+        except Exception as e:
+            print(f"LLM_PRICES_FILE inválido ({e}); a usar os preços por omissão")
+    return prices
+
+
+_prices = None
+
+
+def estimate_cost(model: str | None, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float | None:
+    """Estimated USD cost of one call; None when the model has no known price."""
+    global _prices
+    if not model:
+        return None
+    if _prices is None:
+        _prices = _load_prices()
+    name = model.split(":", 1)[1] if model.startswith(("openai:", "stub:")) else model
+    if model.startswith("stub") or name.endswith(":free") or model == "local":
+        return 0.0
+    # "gemini-2.5-flash-001" usa o preço do prefixo mais longo conhecido
+    matches = [key for key in _prices if name == key or name.startswith(key + "-")]
+    if not matches:
+        return None
+    price_in, price_out, price_cached = _prices[max(matches, key=len)]
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return round((uncached * price_in + cached_tokens * price_cached + output_tokens * price_out) / 1e6, 6)
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str                    # triage | specialist | judge | mdt | write
+    # model "local": passo sem LLM (ex.: triagem local), não conta como chamada
+    role: str | None = None
+    model: str | None = None
+    started_at: float = 0.0      # segundos desde o início do relatório
+    wall_seconds: float = 0.0
+    queue_wait_seconds: float = 0.0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: float | None = None
+    cached: bool = False         # resposta servida pela cache local (sem chamada)
+    error: str | None = None
+    retries: int = 0             # tentativas repetidas após 429/5xx/timeout
+    timeouts: int = 0            # tentativas canceladas pelo prazo
+    hedges: int = 0              # pedidos duplicados enviados por demora
+    hedge_wins: int = 0          # vezes em que o duplicado respondeu primeiro
+    route: dict | None = None    # decisão do router de modelos (Utils/model_router.py)
+    _t0: float = field(default=0.0, repr=False)
+
+    @property
+    def is_llm_call(self) -> bool:
+        return self.kind != "write" and self.model != "local"
+
+    def to_dict(self) -> dict:
+        out = asdict(self)
+        out.pop("_t0")
+        return out
+
+
+class MetricsRegistry:
+    """Process-wide aggregates of finished spans, exported as Prometheus text."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}      # (metric, labels) -> value
+        self.histograms = {}    # kind -> [bucket counts..., +Inf, sum]
+
+    def _inc(self, metric: str, labels: tuple, value: float):
+        key = (metric, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, span: Span):
+        role = span.role or span.name
+        with self.lock:
+            if span.is_llm_call:
+                self._inc("mdt_llm_calls_total", (("kind", span.kind), ("role", role), ("model", span.model or ""),
+                                                  ("cached", str(span.cached).lower())), 1)
+                for direction in ("prompt", "output", "cached"):
+                    tokens = getattr(span, f"{direction}_tokens")
+                    if tokens:
+                        self._inc("mdt_tokens_total", (("kind", span.kind), ("role", role), ("direction", direction)), tokens)
+                if span.cost_usd:
+                    self._inc("mdt_cost_usd_total", (("kind", span.kind), ("role", role)), span.cost_usd)
+            if span.queue_wait_seconds:
+                self._inc("mdt_queue_wait_seconds_total", (("kind", span.kind),), span.queue_wait_seconds)
+            for event in CALL_EVENTS:
+                if getattr(span, event):
+                    self._inc("mdt_call_events_total", (("kind", span.kind), ("event", event)), getattr(span, event))
+            if span.error:
+                self._inc("mdt_span_errors_total", (("kind", span.kind),), 1)
+            hist = self.histograms.setdefault(span.kind, [0] * (len(BUCKETS) + 2))
+            for i, bound in enumerate(BUCKETS):
+                if span.wall_seconds <= bound:
+                    hist[i] += 1
+            hist[len(BUCKETS)] += 1
+            hist[len(BUCKETS) + 1] += span.wall_seconds
+
+    def totals(self) -> dict:
+        with self.lock:
+            out = {"llm_calls": 0, "cache_hits": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0,
+                   **{event: 0 for event in CALL_EVENTS}}
+            for (metric, labels), value in self.counters.items():
+                labels = dict(labels)
+                if metric == "mdt_llm_calls_total":
+                    out["llm_calls" if labels["cached"] == "false" else "cache_hits"] += int(value)
+                elif metric == "mdt_tokens_total":
+                    out[f"{labels['direction']}_tokens"] += int(value)
+                elif metric == "mdt_cost_usd_total":
+                    out["cost_usd"] += value
+                elif metric == "mdt_call_events_total":
+                    out[labels["event"]] += int(value)
+            out["cost_usd"] = round(out["cost_usd"], 4)
+            return out
+
+    def prometheus_text(self) -> str:
+        helps = {
+            "mdt_llm_calls_total": ("counter", "LLM calls per stage (cached=true: served by the local response cache)"),
+            "mdt_tokens_total": ("counter", "Tokens reported by the API per stage"),
+            "mdt_cost_usd_total": ("counter", "Estimated cost in USD per stage"),
+            "mdt_queue_wait_seconds_total": ("counter", "Time spent waiting for the rate limiter"),
+            "mdt_span_errors_total": ("counter", "Spans that ended with an error"),
+            "mdt_call_events_total": ("counter", "Retries, timeouts and hedged requests of LLM calls"),
+        }
+        lines = []
+        with self.lock:
+            for metric, (kind, text) in helps.items():
+                series = [(labels, v) for (m, labels), v in sorted(self.counters.items()) if m == metric]
+                if not series:
+                    continue
+                lines += [f"# HELP {metric} {text}", f"# TYPE {metric} {kind}"]
+                for labels, value in series:
+                    lines.append(f"{metric}{_labels(labels)} {_number(value)}")
+            if self.histograms:
+                lines += ["# HELP mdt_span_seconds Wall time per stage", "# TYPE mdt_span_seconds histogram"]
+                for kind, hist in sorted(self.histograms.items()):
+                    for bound, count in zip(BUCKETS, hist):
+                        lines.append(f"mdt_span_seconds_bucket{_labels((('kind', kind), ('le', str(bound))))} {count}")
+                    lines.append(f"mdt_span_seconds_bucket{_labels((('kind', kind), ('le', '+Inf')))} {hist[len(BUCKETS)]}")
+                    lines.append(f"mdt_span_seconds_sum{_labels((('kind', kind),))} {_number(hist[len(BUCKETS) + 1])}")
+                    lines.append(f"mdt_span_seconds_count{_labels((('kind', kind),))} {hist[len(BUCKETS)]}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    def escape(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.6f}"
+
+
+metrics = MetricsRegistry()
+_file_lock = threading.Lock()
+
+
+class ReportTrace:
+    """Spans of one report; ``trace_file`` (optional) receives each span as a JSONL line."""
+
+    def __init__(self, report_id: str, trace_file=None):
+        self.report_id = report_id
+        self.trace_file = Path(trace_file) if trace_file else None
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.spans: list[Span] = []
+
+    def add(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+        if self.trace_file is not None:
+            line = json.dumps({"report": self.report_id, **span.to_dict()}, ensure_ascii=False)
+            with _file_lock, open(self.trace_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            calls = [s.to_dict() for s in self.spans if s.is_llm_call and not s.cached]
+            spans = [s.to_dict() for s in self.spans]
+        by_kind = {}
+        for s in spans:
+            agg = by_kind.setdefault(s["kind"], {"count": 0, "wall_seconds": 0.0, "cost_usd": 0.0})
+            agg["count"] += 1
+            agg["wall_seconds"] = round(agg["wall_seconds"] + s["wall_seconds"], 3)
+            agg["cost_usd"] = round(agg["cost_usd"] + (s["cost_usd"] or 0), 6)
+        costs = [s["cost_usd"] for s in calls]
+        return {
+            "spans": spans,
+            "totals": {
+                "wall_seconds": round(max((s["started_at"] + s["wall_seconds"] for s in spans), default=0.0), 3),
+                "llm_calls": len(calls),
+                "prompt_tokens": sum(s["prompt_tokens"] for s in calls),
+                "output_tokens": sum(s["output_tokens"] for s in calls),
+                "cached_tokens": sum(s["cached_tokens"] for s in calls),
+                "queue_wait_seconds": round(sum(s["queue_wait_seconds"] for s in spans), 3),
+                # None se algum modelo não tiver preço conhecido
+                "cost_usd": round(sum(costs), 6) if all(c is not None for c in costs) else None,
+                "by_kind": by_kind,
+                "resilience": self.event_counts(),
+            },
+        }
+
+    def event_counts(self) -> dict:
+        """Retries/timeouts/hedges of the report, in total and per call that had any."""
+        with self.lock:
+            spans = list(self.spans)
+        out = {event: sum(getattr(s, event) for s in spans) for event in CALL_EVENTS}
+        out["calls"] = {
+            s.name: {event: getattr(s, event) for event in CALL_EVENTS if getattr(s, event)}
+            for s in spans if any(getattr(s, event) for event in CALL_EVENTS)
+        }
+        return out
+
+
+def current_trace() -> ReportTrace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: ReportTrace | None):
+    """Make ``trace`` the active trace in this context (spans started inside join it)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str, role: str | None = None, model: str | None = None):
+    """Time a stage. The span joins the active trace (if any) and the process metrics."""
+    trace = _current_trace.get()
+    s = Span(name=name, kind=kind, role=role, model=model, _t0=time.perf_counter())
+    if trace is not None:
+        s.started_at = round(s._t0 - trace.started, 3)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        s.wall_seconds = round(time.perf_counter() - s._t0, 3)
+        if s.is_llm_call and not s.cached:
+            s.cost_usd = estimate_cost(s.model, s.prompt_tokens, s.output_tokens, s.cached_tokens)
+        metrics.observe(s)
+        if trace is not None:
+            trace.add(s)
+
+
+def record_usage(prompt_tokens: int | None = 0, output_tokens: int | None = 0, cached_tokens: int | None = 0):
+    """Attach token counts reported by the API to the active span (no-op outside a span)."""
+    s = _current_span.get()
+    if s is not None:
+        s.prompt_tokens += prompt_tokens or 0
+        s.output_tokens += output_tokens or 0
+        s.cached_tokens += cached_tokens or 0
+
+
+def record_queue_wait(seconds: float):
+    s = _current_span.get()
+    if s is not None:
+        s.queue_wait_seconds = round(s.queue_wait_seconds + seconds, 3)
+
+
+def record_call_event(event: str, count: int = 1):
+    """Count a retry/timeout/hedge (``CALL_EVENTS``) on the active span."""
+    s = _current_span.get()
+    if s is not None:
+        setattr(s, event, getattr(s, event) + count)
+
+
+def record_route(decision: dict, model: str):
+    """Store the routing decision on the active span; its model becomes the one actually called."""
+    s = _current_span.get()
+    if s is not None:
+        s.route = decision
+        s.model = model
+
+
+def mark_cached():
+    s = _current_span.get()
+    if s is not None:
+        s.cached = True
+
+
+def prometheus_text() -> str:
+    return metrics.prometheus_text()
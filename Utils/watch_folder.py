@@ -0,0 +1,226 @@
+"""Watch a folder for new or rewritten files and yield them once they stop changing.
+
+Linux uses inotify (through libc with ctypes, so no extra dependency); elsewhere, or if
+inotify is unavailable (e.g. some network filesystems, exhausted watches), the folder is
+polled. Either way a file is only reported after its size and mtime have been stable for
+``settle`` seconds, so a report still being copied or written is never picked up half-way;
+with inotify a file that was opened for writing must also have been closed (or moved in),
+unless it stays untouched for ``stale_after`` seconds (a writer that died).
+Hidden and temporary files (``.name``, ``*.tmp``, ``*.part``, ``*~``) are ignored.
+
+Settings come from the environment (see ``FolderWatcher.from_env``):
+    WATCH_MODE              auto | inotify | poll (default auto)
+    WATCH_SETTLE            seconds a file must stay unchanged (default 2)
+    WATCH_POLL_INTERVAL     seconds between directory scans in poll mode (default 1)
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+MODES = ("auto", "inotify", "poll")
+
+# inotify(7)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+_EVENT = struct.Struct("iIII")
+
+IGNORED_SUFFIXES = (".tmp", ".part", ".swp", "~")
+
+
+def _ignored(name: str) -> bool:
+    return name.startswith(".") or name.endswith(IGNORED_SUFFIXES)
+
+
+class _Inotify:
+    """Minimal non-blocking inotify handle for one directory."""
+
+    def __init__(self, directory: Path):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify só existe em Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch falhou para {directory}")
+
+    def read(self) -> tuple[list[tuple[str, int]], bool]:
+        """([(name, event mask)], queue overflowed) — everything readable right now."""
+        events, overflow = [], False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif name:
+                    events.append((os.fsdecode(name), mask))
+        return events, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    def __init__(self, directory, pattern: str = "*.txt", mode: str = "auto", settle: float = 2.0,
+                 poll_interval: float = 1.0, stale_after: float | None = None):
+        if mode not in MODES:
+            raise ValueError(f"modo de observação inválido: {mode!r} (use {', '.join(MODES)})")
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.requested_mode = mode
+        self.mode = None
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after if stale_after is not None else max(30.0, 10 * settle)
+        self._inotify = None
+        # Ficheiros abertos para escrita (inotify): só ficam prontos depois do IN_CLOSE_WRITE
+        self._writing = set()
+        # path → (size, mtime_ns) visto pela última vez e instante em que mudou
+        self._candidates = {}
+        # path → (size, mtime_ns) da última vez que foi entregue
+        self._delivered = {}
+        self._closed = asyncio.Event()
+        self._wake = asyncio.Event()
+
+    @classmethod
+    def from_env(cls, directory, pattern: str = "*.txt"):
+        return cls(
+            directory, pattern,
+            mode=os.getenv("WATCH_MODE", "auto").strip().lower(),
+            settle=float(os.getenv("WATCH_SETTLE", "2")),
+            poll_interval=float(os.getenv("WATCH_POLL_INTERVAL", "1")),
+        )
+
+    def _start(self):
+        if self.requested_mode in ("auto", "inotify"):
+            try:
+                self._inotify = _Inotify(self.directory)
+                asyncio.get_running_loop().add_reader(self._inotify.fd, self._on_inotify)
+                self.mode = "inotify"
+            except Exception as e:
+                if self.requested_mode == "inotify":
+                    raise
+                print(f"inotify indisponível ({e}); a observar {self.directory} por polling")
+        if self.mode is None:
+            self.mode = "poll"
+        # Os ficheiros que já existem também são candidatos
+        self._scan()
+
+    def _matches(self, name: str) -> bool:
+        return not _ignored(name) and fnmatch.fnmatch(name, self.pattern)
+
+    def _touch(self, path: Path):
+        """Record the current size/mtime of ``path``; any change restarts its settle timer."""
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self._candidates.pop(path, None)
+            return
+        if not path.is_file():
+            return
+        signature = (st.st_size, st.st_mtime_ns)
+        previous = self._candidates.get(path)
+        if previous is None or previous[0] != signature:
+            self._candidates[path] = (signature, time.monotonic())
+
+    def _scan(self):
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if self._matches(entry.name):
+                self._touch(Path(entry.path))
+
+    def _on_inotify(self):
+        events, overflow = self._inotify.read()
+        if overflow:
+            # A fila do kernel transbordou: eventos perdidos, por isso volta a ver a pasta toda
+            self._writing.clear()
+            self._scan()
+        for name, mask in events:
+            if not self._matches(name):
+                continue
+            path = self.directory / name
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._writing.discard(path)
+            elif mask & (IN_CREATE | IN_MODIFY):
+                self._writing.add(path)
+            self._touch(path)
+        self._wake.set()
+
+    def _settled(self) -> list[Path]:
+        now = time.monotonic()
+        ready = []
+        for path, (signature, changed_at) in list(self._candidates.items()):
+            if now - changed_at < self.settle:
+                continue
+            if path in self._writing and now - changed_at < self.stale_after:
+                continue
+            # Confirma que nada mudou desde o último evento/scan (cópias lentas sem eventos)
+            self._touch(path)
+            current = self._candidates.get(path)
+            if current is None or current[0] != signature:
+                continue
+            del self._candidates[path]
+            self._writing.discard(path)
+            if signature[0] == 0 or self._delivered.get(path) == signature:
+                continue
+            self._delivered[path] = signature
+            ready.append(path)
+        return sorted(ready)
+
+    async def ready(self):
+        """Async iterator of files that are new or changed and have settled, until ``close()``."""
+        self._start()
+        tick = max(0.05, min(self.poll_interval, self.settle / 2 or self.poll_interval))
+        try:
+            while not self._closed.is_set():
+                if self.mode == "poll":
+                    self._scan()
+                for path in self._settled():
+                    if self._closed.is_set():
+                        return
+                    yield path
+                self._wake.clear()
+                # Acorda no próximo tick, num evento inotify ou no close()
+                waiters = [asyncio.ensure_future(self._wake.wait()), asyncio.ensure_future(self._closed.wait())]
+                try:
+                    await asyncio.wait(waiters, timeout=tick, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for waiter in waiters:
+                        waiter.cancel()
+        finally:
+            self._stop()
+
+    def close(self):
+        self._closed.set()
+
+    def _stop(self):
+        if self._inotify is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            except Exception:
+                pass
+            self._inotify.close()
+            self._inotify = None
@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from Utils.model_router import set_model_router
+from Utils.response_cache import ResponseCache, set_response_cache
+from Utils.stub_llm import set_stub_responder
+
+
+@pytest.fixture(autouse=True)
+def stub_env(tmp_path, monkeypatch):
+    """Backend stub sem latência, cache de respostas própria do teste e singletons limpos."""
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.setenv("STUB_LATENCY", "0")
+    for name in ("FALLBACK_BACKEND", "MODEL_ROUTES", "MODEL_ROUTING", "OPENAI_API_KEY",
+                 "OPENROUTER_API_KEY", "LLM_CACHE_DISABLED", "LLM_CACHE_BYPASS", "MDT_HANDOFF"):
+        monkeypatch.delenv(name, raising=False)
+    cache = ResponseCache(path=tmp_path / "responses.sqlite3")
+    set_response_cache(cache)
+    set_model_router(None)
+    set_stub_responder(None)
+    yield cache
+    set_response_cache(None)
+    set_model_router(None)
+    set_stub_responder(None)
+    cache.conn.close()
@@ -0,0 +1,48 @@
+import json
+
+from Utils.analytics import MAX_WEIGHT, ResultColumns
+from Utils.result_store import ResultStore
+
+
+def triage_payload(ts, weights):
+    return {
+        "patient_name": f"Patient {ts}",
+        "timestamp": ts,
+        "agents": {"Triage": json.dumps({sp: {"weight": w, "reasoning": ""} for sp, w in weights.items()})},
+        "metrics": {},
+        "meta": {"model": "stub"},
+    }
+
+
+def test_triage_distribution_histogram_covers_full_scale(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.add(triage_payload("20260101-100000", {"Cardiology": 0, "Psychology": 7, "Pulmonology": 10}))
+    store.add(triage_payload("20260102-100000", {"Cardiology": 10, "Psychology": 2, "Pulmonology": 10}))
+    store.close()
+
+    columns = ResultColumns.build(tmp_path, threshold=5)
+    out = columns.triage_distribution(columns.run_mask())
+
+    for specialty in ("Cardiology", "Psychology", "Pulmonology"):
+        histogram = out[specialty]["histogram"]
+        assert list(histogram) == [str(w) for w in range(MAX_WEIGHT + 1)]
+        assert sum(histogram.values()) == out[specialty]["n"] == 2
+    assert out["Cardiology"]["histogram"]["0"] == 1
+    assert out["Cardiology"]["histogram"]["10"] == 1
+    assert out["Pulmonology"]["histogram"]["10"] == 2
+    assert out["Pulmonology"]["mean"] == 10.0
+    assert out["Psychology"]["histogram"]["7"] == 1
+    assert out["Psychology"]["selected_rate"] == 0.5
+
+
+def test_triage_distribution_respects_run_mask(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.add(triage_payload("20260101-100000", {"Cardiology": 3, "Psychology": 3, "Pulmonology": 3}))
+    store.add(triage_payload("20260105-100000", {"Cardiology": 9, "Psychology": 9, "Pulmonology": 9}))
+    store.close()
+
+    columns = ResultColumns.build(tmp_path, threshold=5)
+    out = columns.triage_distribution(columns.run_mask(since="2026-01-03"))
+    assert out["Cardiology"]["n"] == 1
+    assert out["Cardiology"]["histogram"]["9"] == 1
+    assert out["Cardiology"]["selected_rate"] == 1.0
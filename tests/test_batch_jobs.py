@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from Utils.Agents import NoviceCardiologist, TriageBalancer, aevaluate_batch_with_gemini
+from Utils.batch_jobs import BatchRun, LocalBatchProvider, agent_request, cached_answer, judge_requests, read_jsonl
+from Utils.stub_llm import get_stub_responder
+
+REPORT = """Patient: Jane Doe
+Chief Complaint: palpitations and chest tightness during exercise.
+History: hypertension, smoker, episodes of anxiety at night.
+"""
+
+
+def stub_calls() -> int:
+    return get_stub_responder().stats()["calls"]
+
+
+def test_agent_request_uses_live_cache_key(stub_env):
+    row = agent_request(NoviceCardiologist(REPORT))
+    assert row["backend"] == "stub" and row["check"] == "text"
+
+    # A chamada ao vivo guarda a resposta exatamente sob a chave do pedido em lote
+    answer = asyncio.run(NoviceCardiologist(REPORT).arun())
+    assert stub_env.get(row["custom_id"]) == answer
+    assert cached_answer(NoviceCardiologist(REPORT)) == answer
+    assert agent_request(NoviceCardiologist(REPORT)) is None
+
+
+def test_ingested_batch_answer_is_a_live_cache_hit(stub_env):
+    row = agent_request(TriageBalancer(REPORT))
+    stored, failed = BatchRun.ingest([row], [{"custom_id": row["custom_id"], "text": "```json\n{\"a\": 1}\n```"}])
+    assert (stored, failed) == (1, 0)
+
+    calls = stub_calls()
+    # O mesmo texto que a chamada ao vivo guardaria: sem as cercas de código
+    assert asyncio.run(TriageBalancer(REPORT).arun()) == '{"a": 1}'
+    assert cached_answer(TriageBalancer(REPORT)) == '{"a": 1}'
+    assert stub_calls() == calls
+
+
+def test_local_provider_fills_cache_for_live_run(stub_env, tmp_path):
+    rows = [agent_request(NoviceCardiologist(REPORT)), agent_request(TriageBalancer(REPORT))]
+    results_path = tmp_path / "specialists.results.jsonl"
+    asyncio.run(LocalBatchProvider(concurrency=2).collect(["local"], rows, results_path))
+    results = read_jsonl(results_path)
+    assert sorted(r["custom_id"] for r in results) == sorted(r["custom_id"] for r in rows)
+    assert BatchRun.ingest(rows, results) == (2, 0)
+
+    calls = stub_calls()
+    asyncio.run(NoviceCardiologist(REPORT).arun())
+    asyncio.run(TriageBalancer(REPORT).arun())
+    assert stub_calls() == calls
+
+
+def test_judge_batch_request_matches_live_judge_key(stub_env):
+    outputs = {"NoviceCardiologist": "Resposta do cardiologista.", "TriageBalancer": "{}"}
+    [row] = judge_requests(REPORT, outputs, batch=True)
+    assert row["role"] == "Judge:batch" and row["agents"] == sorted(outputs)
+
+    raw = json.dumps({name: {"score": 70, "rating": "good", "explanation": "ok"} for name in outputs})
+    assert BatchRun.ingest([row], [{"custom_id": row["custom_id"], "text": raw}]) == (1, 0)
+    assert judge_requests(REPORT, outputs, batch=True) == []
+
+    calls = stub_calls()
+    metrics = asyncio.run(aevaluate_batch_with_gemini(REPORT, outputs))
+    assert {name: m["score"] for name, m in metrics.items()} == {name: 70 for name in outputs}
+    assert stub_calls() == calls
+
+
+def test_invalid_batch_answers_are_not_cached(stub_env):
+    [row] = judge_requests(REPORT, {"NoviceCardiologist": "Resposta."}, batch=False)
+    assert BatchRun.ingest([row], [{"custom_id": row["custom_id"], "text": "sem JSON"}]) == (0, 1)
+    assert stub_env.get(row["custom_id"]) is None
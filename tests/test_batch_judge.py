@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+from Utils.Agents import _parse_batch_evaluation, aevaluate_batch_with_gemini, evaluate_batch_with_gemini
+from Utils.backends import LLMBackend
+
+REPORT = "Patient: Jane Doe\nChief Complaint: palpitations.\n"
+OUTPUTS = {"Senior_Cardiologist": "Resposta A.", "Senior_Psychologist": "Resposta B."}
+
+
+def metric(score):
+    return {"score": score, "rating": "good", "explanation": "ok"}
+
+
+class ScriptedJudge(LLMBackend):
+    """Juiz falso: a avaliação em lote esquece o psicólogo; as individuais dão 55."""
+    name = "scripted"
+
+    def __init__(self):
+        super().__init__("judge")
+        self.prompts = []
+
+    def generate(self, prompt, config=None, context=None):
+        self.prompts.append((context or "") + prompt)
+        if "Senior_Psychologist" in prompt and "Senior_Cardiologist" in prompt:
+            return "```json\n" + json.dumps({"Senior_Cardiologist": metric(80)}) + "\n```"
+        return json.dumps(metric(55))
+
+    async def agenerate(self, prompt, config=None, context=None):
+        return self.generate(prompt, config, context)
+
+
+def test_parse_batch_evaluation_keeps_only_valid_metrics():
+    raw = json.dumps({"Senior_Cardiologist": metric(70), "Senior_Psychologist": {"rating": "good"}, "Outro": metric(1)})
+    assert _parse_batch_evaluation(raw, OUTPUTS) == {"Senior_Cardiologist": metric(70)}
+    assert _parse_batch_evaluation("sem JSON", OUTPUTS) == {}
+    assert _parse_batch_evaluation("[1, 2]", OUTPUTS) == {}
+
+
+def test_one_call_for_all_agents_with_fallback_for_missing_ones():
+    judge = ScriptedJudge()
+    metrics = evaluate_batch_with_gemini(REPORT, OUTPUTS, backend=judge)
+    assert metrics == {"Senior_Cardiologist": metric(80), "Senior_Psychologist": metric(55)}
+    # Uma chamada em lote e uma individual para o agente em falta; o relatório vai uma só vez em cada
+    assert len(judge.prompts) == 2
+    assert all(prompt.count("palpitations") == 1 for prompt in judge.prompts)
+
+
+def test_async_batch_judge_matches_sync():
+    judge = ScriptedJudge()
+    metrics = asyncio.run(aevaluate_batch_with_gemini(REPORT, OUTPUTS, backend=judge))
+    assert metrics == {"Senior_Cardiologist": metric(80), "Senior_Psychologist": metric(55)}
+    assert list(metrics) == list(OUTPUTS)
+
+
+def test_incomplete_batch_answers_are_not_cached(stub_env):
+    judge = ScriptedJudge()
+    evaluate_batch_with_gemini(REPORT, OUTPUTS, backend=judge)
+    evaluate_batch_with_gemini(REPORT, OUTPUTS, backend=judge)
+    # A resposta em lote incompleta volta a ser pedida; a individual vem da cache
+    assert len(judge.prompts) == 3
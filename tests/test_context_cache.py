@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+from Utils.context_cache import ContextCacheRegistry, is_cache_rejection, is_caching_unsupported
+from Utils.tracing import ReportTrace, use_trace
+
+CONTEXT = "CASE CONTEXT\n" + "palpitations " * 400
+
+
+class APIError(Exception):
+    """Como google.genai.errors.APIError: o estado HTTP fica em ``code``."""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeCaches:
+    def __init__(self):
+        self.live = {}
+        self.created = 0
+        self.error = None
+
+    async def create(self, model, config):
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        self.created += 1
+        name = f"cachedContents/{self.created}"
+        self.live[name] = model
+        return type("Cached", (), {"name": name})()
+
+    async def delete(self, name):
+        del self.live[name]
+
+
+class FakeClient:
+    def __init__(self):
+        self.aio = type("Aio", (), {})()
+        self.aio.caches = FakeCaches()
+
+
+def registry(**kwargs):
+    # Sem google-genai instalado não é preciso construir o config real
+    reg = ContextCacheRegistry(ttl_seconds=600, min_tokens=100, **kwargs)
+    reg._create_config = lambda context: {"contents": [context]}
+    return reg
+
+
+def test_concurrent_callers_share_one_cache_and_release_deletes_it():
+    reg, client = registry(), FakeClient()
+    first, second = ReportTrace("a"), ReportTrace("b")
+
+    async def call(trace):
+        with use_trace(trace):
+            return await reg.aget(client, "gemini-2.5-flash", CONTEXT)
+
+    async def scenario():
+        names = await asyncio.gather(call(first), call(first), call(second))
+        assert len(set(names)) == 1 and client.aio.caches.created == 1
+        # Ainda usada pelo segundo relatório: não é apagada
+        await reg.arelease(first)
+        assert len(client.aio.caches.live) == 1
+        await reg.arelease(second)
+        assert client.aio.caches.live == {}
+
+    asyncio.run(scenario())
+    assert reg.stats()["deleted"] == 1
+    assert reg.entries == {} and reg.key_locks == {}
+
+
+def test_expired_entries_are_pruned():
+    reg, client = registry(), FakeClient()
+
+    async def scenario():
+        await reg.aget(client, "m", CONTEXT)
+        for entry in reg.entries.values():
+            entry["expires"] = time.monotonic() - 1
+        reg.key_locks[("m", "old")] = threading.Lock()
+        await reg.aget(client, "m", CONTEXT + "outro")
+
+    asyncio.run(scenario())
+    assert len(reg.entries) == 1
+    assert reg.key_locks == {}
+
+
+def test_short_context_goes_inline():
+    reg, client = registry(), FakeClient()
+    assert asyncio.run(reg.aget(client, "m", "curto")) is None
+    assert reg.stats()["inline"] == 1 and client.aio.caches.created == 0
+
+
+def test_only_unsupported_errors_disable_caching():
+    reg, client = registry(), FakeClient()
+    client.aio.caches.error = APIError("quota exceeded", 403)
+    assert asyncio.run(reg.aget(client, "m", CONTEXT)) is None
+    assert reg.unsupported == set()
+
+    client.aio.caches.error = APIError("Explicit caching is not supported for this model", 400)
+    assert asyncio.run(reg.aget(client, "m", CONTEXT)) is None
+    assert reg.unsupported == {"m"}
+
+
+def test_error_predicates():
+    assert is_cache_rejection(APIError("not found", 404))
+    assert is_cache_rejection(APIError("CachedContent expired", 403))
+    assert not is_cache_rejection(APIError("quota", 429))
+    assert not is_cache_rejection(APIError("permission denied", 403))
+    assert is_caching_unsupported(APIError("model not found", 404))
+    assert not is_caching_unsupported(APIError("invalid argument", 400))
@@ -0,0 +1,83 @@
+import asyncio
+
+from Utils import eval_queue
+from Utils.eval_queue import EvaluationQueue
+from Utils.stub_llm import get_stub_responder
+
+REPORT = "Patient: Jane Doe\nChief Complaint: palpitations.\n"
+OUTPUTS = {"Senior_Cardiologist": "Resposta A.", "Senior_Psychologist": "Resposta B."}
+
+
+def judge_calls() -> int:
+    return get_stub_responder().stats()["calls"]
+
+
+def test_batch_job_is_one_judge_call_and_drain_waits_for_followups():
+    merged = []
+
+    async def scenario():
+        queue = EvaluationQueue(workers=2, batch=True)
+        future = queue.submit(REPORT, OUTPUTS)
+
+        async def merge():
+            merged.append(await future)
+
+        queue.track(merge())
+        await queue.close()
+        return queue.stats()
+
+    st = asyncio.run(scenario())
+    assert judge_calls() == 1
+    assert set(merged[0]) == set(OUTPUTS)
+    assert all(isinstance(m["score"], (int, float)) for m in merged[0].values())
+    assert (st["submitted"], st["completed"], st["depth"], st["dropped"]) == (1, 1, 0, 0)
+
+
+def test_unbatched_job_grades_each_answer():
+    async def scenario():
+        queue = EvaluationQueue(workers=1, batch=False)
+        metrics = await queue.submit(REPORT, OUTPUTS)
+        await queue.close()
+        return metrics
+
+    assert set(asyncio.run(scenario())) == set(OUTPUTS)
+    assert judge_calls() == len(OUTPUTS)
+
+
+def test_evaluator_errors_become_error_metrics(monkeypatch):
+    async def broken(*args, **kwargs):
+        raise RuntimeError("juiz em baixo")
+
+    monkeypatch.setattr(eval_queue, "aevaluate_batch_with_gemini", broken)
+
+    async def scenario():
+        queue = EvaluationQueue(workers=1, batch=True)
+        metrics = await queue.submit(REPORT, OUTPUTS)
+        await queue.close()
+        return metrics
+
+    metrics = asyncio.run(scenario())
+    assert {m["rating"] for m in metrics.values()} == {"error"}
+    assert "juiz em baixo" in metrics["Senior_Cardiologist"]["explanation"]
+
+
+def test_failed_followup_does_not_abort_drain():
+    done = []
+
+    async def failing():
+        raise OSError("base de dados bloqueada")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        done.append(True)
+
+    async def scenario():
+        queue = EvaluationQueue(workers=1)
+        queue.track(failing())
+        queue.track(slow())
+        await queue.drain()
+        return queue.stats()
+
+    st = asyncio.run(scenario())
+    assert done == [True]
+    assert st["followup_errors"] == 1
@@ -0,0 +1,74 @@
+import json
+
+from Utils.handoff import build_team_inputs, dedupe, format_findings, merge_findings, parse_handoff
+
+
+def answer(findings, assessment="**Assessment:** ..."):
+    return json.dumps({"assessment": assessment, "findings": findings})
+
+
+SENIOR = {
+    "key_findings": ["BP 150/95", "Palpitations on exertion"],
+    "differentials": [{"diagnosis": "Hypertensive heart disease", "likelihood": "medium", "evidence": "BP 150/95"},
+                      {"diagnosis": "Panic disorder", "likelihood": "Low", "evidence": "night episodes"}],
+    "risk_level": "Medium",
+    "red_flags": [],
+    "recommendations": ["Echocardiogram", "24h Holter"],
+}
+NOVICE = {
+    "key_findings": ["bp 150/95.", "palpitations on exertion, worse at night"],
+    "differentials": [{"diagnosis": "Hypertensive Heart Disease", "likelihood": "High", "evidence": "LVH on echo"},
+                      {"diagnosis": "", "likelihood": "High", "evidence": "ignorado"}],
+    "risk_level": "high",
+    "red_flags": "Chest pain at rest",
+    "recommendations": ["echocardiogram"],
+}
+
+
+def test_parse_handoff_normalises_or_falls_back():
+    assessment, findings = parse_handoff("Texto antes\n" + answer(NOVICE, " Avaliação "))
+    assert assessment == "Avaliação"
+    assert findings["risk_level"] == "High"
+    assert findings["red_flags"] == ["Chest pain at rest"]
+    assert [d["diagnosis"] for d in findings["differentials"]] == ["Hypertensive Heart Disease"]
+    assert parse_handoff("resposta em texto livre") == ("resposta em texto livre", None)
+    assert parse_handoff('{"assessment": 1, "findings": {}}')[1] is None
+
+
+def test_dedupe_ignores_case_and_keeps_the_longer_item():
+    assert dedupe(["BP 150/95", "bp 150/95.", "Palpitations", "palpitations on exertion", ""]) == [
+        "BP 150/95", "palpitations on exertion"]
+
+
+def test_merge_findings_combines_senior_and_novice():
+    merged = merge_findings([parse_handoff(answer(SENIOR))[1], parse_handoff(answer(NOVICE))[1]])
+    assert merged["risk_level"] == "High"
+    top = merged["differentials"][0]
+    # O mesmo diagnóstico dos dois revisores: a maior probabilidade e as duas evidências
+    assert (top["diagnosis"], top["likelihood"], top["agreement"]) == ("Hypertensive heart disease", "High", 2)
+    assert top["evidence"] == "BP 150/95; LVH on echo"
+    assert merged["key_findings"] == ["BP 150/95", "palpitations on exertion, worse at night"]
+    assert merged["recommendations"] == ["Echocardiogram", "24h Holter"]
+    text = format_findings(merged)
+    assert "Hypertensive heart disease (High, both reviewers)" in text
+
+
+def test_team_inputs_use_findings_and_fall_back_to_full_answers(monkeypatch):
+    responses = {
+        "Senior_Cardiologist": "avaliação sénior " * 50,
+        "Novice_Cardiologist": "avaliação júnior " * 50,
+        "Senior_Psychologist": "resposta sem JSON",
+    }
+    findings = {"Senior_Cardiologist": parse_handoff(answer(SENIOR))[1],
+                "Novice_Cardiologist": parse_handoff(answer(NOVICE))[1]}
+    inputs, stats = build_team_inputs(responses, findings)
+    assert inputs["cardiologist_report"].startswith("Risk level: High")
+    assert inputs["psychologist_report"] == "resposta sem JSON"
+    assert inputs["pulmonologist_report"] == ""
+    assert stats["fallback_agents"] == ["Senior_Psychologist"]
+    assert stats["reduction"] > 1
+
+    monkeypatch.setenv("MDT_HANDOFF", "full")
+    inputs, stats = build_team_inputs(responses, findings)
+    assert inputs["cardiologist_report"] == responses["Senior_Cardiologist"] + responses["Novice_Cardiologist"]
+    assert stats["mode"] == "full" and stats["reduction"] == 1.0
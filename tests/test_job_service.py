@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from Utils.job_service import JobService, QueueFull, ServiceClosed
+
+
+def test_queue_full_then_drain(tmp_path):
+    async def scenario():
+        release = asyncio.Event()
+        started = asyncio.Event()
+
+        async def run(path, job):
+            started.set()
+            await release.wait()
+            return {"patient": path.stem}
+
+        service = JobService(run, tmp_path / "inbox", workers=1, queue_size=1)
+        service.start()
+        running = service.submit("relatório 1", "a.txt")
+        await started.wait()
+        queued = service.submit("relatório 2", "b.txt")
+        await asyncio.sleep(0)
+        # Um worker ocupado e um job à espera: o terceiro pedido é recusado (429)
+        with pytest.raises(QueueFull):
+            service.submit("relatório 3", "c.txt")
+        assert service.stats()["rejected"] == 1
+        assert service.stats()["queued"] == 1
+
+        drain = asyncio.create_task(service.drain())
+        await asyncio.sleep(0)
+        # A terminar: novos pedidos dão 503
+        with pytest.raises(ServiceClosed):
+            service.submit("relatório 4", "d.txt")
+        release.set()
+        await drain
+        return service, running, queued
+
+    service, running, queued = asyncio.run(scenario())
+    assert running.status == "done"
+    assert running.result == {"patient": "a"}
+    assert queued.status == "failed"
+    assert not running.path.parent.exists()
+    assert queued.path.exists()
+    st = service.stats()
+    assert (st["status"], st["completed"], st["failed"], st["queued"], st["running"]) == ("draining", 1, 1, 0, 0)
+
+
+def test_failed_run_is_reported(tmp_path):
+    async def scenario():
+        async def run(path, job):
+            raise RuntimeError("falhou")
+
+        service = JobService(run, tmp_path / "inbox", workers=1, queue_size=2)
+        service.start()
+        job = service.submit("relatório", "a.txt")
+        assert job.wait(0) is False
+        while not job.finished:
+            await asyncio.sleep(0.01)
+        await service.drain()
+        return service, job
+
+    service, job = asyncio.run(scenario())
+    assert job.status == "failed"
+    assert job.error == "RuntimeError: falhou"
+    assert service.stats()["failed"] == 1
@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "Benchmarks"))
+
+from import_time import FORBIDDEN, loaded, profile_once
+
+
+@pytest.mark.parametrize("backend", ["stub", "openai"])
+def test_import_main_skips_heavy_modules(backend):
+    modules = profile_once(backend, "Main")
+    assert "Main" in modules
+    assert [name for name in FORBIDDEN[backend] if loaded(modules, name)] == []
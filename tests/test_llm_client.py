@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+
+from Utils import llm_client
+from Utils.backends import OpenAICompatBackend
+from Utils.llm_client import connection_stats, get_async_http_pool, get_client, get_http_pool
+from Utils.stub_llm import StubResponder, serve
+
+
+@pytest.fixture
+def stub_server():
+    server = serve(port=0, responder=StubResponder(latency="0"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def test_one_client_per_key_and_loop():
+    sync_client = get_client("chave-a")
+    assert get_client("chave-a") is sync_client
+    assert get_client("chave-b") is not sync_client
+    assert get_client("chave-a", "http://127.0.0.1:1") is not sync_client
+
+    async def in_loop():
+        return get_client("chave-a"), get_client("chave-a")
+
+    first, again = asyncio.run(in_loop())
+    assert first is again and first is not sync_client
+    # O loop anterior fechou: o client dele é descartado e o próximo loop recebe um novo
+    second, _ = asyncio.run(in_loop())
+    assert second is not first
+    assert first not in [client for _, client in llm_client._clients.values()]
+
+
+def test_http_pools_are_shared_by_name():
+    assert get_http_pool("http://a") is get_http_pool("http://a")
+    assert get_http_pool("http://a") is not get_http_pool("http://b")
+
+    async def in_loop():
+        return get_async_http_pool("http://a"), get_async_http_pool("http://a")
+
+    first, again = asyncio.run(in_loop())
+    assert first is again
+
+
+def test_calls_reuse_pooled_connections(stub_server):
+    backend = OpenAICompatBackend("stub", base_url=stub_server)
+    before = connection_stats()
+    for _ in range(5):
+        assert backend.generate("Patient: Jane Doe\nChief Complaint: palpitations.")
+
+    async def calls():
+        return await asyncio.gather(*(backend.agenerate(f"pergunta {i}") for i in range(5)))
+
+    assert all(asyncio.run(calls()))
+    after = connection_stats()
+    requests = after["requests"] - before["requests"]
+    opened = after["connections_opened"] - before["connections_opened"]
+    assert requests == 10
+    assert opened < requests
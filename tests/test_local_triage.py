@@ -0,0 +1,73 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+from Utils.local_triage import (WEAK_EVIDENCE_CONFIDENCE, LocalTriage, fit_calibration, parse_weights,
+                                selection)
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+REPORT = """Patient: Jane Doe
+Chief Complaint: palpitations and chest pain on exertion.
+
+Medical History: hypertension. BP: 150/95. Denies wheezing. Occasional stress at work.
+"""
+
+
+def weights(result):
+    return {sp: v["weight"] for sp, v in result.triage.items()}
+
+
+def test_keywords_negation_and_chief_complaint():
+    result = LocalTriage(threshold=3).classify(REPORT)
+    # palpitação e dor torácica no motivo de consulta contam a dobrar; a TA elevada soma 2
+    assert result.raw_scores["Cardiology"] == 3 * 2 + 3 * 2 + 2 + 2
+    assert "BP 150/95" in result.triage["Cardiology"]["reasoning"]
+    # "Denies wheezing" não conta
+    assert result.raw_scores["Pulmonology"] == 0
+    assert result.raw_scores["Psychology"] == 1
+    assert weights(result) == {"Cardiology": 10, "Psychology": 1, "Pulmonology": 0}
+    assert json.loads(result.to_json()) == result.triage
+
+
+def test_confidence_rules():
+    engine = LocalTriage(threshold=3)
+    assert engine._confidence(0, []) == 1.0
+    assert engine._confidence(2, ["cough"]) == WEAK_EVIDENCE_CONFIDENCE
+    assert engine._confidence(3, ["cough"]) == pytest.approx(1 / 3)
+    assert engine._confidence(5, ["cough"]) == 1.0
+    # A decisão vale o que vale a especialidade mais incerta (aqui Psicologia, com "stress")
+    assert engine.classify(REPORT).confidence == WEAK_EVIDENCE_CONFIDENCE
+    assert engine.classify("Patient: John\nChief Complaint: ankle sprain.\n").confidence == 1.0
+
+
+def test_calibration_is_applied_and_fitted():
+    engine = LocalTriage(threshold=3, calibration={"Cardiology": [0.5, 1.0]})
+    assert engine._weight("Cardiology", 6) == 4
+    assert engine._weight("Cardiology", 100) == 10
+    assert engine._weight("Psychology", 6) == 6
+    fitted = fit_calibration([({"Cardiology": 0}, {"Cardiology": 1}), ({"Cardiology": 4}, {"Cardiology": 9})])
+    assert fitted == {"Cardiology": [2.0, 1.0]}
+
+
+def test_parse_weights_and_selection():
+    text = 'Triage:\n```json\n{"Cardiology": {"weight": 7}, "Psychology": {"weight": "2"}}\n```'
+    parsed = parse_weights(text)
+    assert parsed == {"Cardiology": 7, "Psychology": 2, "Pulmonology": None}
+    assert selection(parsed, 3) == {"Cardiology"}
+    assert parse_weights("sem JSON") is None
+
+
+def test_confidence_separates_agreement_on_history():
+    sys.path.insert(0, str(BASE_DIR / "Benchmarks"))
+    from triage_agreement import evaluate, load_history
+
+    history = load_history(BASE_DIR / "Results", BASE_DIR / "Medical Reports")
+    if not history:
+        pytest.skip("sem resultados históricos em Results/")
+    out = evaluate(LocalTriage(threshold=3), history, 0.5)
+    assert out["agreement_when_confident"] > out["exact_agreement"]
+    if out["agreement_when_not_confident"] is not None:
+        assert out["agreement_when_confident"] > out["agreement_when_not_confident"]
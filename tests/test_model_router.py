@@ -0,0 +1,61 @@
+import asyncio
+
+from Utils.model_router import ModelRouter
+
+
+def test_from_env_has_no_fallback_by_default(monkeypatch):
+    # Uma chave da OpenRouter no ambiente não chega para enviar relatórios para lá
+    monkeypatch.setenv("LLM_BACKEND", "gemini")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    router = ModelRouter.from_env()
+    assert router.primary_name == "gemini"
+    assert router.fallback_name is None
+    assert router.routing is True
+    assert router.routes == {}
+
+
+def test_from_env_explicit_fallback(monkeypatch):
+    monkeypatch.setenv("LLM_BACKEND", "gemini")
+    monkeypatch.setenv("FALLBACK_BACKEND", "openai")
+    assert ModelRouter.from_env().fallback_name == "openai"
+
+
+def test_from_env_off_invalid_or_same_backend_disable_fallback(monkeypatch):
+    for value in ("off", "", "bogus", "stub"):
+        monkeypatch.setenv("FALLBACK_BACKEND", value)
+        assert ModelRouter.from_env().fallback_name is None, value
+
+
+def test_from_env_breaker_defaults():
+    router = ModelRouter.from_env()
+    assert router.primary_name == "stub"
+    assert router.breaker_settings == {"window": 20, "min_calls": 5, "error_rate": 0.5,
+                                       "latency_p95": None, "cooldown": 30.0}
+
+
+def test_batch_judge_is_routed_as_judge(monkeypatch):
+    from Utils import Agents
+    from Utils.model_router import get_model_router
+
+    # Um override do juiz vale também para o juiz em lote, com fallback e disjuntor do router
+    monkeypatch.setenv("MODEL_ROUTES", "Judge=stub-judge-strong")
+    router = get_model_router()
+    roles = []
+    original_call, original_acall = router.call, router.acall
+
+    def call(role, *args, **kwargs):
+        roles.append(role)
+        return original_call(role, *args, **kwargs)
+
+    async def acall(role, *args, **kwargs):
+        roles.append(role)
+        return await original_acall(role, *args, **kwargs)
+
+    monkeypatch.setattr(router, "call", call)
+    monkeypatch.setattr(router, "acall", acall)
+
+    report = "Patient: Jane Doe\nChief Complaint: palpitations.\n"
+    Agents.evaluate_batch_with_gemini(report, {"NoviceCardiologist": "Resposta A."})
+    asyncio.run(Agents.aevaluate_batch_with_gemini(report, {"NoviceCardiologist": "Resposta B."}))
+    assert roles == ["Judge", "Judge"]
+    assert router.primary("Judge").model == "stub-judge-strong"
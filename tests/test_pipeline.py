@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+import Main
+from Utils import Agents
+from Utils.eval_queue import EvaluationQueue
+
+REPORT = """Patient: Jane Doe
+Chief Complaint: palpitations, wheezing and panic attacks at night.
+"""
+
+
+@pytest.fixture
+def report(tmp_path, monkeypatch):
+    monkeypatch.setattr(Main, "RESULTS_DIR", tmp_path / "Results")
+    (tmp_path / "Results").mkdir()
+    path = tmp_path / "Medical Report - Jane Doe.txt"
+    path.write_text(REPORT, encoding="utf-8")
+    return path
+
+
+def test_single_report_runs_on_stub(report):
+    payload = asyncio.run(Main.arun_single_report(report))
+    assert payload["patient_name"] == "Jane Doe"
+    assert payload["final_diagnosis"]
+    assert {"Triage", "Senior_Cardiologist"} <= set(payload["agents"])
+    assert payload["meta"]["metrics_status"] == "complete"
+
+
+def test_failed_specialist_cancels_siblings_and_their_judging(report, monkeypatch):
+    original = Agents.Agent.arun
+
+    async def arun(self, on_chunk=None):
+        if "Cardiologist" in self.role:
+            await asyncio.sleep(0.05)
+            raise RuntimeError("cardiologista falhou")
+        if "Pulmonologist" in self.role:
+            await asyncio.sleep(30)
+        return await original(self, on_chunk)
+
+    monkeypatch.setattr(Agents.Agent, "arun", arun)
+
+    async def scenario():
+        queue = EvaluationQueue(batch=False)
+        # O juiz só arranca depois da falha: a avaliação do psicólogo fica na fila
+        queue.workers = 1
+        started = time.perf_counter()
+        with pytest.raises(RuntimeError, match="cardiologista falhou"):
+            await Main.arun_single_report(report, queue)
+        elapsed = time.perf_counter() - started
+        leftover = [t for t in asyncio.all_tasks() if t is not asyncio.current_task() and not t.done()
+                    and t not in queue._worker_tasks]
+        await queue.close()
+        return elapsed, leftover, queue.stats()
+
+    elapsed, leftover, stats = asyncio.run(scenario())
+    assert elapsed < 5
+    assert leftover == []
+    assert stats["submitted"] == stats["completed"] + stats["dropped"]
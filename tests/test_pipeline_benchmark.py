@@ -0,0 +1,47 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+SCRIPT = BASE_DIR / "Benchmarks" / "pipeline_benchmark.py"
+
+sys.path.insert(0, str(BASE_DIR / "Benchmarks"))
+
+
+def bench(*args):
+    # Processo próprio: o benchmark configura o ambiente (backend stub, sem cache) ao ser importado
+    return subprocess.run([sys.executable, str(SCRIPT), "--time-scale", "0", "--concurrency", "4", *map(str, args)],
+                          cwd=BASE_DIR, capture_output=True, text=True, timeout=300)
+
+
+def test_percentile_is_nearest_rank(monkeypatch):
+    # O import define LLM_BACKEND/LLM_CACHE_DISABLED; o monkeypatch repõe-nos no fim do teste
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.setenv("LLM_CACHE_DISABLED", "1")
+    from pipeline_benchmark import percentile
+
+    values = [float(v) for v in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50.0, 95.0, 99.0)
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.0
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) is None
+
+
+def test_benchmark_runs_the_corpus_and_flags_regressions(tmp_path):
+    out = tmp_path / "run.json"
+    proc = bench("--scale", 1, "--out", out)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    result = json.loads(out.read_text(encoding="utf-8"))
+    reports = len(list((BASE_DIR / "Medical Reports").glob("*.txt")))
+    assert result["config"]["reports"] == reports
+    assert (result["results"]["ok"], result["results"]["failed"]) == (reports, 0)
+    assert result["results"]["llm_calls"] > 0 and result["results"]["cache_hits"] == 0
+
+    # Uma referência 10× mais rápida faz o --compare falhar
+    baseline = json.loads(out.read_text(encoding="utf-8"))
+    baseline["results"]["reports_per_second"] *= 10
+    (tmp_path / "baseline.json").write_text(json.dumps(baseline), encoding="utf-8")
+    proc = bench("--scale", 1, "--out", tmp_path / "again.json", "--compare", tmp_path / "baseline.json")
+    assert proc.returncode == 1
+    assert "regressão" in proc.stdout
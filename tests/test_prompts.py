@@ -0,0 +1,37 @@
+import pytest
+
+from Utils.prompts import CASE_CONTEXT, MDT_VARIABLES, ROLES, CompiledPrompt, PromptError, case_context, get_prompt
+
+
+def test_registry_compiles_every_role():
+    assert "MultidisciplinaryTeam" in ROLES and "Senior_Cardiologist" in ROLES
+    assert get_prompt("MultidisciplinaryTeam").variables == frozenset(MDT_VARIABLES)
+    with pytest.raises(PromptError, match="Role sem template"):
+        get_prompt("Dermatologist")
+
+
+def test_template_must_match_declared_variables():
+    with pytest.raises(PromptError, match="variáveis"):
+        CompiledPrompt("X", "Report: {medical_report} {extra}", ("medical_report",))
+    with pytest.raises(PromptError, match="inválido"):
+        CompiledPrompt("X", "Report: {medical_report", ("medical_report",))
+    with pytest.raises(PromptError, match="contexto"):
+        CompiledPrompt("X", "instruções", (), CASE_CONTEXT)
+
+
+def test_render_rejects_missing_or_unexpected_variables():
+    prompt = get_prompt("Senior_Cardiologist")
+    with pytest.raises(PromptError, match="em falta"):
+        prompt.render()
+    with pytest.raises(PromptError, match="inesperadas"):
+        prompt.render(medical_report="r", extra="x")
+
+
+def test_specialists_share_the_case_context_prefix():
+    report = "Patient: Jane Doe\nChief Complaint: palpitations {not a field}.\n"
+    prefix = case_context(report)
+    assert report in prefix
+    for role in ("Senior_Cardiologist", "Novice_Psychologist", "Triage_Balancer"):
+        context, instructions = get_prompt(role).render_parts(medical_report=report)
+        assert context == prefix
+        assert get_prompt(role).render(medical_report=report) == prefix + instructions
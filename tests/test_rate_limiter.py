@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import Main
+from Utils.rate_limiter import RateLimiter, SlotPool, TokenBucket, estimate_tokens, get_rate_limiter
+from Utils.stub_llm import get_stub_responder
+
+REPORT = """Patient: {name}
+Chief Complaint: palpitations and shortness of breath on exertion.
+"""
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60, period=60.0)
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    # Pedidos maiores do que o balde são limitados à capacidade para poderem ser servidos
+    assert TokenBucket(10).reserve(1000) == 0.0
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abc") == 1
+    assert estimate_tokens("x" * 400) == 100
+
+
+def test_threads_and_coroutines_share_the_in_flight_cap():
+    limiter = RateLimiter(max_in_flight=2, tpm=1_000_000)
+
+    def blocking_call():
+        with limiter.slot("prompt"):
+            time.sleep(0.02)
+
+    async def async_call():
+        async with limiter.aslot("prompt"):
+            await asyncio.sleep(0.02)
+
+    async def scenario():
+        threads = [threading.Thread(target=blocking_call) for _ in range(3)]
+        for t in threads:
+            t.start()
+        await asyncio.gather(*(async_call() for _ in range(5)))
+        for t in threads:
+            t.join()
+
+    asyncio.run(scenario())
+    st = limiter.snapshot()
+    assert st["requests"] == 8 and st["estimated_tokens"] == 8 * estimate_tokens("prompt")
+    assert st["peak_in_flight"] == 2
+    assert limiter.in_flight == 0
+
+
+def test_rpm_limit_spaces_calls():
+    limiter = RateLimiter(rpm=600)   # 10 pedidos/s depois de esgotar o balde
+    limiter.rpm_bucket.tokens = 0
+
+    async def scenario():
+        started = time.perf_counter()
+        for _ in range(3):
+            async with limiter.aslot("p"):
+                pass
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) >= 0.25
+    assert limiter.snapshot()["wait_seconds"] >= 0.25
+
+
+def test_batch_runs_reports_concurrently_under_one_limiter(tmp_path, monkeypatch):
+    monkeypatch.setattr(Main, "RESULTS_DIR", tmp_path / "Results")
+    (tmp_path / "Results").mkdir()
+    files = []
+    for name in ("Ana Silva", "Rui Costa", "Eva Lopes"):
+        path = tmp_path / f"Medical Report - {name}.txt"
+        path.write_text(REPORT.format(name=name), encoding="utf-8")
+        files.append(path)
+
+    default = get_rate_limiter()
+    stats = asyncio.run(Main.aprocess_all_reports(concurrency=3, max_in_flight=2, files=files))
+    assert sorted(st["source_file"] for st in stats) == sorted(p.name for p in files)
+    assert all(st["ok"] for st in stats)
+    # Chamadas dos agentes mais uma avaliação em lote do juiz por relatório
+    assert sum(st["llm_calls"] for st in stats) + len(files) == get_stub_responder().stats()["calls"]
+    # O limitador do batch é retirado no fim
+    assert get_rate_limiter() is default
+
+
+def test_slot_pool_hands_off_in_fifo_order():
+    pool = SlotPool(1)
+    order = []
+
+    async def waiter(name):
+        await pool.aacquire()
+        order.append(name)
+        await asyncio.sleep(0)
+        pool.release()
+
+    async def scenario():
+        await pool.aacquire()
+        tasks = [asyncio.create_task(waiter(name)) for name in "abcd"]
+        await asyncio.sleep(0)
+        # Um recém-chegado não passa à frente de quem já está à espera
+        late = asyncio.create_task(waiter("late"))
+        await asyncio.sleep(0)
+        pool.release()
+        await asyncio.gather(*tasks, late)
+
+    asyncio.run(scenario())
+    assert order == ["a", "b", "c", "d", "late"]
+    assert pool.available == 1 and not pool.waiters
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    pool = SlotPool(1)
+
+    async def scenario():
+        await pool.aacquire()
+        first = asyncio.create_task(pool.aacquire())
+        second = asyncio.create_task(pool.aacquire())
+        await asyncio.sleep(0)
+        pool.release()          # o lugar é entregue a first...
+        first.cancel()          # ...que é cancelado antes de acordar
+        await asyncio.wait_for(second, 1)
+        assert first.cancelled()
+        pool.release()
+
+    asyncio.run(scenario())
+    assert pool.available == 1 and not pool.waiters
+
+
+def test_threads_wait_on_a_pool_held_by_the_loop():
+    pool = SlotPool(1)
+    acquired = threading.Event()
+
+    def blocking():
+        pool.acquire()
+        acquired.set()
+        pool.release()
+
+    async def scenario():
+        await pool.aacquire()
+        thread = threading.Thread(target=blocking)
+        thread.start()
+        await asyncio.sleep(0.02)
+        assert not acquired.is_set()
+        pool.release()
+        await asyncio.to_thread(thread.join)
+
+    asyncio.run(scenario())
+    assert acquired.is_set() and pool.available == 1
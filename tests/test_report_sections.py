@@ -0,0 +1,94 @@
+from Utils.report_sections import NOTE_TOKENS, PreparedReport, parse_sections
+from Utils.rate_limiter import estimate_tokens
+
+REPORT = """Patient ID: 1234
+Name: Jane Doe
+Age: 54
+Chief Complaint: palpitations and shortness of breath on exertion.
+
+Medical History:
+Hypertension for ten years.
+Episodes of anxiety and poor sleep since divorce.
+Medications: amlodipine 5mg daily.
+
+Vital Signs:
+BP: 150/95, HR: 110, SpO2: 93%
+
+Physical Examination:
+Respiratory Exam: bilateral wheezing on expiration.
+Abdomen soft, non-tender.
+
+Imaging:
+Chest X-ray: hyperinflation, no consolidation.
+Echocardiogram: mild left ventricular hypertrophy.
+
+Lab Results:
+Troponin negative. TSH normal.
+
+Follow-up Notes:
+""" + "\n".join(f"Note {i}: routine follow-up visit without relevant findings." for i in range(40))
+
+
+def categories(entries):
+    return [(e.category, e.text.split(":")[0]) for e in entries]
+
+
+def test_parse_sections_tags_entries():
+    entries = parse_sections(REPORT)
+    cats = dict((text, cat) for cat, text in categories(entries))
+    assert cats["Name"] == "demographics"
+    assert cats["Chief Complaint"] == "complaint"
+    # "Medications:" dentro da história e a linha de sinais vitais mudam de categoria
+    assert cats["Medications"] == "medications"
+    assert cats["BP"] == "vitals"
+    assert cats["Chest X-ray"] == "imaging" and cats["Troponin negative. TSH normal."] == "labs"
+    assert cats["Respiratory Exam"] == "exam"
+    assert entries[-1].category == "other"
+
+
+def test_short_report_is_sent_whole_in_auto_mode():
+    report = PreparedReport("Patient: Jane Doe\nChief Complaint: cough.\n", budget=6000, mode="auto")
+    assert not report.extracting
+    assert report.for_role("Senior_Psychologist") == report.report
+    assert report.summary(["Senior_Psychologist"])["trimmed_tokens"] == 0
+
+
+def test_views_fit_the_budget_and_keep_specialty_entries():
+    budget = 150
+    report = PreparedReport(REPORT, budget=budget, mode="auto")
+    assert report.extracting
+    for role in ("Senior_Cardiologist", "Senior_Psychologist", "Senior_Pulmonologist", "Triage_Balancer"):
+        text = report.for_role(role)
+        assert estimate_tokens(text) <= budget
+        assert "Name: Jane Doe" in text and "Chief Complaint" in text
+        assert "omitted entries" in text
+
+    assert "BP: 150/95" in report.for_role("Novice_Cardiologist")
+    assert "wheezing" in report.for_role("Senior_Pulmonologist")
+    assert "anxiety" in report.for_role("Senior_Psychologist")
+    # Imagem não interessa à psicologia
+    assert "X-ray" not in report.for_role("Senior_Psychologist")
+
+
+def test_summary_sums_trimmed_tokens_over_calls():
+    report = PreparedReport(REPORT, budget=150, mode="always")
+    report.for_role("Senior_Cardiologist")
+    report.for_role("Judge")
+    summary = report.summary(["Senior_Cardiologist", "Novice_Cardiologist", "Judge"])
+    views = summary["views"]
+    assert set(views) == {"Cardiology", "Judge"}
+    assert summary["trimmed_tokens"] == 2 * views["Cardiology"]["trimmed_tokens"] + views["Judge"]["trimmed_tokens"]
+    assert views["Cardiology"]["sent_tokens"] <= 150
+    assert sum(views["Cardiology"]["omitted"].values()) > 0
+
+
+def test_off_mode_and_invalid_mode():
+    assert PreparedReport(REPORT, budget=10, mode="off").for_role("Senior_Cardiologist") == REPORT
+    assert PreparedReport(REPORT, budget=10, mode="bogus").mode == "auto"
+
+
+def test_oversized_essential_entry_is_cut():
+    report = "Name: Jane Doe\nChief Complaint: " + "chest pain " * 400
+    text = PreparedReport(report, budget=200, mode="auto").for_role("Senior_Cardiologist")
+    assert "[...]" in text
+    assert estimate_tokens(text) <= 200 + NOTE_TOKENS
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from Utils.backends import BackendError
+from Utils.rate_limiter import RateLimiter, set_rate_limiter
+from Utils.resilience import CallPolicy, CallTimeout, is_retryable
+from Utils.tracing import ReportTrace, span, use_trace
+
+KEY = ("stub", "Specialist")
+
+
+@pytest.fixture
+def limiter():
+    limiter = RateLimiter(max_in_flight=1)
+    previous = set_rate_limiter(limiter)
+    yield limiter
+    set_rate_limiter(previous)
+
+
+def hedging_policy(delay=0.05):
+    policy = CallPolicy(timeout=5, max_retries=0, hedge=True, hedge_min_samples=1, hedge_min_delay=delay)
+    policy.latency.observe(KEY, delay)
+    return policy
+
+
+def run_traced(coro_fn):
+    trace = ReportTrace("r")
+
+    async def scenario():
+        with use_trace(trace), span("Specialist", "specialist") as s:
+            result = await coro_fn()
+        return result, s
+
+    return asyncio.run(scenario())
+
+
+def test_retries_retryable_errors_with_backoff(limiter):
+    policy = CallPolicy(max_retries=2, backoff_base=0.001, backoff_max=0.001)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise BackendError("overloaded", 503)
+        return "ok"
+
+    result, s = run_traced(lambda: policy.acall(call, KEY))
+    assert result == "ok" and len(attempts) == 3 and s.retries == 2
+
+
+def test_client_errors_are_not_retried(limiter):
+    policy = CallPolicy(max_retries=3, backoff_base=0.001)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise BackendError("bad request", 400)
+
+    with pytest.raises(BackendError):
+        asyncio.run(policy.acall(call, KEY))
+    assert len(attempts) == 1
+    assert is_retryable(BackendError("x", 429)) and is_retryable(CallTimeout("x"))
+    assert not is_retryable(BackendError("x", 401))
+
+
+def test_deadline_cancels_slow_attempt(limiter):
+    policy = CallPolicy(timeout=0.05, max_retries=0)
+
+    async def call():
+        await asyncio.sleep(5)
+
+    with pytest.raises(CallTimeout):
+        asyncio.run(policy.acall(call, KEY))
+
+
+def test_slow_attempt_is_hedged_and_duplicate_wins(limiter):
+    limiter.semaphore = None
+    policy = hedging_policy()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(1 if len(calls) == 1 else 0)
+        return len(calls)
+
+    result, s = run_traced(lambda: policy.acall(call, KEY))
+    assert result == 2 and s.hedges == 1 and s.hedge_wins == 1
+
+
+def test_hedge_clock_starts_after_the_limiter_slot(limiter):
+    policy = hedging_policy()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def scenario():
+        # Outro pedido ocupa o único lugar bem mais tempo do que o atraso de hedging
+        async with limiter.aslot():
+            waiting = asyncio.ensure_future(policy.acall(call, KEY))
+            await asyncio.sleep(0.3)
+            assert calls == []
+        return await waiting
+
+    result, s = run_traced(scenario)
+    assert result == "ok"
+    assert calls == [1] and s.hedges == 0
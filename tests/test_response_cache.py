@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+from Utils.response_cache import ResponseCache, make_key
+
+
+def test_make_key_covers_role_prompt_model_and_config():
+    base = make_key("Cardiologist", "prompt", "gemini:flash", {"temperature": 0})
+    assert base == make_key("Cardiologist", "prompt", "gemini:flash", {"temperature": 0})
+    assert base != make_key("Psychologist", "prompt", "gemini:flash", {"temperature": 0})
+    assert base != make_key("Cardiologist", "prompt!", "gemini:flash", {"temperature": 0})
+    assert base != make_key("Cardiologist", "prompt", "gemini:pro", {"temperature": 0})
+    assert base != make_key("Cardiologist", "prompt", "gemini:flash", {"temperature": 1})
+    assert make_key("r", "p", "m") == make_key("r", "p", "m", {})
+
+
+def test_get_put_and_bypass(tmp_path):
+    cache = ResponseCache(path=tmp_path / "c.sqlite3")
+    assert cache.get("k") is None
+    cache.put("k", "resposta", role="r", model="m")
+    assert cache.get("k") == "resposta"
+    cache.bypass = True
+    assert cache.get("k") is None
+    st = cache.stats()
+    assert (st["hits"], st["misses"], st["writes"], st["entries"]) == (1, 1, 1, 1)
+
+
+def test_lru_eviction_keeps_running_total(tmp_path):
+    cache = ResponseCache(path=tmp_path / "c.sqlite3", max_bytes=25)
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 10)
+    cache.get("a")
+    cache.put("c", "x" * 10)
+    # "b" é o menos usado recentemente
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.total_bytes == cache._sum_sizes() == 20
+    cache.put("a", "x" * 5)
+    assert cache.total_bytes == cache._sum_sizes() == 15
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    cache = ResponseCache(path=tmp_path / "c.sqlite3", max_age_seconds=60)
+    cache.put("k", "v")
+    cache.conn.execute("UPDATE responses SET created = created - 120")
+    assert cache.get("k") is None
+
+
+def test_async_access_runs_off_the_event_loop(tmp_path):
+    cache = ResponseCache(path=tmp_path / "c.sqlite3")
+    threads = []
+    original = cache.get
+
+    def get(key):
+        threads.append(threading.current_thread())
+        return original(key)
+
+    cache.get = get
+
+    async def scenario():
+        await cache.aput("k", "v", role="r", model="m")
+        return await cache.aget("k"), threading.current_thread()
+
+    value, loop_thread = asyncio.run(scenario())
+    assert value == "v"
+    assert threads and threads[0] is not loop_thread
@@ -0,0 +1,74 @@
+import json
+
+from Utils.result_store import ResultStore, run_id
+
+
+def payload(patient="Jane Doe", ts="20260101-120000", source="Medical Report - Jane Doe.txt", **meta):
+    return {
+        "patient_name": patient,
+        "timestamp": ts,
+        "agents": {"MultidisciplinaryTeam": "diagnóstico"},
+        "metrics": {},
+        "meta": {"source_file": source, "source_hash": "abc", "model": "stub", "prompt_version": "v1",
+                 "backend": "stub", "metrics_status": "pending", **meta},
+    }
+
+
+def test_add_returns_row_id_and_runs_reads_index_columns(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    first = store.add(payload(), "sig-1")
+    second = store.add(payload(patient="John Roe", ts="20260102-090000"), "sig-1")
+    assert second == first + 1
+
+    runs = store.runs()
+    assert [r["patient"] for r in runs] == ["John Roe", "Jane Doe"]
+    assert runs[1]["id"] == first
+    assert runs[1]["run_id"] == run_id(payload())
+    assert runs[1]["model_signature"] == "sig-1"
+    assert runs[1]["metrics_status"] == "pending"
+    store.close()
+
+
+def test_query_filters(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.add(payload(ts="20260101-120000"))
+    store.add(payload(ts="20260103-080000"))
+    store.add(payload(patient="John Roe", ts="20260102-090000", model="other"))
+
+    assert len(store.runs(patient="Jane Doe")) == 2
+    assert [r["timestamp"] for r in store.runs(since="2026-01-02")] == ["20260103-080000", "20260102-090000"]
+    assert [r["patient"] for r in store.runs(until="2026-01-01")] == ["Jane Doe"]
+    assert [r["patient"] for r in store.runs(model="other")] == ["John Roe"]
+    assert store.latest(patient="Jane Doe")["timestamp"] == "20260103-080000"
+    assert store.get(run_id(payload(patient="John Roe", ts="20260102-090000")))["meta"]["model"] == "other"
+    store.close()
+
+
+def test_update_by_row_id_keeps_same_second_runs_apart(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    # Dois runs do mesmo paciente no mesmo segundo partilham o run_id
+    first = store.add(payload())
+    second = store.add(payload())
+
+    done = payload(metrics_status="done")
+    done["metrics"] = {"MultidisciplinaryTeam": {"score": 80, "rating": "good"}}
+    store.update(done, first)
+
+    rows = {r["id"]: r for r in store.runs()}
+    assert rows[first]["metrics_status"] == "done"
+    assert rows[second]["metrics_status"] == "pending"
+    stored = [json.loads(p) for (p,) in store.conn.execute("SELECT payload FROM results ORDER BY id")]
+    assert stored[0]["metrics"]["MultidisciplinaryTeam"]["score"] == 80
+    assert stored[1]["metrics"] == {}
+    store.close()
+
+
+def test_update_without_row_id_targets_latest_run(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    first = store.add(payload())
+    second = store.add(payload())
+    store.update(payload(metrics_status="done"))
+
+    rows = {r["id"]: r["metrics_status"] for r in store.runs()}
+    assert rows == {first: "pending", second: "done"}
+    store.close()
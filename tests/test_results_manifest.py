@@ -0,0 +1,44 @@
+import asyncio
+
+import Main
+from Utils.results_manifest import ResultsManifest, file_hash
+
+REPORT = """Patient: Jane Doe
+Chief Complaint: palpitations and shortness of breath.
+"""
+
+
+def test_record_reload_and_is_current(tmp_path):
+    manifest = ResultsManifest(tmp_path / "manifest.json")
+    digest = file_hash(REPORT.encode("utf-8"))
+    manifest.record("a.txt", digest, "v1", "stub", "a.json", "a.txt", "20260101")
+    # O resultado ainda não existe em disco
+    assert not manifest.is_current("a.txt", digest, "v1", "stub")
+
+    (tmp_path / "a.json").write_text("{}", encoding="utf-8")
+    reloaded = ResultsManifest(tmp_path / "manifest.json")
+    assert reloaded.is_current("a.txt", digest, "v1", "stub")
+    assert not reloaded.is_current("a.txt", digest, "v2", "stub")
+    assert not reloaded.is_current("a.txt", digest, "v1", "gemini")
+    assert not reloaded.is_current("a.txt", "outro", "v1", "stub")
+    assert not reloaded.is_current("b.txt", digest, "v1", "stub")
+    assert not (tmp_path / "manifest.json.tmp").exists()
+
+
+def test_unreadable_manifest_starts_empty(tmp_path):
+    (tmp_path / "manifest.json").write_text("{corrompido", encoding="utf-8")
+    assert ResultsManifest(tmp_path / "manifest.json").entries == {}
+
+
+def test_batch_skips_unchanged_reports(tmp_path, monkeypatch):
+    monkeypatch.setattr(Main, "RESULTS_DIR", tmp_path / "Results")
+    (tmp_path / "Results").mkdir()
+    path = tmp_path / "Medical Report - Jane Doe.txt"
+    path.write_text(REPORT, encoding="utf-8")
+
+    assert Main.split_pending([path]) == ([path], [])
+    asyncio.run(Main.arun_single_report(path))
+    assert Main.split_pending([path]) == ([], [path])
+
+    path.write_text(REPORT + "History: asthma.\n", encoding="utf-8")
+    assert Main.split_pending([path]) == ([path], [])
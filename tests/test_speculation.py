@@ -0,0 +1,51 @@
+import asyncio
+
+import Main
+from Utils.speculation import SPECIALTIES, SpeculationPolicy
+
+REPORT = """Patient: Jane Doe
+Chief Complaint: palpitations and chest pain on exertion.
+"""
+
+
+def test_modes():
+    assert SpeculationPolicy("off").choose() == []
+    assert SpeculationPolicy("latency").choose() == list(SPECIALTIES)
+    assert SpeculationPolicy("bogus").mode == "off"
+
+
+def test_cost_mode_follows_selection_rates():
+    policy = SpeculationPolicy("cost", min_rate=0.5)
+    # Sem histórico especula tudo
+    assert policy.choose() == list(SPECIALTIES)
+    policy.observe(["Cardiology", "Psychology"])
+    policy.observe(["Cardiology"])
+    policy.observe(["Cardiology", "Pulmonology"])
+    assert policy.choose() == ["Cardiology"]
+    assert policy.stats()["selection_rates"]["Cardiology"] == 1.0
+
+
+def test_stats_count_waste():
+    policy = SpeculationPolicy("latency")
+    policy.record(launched=4, used=1, cancelled=2, discarded=1)
+    st = policy.stats()
+    assert (st["used"], st["wasted"], st["waste_ratio"]) == (1, 3, 0.75)
+
+
+def test_speculative_seniors_are_reused_or_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(Main, "RESULTS_DIR", tmp_path / "Results")
+    (tmp_path / "Results").mkdir()
+    policy = SpeculationPolicy("latency")
+    monkeypatch.setattr(Main, "speculation", policy)
+    path = tmp_path / "Medical Report - Jane Doe.txt"
+    path.write_text(REPORT, encoding="utf-8")
+
+    payload = asyncio.run(Main.arun_single_report(path))
+    spec = payload["meta"]["speculation"]
+    assert len(spec["used"]) + len(spec["wasted"]) == len(SPECIALTIES)
+    assert "Senior_Cardiologist" in spec["used"]
+    # As respostas especulativas usadas entram no resultado; as outras não
+    assert set(spec["used"]) <= set(payload["agents"])
+    assert not set(spec["wasted"]) & set(payload["agents"])
+    st = policy.stats()
+    assert (st["launched"], st["used"]) == (len(SPECIALTIES), len(spec["used"]))
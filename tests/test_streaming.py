@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import pytest
+
+import Main
+from Utils.progress_writer import ProgressWriter
+
+REPORT = "Patient: Jane Doe\nChief Complaint: palpitations.\n"
+
+
+def events(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_progress_writer_events_and_cleanup(tmp_path):
+    path = tmp_path / "a.stream.jsonl"
+    writer = ProgressWriter(path)
+    writer.chunk("Senior_Cardiologist", "Olá ")
+    writer.done("Senior_Cardiologist", {"ttft_seconds": 0.1, "total_seconds": 0.2})
+    rows = events(path)
+    assert [r["event"] for r in rows] == ["chunk", "done"]
+    assert rows[0]["text"] == "Olá " and rows[1]["ttft_seconds"] == 0.1
+    writer.close()
+    assert not path.exists()
+    # Depois de fechado não escreve nada
+    writer.chunk("Senior_Cardiologist", "tarde")
+
+
+def test_failed_report_keeps_partial_file(tmp_path):
+    path = tmp_path / "a.stream.jsonl"
+    writer = ProgressWriter(path)
+    writer.chunk("Triage_Balancer", "{")
+    writer.close(success=False)
+    assert events(path)[0]["text"] == "{"
+
+
+@pytest.fixture
+def report(tmp_path, monkeypatch):
+    monkeypatch.setattr(Main, "RESULTS_DIR", tmp_path / "Results")
+    monkeypatch.setattr(Main, "streaming", True)
+    (tmp_path / "Results").mkdir()
+    path = tmp_path / "Medical Report - Jane Doe.txt"
+    path.write_text(REPORT, encoding="utf-8")
+    return path
+
+
+def test_streaming_run_records_ttft_and_chunks(report, monkeypatch):
+    monkeypatch.setenv("STREAM_KEEP_PARTIAL", "1")
+    payload = asyncio.run(Main.arun_single_report(report))
+    timings = payload["meta"]["timings"]
+    assert {"Triage_Balancer", "MultidisciplinaryTeam"} <= set(timings)
+    assert all(0 <= t["ttft_seconds"] <= t["total_seconds"] for t in timings.values())
+
+    [stream] = (report.parent / "Results").glob("*.stream.jsonl")
+    rows = events(stream)
+    done = {r["role"] for r in rows if r["event"] == "done"}
+    assert done == set(timings)
+    text = "".join(r["text"] for r in rows if r["event"] == "chunk" and r["role"] == "MultidisciplinaryTeam")
+    assert text.strip() and text.strip() in payload["final_diagnosis"]
+
+
+def test_stream_file_is_removed_after_success(report):
+    asyncio.run(Main.arun_single_report(report))
+    assert list((report.parent / "Results").glob("*.stream.jsonl")) == []
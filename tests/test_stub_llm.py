@@ -0,0 +1,73 @@
+import asyncio
+import random
+import threading
+
+import pytest
+
+from Utils.Agents import Agent
+from Utils.backends import GeminiBackend, OpenAICompatBackend
+from Utils.prompts import get_prompt
+from Utils.stub_llm import StubError, StubResponder, classify_prompt, parse_latency, serve
+
+REPORT = "Patient: Jane Doe\nChief Complaint: palpitations.\n"
+
+
+def test_parse_latency():
+    rng = random.Random(0)
+    assert parse_latency("0.5")(rng) == 0.5
+    assert parse_latency("fixed:2")(rng) == 2.0
+    assert 1.0 <= parse_latency("uniform:1,2")(rng) <= 2.0
+    assert parse_latency("normal:1,5")(rng) >= 0.0
+    assert parse_latency("")(rng) == 0.0
+    for bad in ("gamma:1,2", "uniform:1", "lognormal:a,b", "-1"):
+        with pytest.raises(ValueError):
+            parse_latency(bad)
+
+
+def test_classify_prompt_recognises_every_role():
+    for role in ("Triage_Balancer", "Senior_Cardiologist", "Novice_Psychologist"):
+        assert classify_prompt(get_prompt(role).render(medical_report=REPORT)) == role
+
+
+def test_answers_are_deterministic_per_attempt():
+    first, second = StubResponder(latency="0"), StubResponder(latency="0")
+    prompt = get_prompt("Senior_Cardiologist").render(medical_report=REPORT)
+    answer = first.plan(prompt)
+    assert second.plan(prompt) == answer
+    # Uma repetição do mesmo prompt é uma nova tentativa, com outro sorteio
+    assert first.plan(prompt)[2] != answer[2]
+    assert first.stats()["calls"] == 2
+
+
+def test_error_rate_simulates_429_and_503():
+    responder = StubResponder(latency="0", error_rate=1.0, share_429=0.5)
+    statuses = {responder.plan(f"pedido {i}")[1].status for i in range(40)}
+    assert statuses == {429, 503}
+    assert responder.stats()["errors"] == 40
+    assert isinstance(responder.plan("x")[1], StubError)
+
+
+@pytest.fixture
+def server():
+    responder = StubResponder(latency="0")
+    httpd = serve(port=0, responder=responder)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", responder
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_http_server_speaks_openai_and_gemini(server):
+    url, responder = server
+    openai = OpenAICompatBackend("stub", base_url=f"{url}/v1")
+    gemini = GeminiBackend("gemini-2.5-flash", api_key="teste", base_url=url)
+    prompt = get_prompt("Senior_Cardiologist").render(medical_report=REPORT)
+    assert openai.generate(prompt)
+    assert asyncio.run(gemini.agenerate(prompt))
+    assert responder.stats()["calls"] == 2
+
+
+def test_agents_run_on_the_stub_backend():
+    answer = asyncio.run(Agent(REPORT, "Senior_Cardiologist").arun())
+    assert answer and Agent(REPORT, "Senior_Cardiologist").backend.name == "stub"
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+from Utils.tracing import (MetricsRegistry, ReportTrace, Span, estimate_cost, mark_cached, record_call_event,
+                           record_usage, span, use_trace)
+
+
+def test_estimate_cost():
+    assert estimate_cost("gemini-2.5-flash", 1_000_000, 0) == 0.30
+    # Tokens em cache pagam o preço reduzido; sufixos de versão usam o preço do modelo base
+    assert estimate_cost("gemini-2.5-flash-001", 1_000_000, 1_000_000, 1_000_000) == pytest.approx(0.075 + 2.50)
+    assert estimate_cost("stub:stub", 10, 10) == 0.0
+    assert estimate_cost("openai:x/model:free", 10, 10) == 0.0
+    assert estimate_cost("modelo-desconhecido", 10, 10) is None
+
+
+def test_spans_join_the_active_trace_and_file(tmp_path):
+    trace = ReportTrace("Jane Doe", tmp_path / "traces.jsonl")
+
+    async def agent(name):
+        with span(name, "specialist", role=name, model="gemini-2.5-flash"):
+            await asyncio.sleep(0)
+            record_usage(1000, 200, 400)
+            record_call_event("retries")
+
+    async def scenario():
+        with use_trace(trace):
+            await asyncio.gather(agent("Senior_Cardiologist"), agent("Senior_Psychologist"))
+            with span("Judge:batch", "judge", role="batch", model="gemini-2.0-flash"):
+                mark_cached()
+            with pytest.raises(ValueError):
+                with span("write", "write"):
+                    raise ValueError("disco cheio")
+
+    asyncio.run(scenario())
+    out = trace.to_dict()
+    totals = out["totals"]
+    # A resposta da cache não conta como chamada nem como custo
+    assert totals["llm_calls"] == 2
+    assert (totals["prompt_tokens"], totals["output_tokens"], totals["cached_tokens"]) == (2000, 400, 800)
+    assert totals["cost_usd"] == pytest.approx(2 * estimate_cost("gemini-2.5-flash", 1000, 200, 400))
+    assert totals["resilience"]["retries"] == 2
+    assert totals["by_kind"]["write"]["count"] == 1
+    assert [s["error"] for s in out["spans"] if s["kind"] == "write"] == ["ValueError: disco cheio"]
+    lines = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert len(lines) == 4 and {line["report"] for line in lines} == {"Jane Doe"}
+
+
+def test_registry_totals_and_prometheus_text():
+    registry = MetricsRegistry()
+    registry.observe(Span("a", "specialist", role="Senior_Cardiologist", model="m", wall_seconds=0.2,
+                          prompt_tokens=10, output_tokens=5, cost_usd=0.001, retries=1))
+    registry.observe(Span("b", "specialist", role="Senior_Cardiologist", model="m", cached=True))
+    registry.observe(Span("c", "triage", role="Triage_Balancer", model="local"))
+    totals = registry.totals()
+    assert (totals["llm_calls"], totals["cache_hits"], totals["prompt_tokens"], totals["retries"]) == (1, 1, 10, 1)
+
+    text = registry.prometheus_text()
+    assert 'mdt_llm_calls_total{kind="specialist",role="Senior_Cardiologist",model="m",cached="false"} 1' in text
+    assert 'mdt_llm_calls_total{kind="specialist",role="Senior_Cardiologist",model="m",cached="true"} 1' in text
+    # A triagem local não é uma chamada LLM, mas o tempo entra no histograma
+    assert 'kind="triage"' not in "\n".join(line for line in text.splitlines() if line.startswith("mdt_llm_calls"))
+    assert 'mdt_span_seconds_count{kind="triage"} 1' in text
+    assert 'mdt_span_seconds_bucket{kind="specialist",le="+Inf"} 2' in text
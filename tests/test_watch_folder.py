@@ -0,0 +1,110 @@
+import asyncio
+import os
+
+import pytest
+
+from Utils.watch_folder import FolderWatcher
+
+
+def inotify_available(tmp_path) -> bool:
+    async def probe():
+        watcher = FolderWatcher(tmp_path, mode="inotify")
+        try:
+            watcher._start()
+            return True
+        except OSError:
+            return False
+        finally:
+            watcher._stop()
+    return asyncio.run(probe())
+
+
+@pytest.fixture(params=["poll", "inotify"])
+def mode(request, tmp_path):
+    if request.param == "inotify" and not inotify_available(tmp_path):
+        pytest.skip("inotify indisponível")
+    return request.param
+
+
+async def collect(watcher, seen, until):
+    async for path in watcher.ready():
+        seen.append((path.name, path.read_text(encoding="utf-8")))
+        if len(seen) >= until:
+            watcher.close()
+
+
+def test_slow_write_is_delivered_once_after_it_settles(tmp_path, mode):
+    (tmp_path / "old.txt").write_text("já existia", encoding="utf-8")
+    watcher = FolderWatcher(tmp_path, mode=mode, settle=0.2, poll_interval=0.05)
+    seen = []
+
+    async def writer():
+        await asyncio.sleep(0.1)
+        (tmp_path / ".hidden.txt").write_text("x", encoding="utf-8")
+        (tmp_path / "copy.txt.part").write_text("x", encoding="utf-8")
+        (tmp_path / "notes.md").write_text("x", encoding="utf-8")
+        (tmp_path / "empty.txt").write_text("", encoding="utf-8")
+        with open(tmp_path / "new.txt", "w", encoding="utf-8") as f:
+            for i in range(6):
+                f.write(f"linha {i}\n")
+                f.flush()
+                await asyncio.sleep(0.06)
+
+    async def scenario():
+        task = asyncio.create_task(collect(watcher, seen, until=2))
+        await writer()
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(scenario())
+    assert watcher.mode == mode
+    assert seen[0] == ("old.txt", "já existia")
+    # Entregue uma só vez e já completo; ocultos, temporários, outros padrões e vazios ficam de fora
+    assert seen[1] == ("new.txt", "".join(f"linha {i}\n" for i in range(6)))
+
+
+def test_changed_file_is_delivered_again_unchanged_is_not(tmp_path, mode):
+    path = tmp_path / "report.txt"
+    path.write_text("versão 1", encoding="utf-8")
+    watcher = FolderWatcher(tmp_path, mode=mode, settle=0.1, poll_interval=0.05)
+    seen = []
+
+    async def scenario():
+        task = asyncio.create_task(collect(watcher, seen, until=2))
+        await asyncio.sleep(0.3)
+        stat = path.stat()
+        # Mesmo conteúdo e mtime: não é um relatório novo
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        await asyncio.sleep(0.3)
+        path.write_text("versão 2 (alterada)", encoding="utf-8")
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(scenario())
+    assert seen == [("report.txt", "versão 1"), ("report.txt", "versão 2 (alterada)")]
+
+
+def test_inotify_waits_for_the_writer_to_close(tmp_path):
+    if not inotify_available(tmp_path):
+        pytest.skip("inotify indisponível")
+    watcher = FolderWatcher(tmp_path, mode="inotify", settle=0.1, stale_after=5)
+    seen = []
+
+    async def scenario():
+        task = asyncio.create_task(collect(watcher, seen, until=1))
+        await asyncio.sleep(0.05)
+        f = open(tmp_path / "report.txt", "w", encoding="utf-8")
+        f.write("primeira parte\n")
+        f.flush()
+        # Parado mas ainda aberto para escrita: não está pronto
+        await asyncio.sleep(0.4)
+        assert seen == []
+        f.write("segunda parte\n")
+        f.close()
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(scenario())
+    assert seen == [("report.txt", "primeira parte\nsegunda parte\n")]
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        FolderWatcher(".", mode="fsevents")